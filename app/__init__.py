@@ -4,6 +4,18 @@ def create_app():
     """Cria e configura uma instância do aplicativo Flask."""
     app = Flask(__name__)
 
+    # Mede tempo, consultas e serialização de cada requisição (/api/metrics)
+    from . import metrics
+    metrics.init_app(app)
+
+    # Perfis de CPU sob demanda (X-Profile ou amostragem)
+    from . import profiling
+    profiling.init_app(app)
+
+    # Compressão das respostas (gzip/br/zstd), negociada pelo Accept-Encoding
+    from . import compression
+    compression.init_app(app)
+
     # Registra o Blueprint que contém as rotas da API
     from .routes import api
     app.register_blueprint(api, url_prefix='/api')
@@ -0,0 +1,32 @@
+"""
+Autorização dos endpoints administrativos.
+
+Eles só respondem quando `ADMIN_TOKEN` está definido e a requisição traz
+`Authorization: Bearer <ADMIN_TOKEN>`; sem a variável, ficam desligados.
+"""
+import functools
+import hmac
+import os
+
+from flask import jsonify, request
+
+
+def is_admin():
+    """Indica se a requisição atual tem o token de administrador."""
+    token = os.getenv('ADMIN_TOKEN')
+    if not token:
+        return False
+    esquema, _, valor = request.headers.get('Authorization', '').partition(' ')
+    return esquema.lower() == 'bearer' and hmac.compare_digest(valor.strip().encode(), token.encode())
+
+
+def admin_required(view):
+    """Decorador: 403 para quem não é administrador."""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if not os.getenv('ADMIN_TOKEN'):
+            return jsonify({"error": "Endpoints administrativos desligados (defina ADMIN_TOKEN)"}), 403
+        if not is_admin():
+            return jsonify({"error": "Acesso restrito a administradores"}), 403
+        return view(*args, **kwargs)
+    return wrapper
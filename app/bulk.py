@@ -0,0 +1,212 @@
+import json
+import math
+import os
+from datetime import datetime
+
+from flask import request
+from psycopg2.extras import execute_values
+
+from .errors import InvalidRequestBody
+from .resources import CLIENTES, ENTREGAS
+from .streaming import NDJSON
+
+
+def _max_linhas():
+    return int(os.getenv('API_BULK_MAX_ROWS', '50000'))
+
+
+def _page_size():
+    return int(os.getenv('API_BULK_PAGE_SIZE', '1000'))
+
+
+# --- Conversores: recebem o valor do JSON e levantam ValueError se inválido ---
+
+def _texto(valor):
+    if not isinstance(valor, str):
+        raise ValueError('deve ser texto')
+    return valor
+
+
+def _inteiro(valor):
+    if isinstance(valor, bool) or not isinstance(valor, (int, str)):
+        raise ValueError('deve ser inteiro')
+    try:
+        return int(valor)
+    except ValueError:
+        raise ValueError('deve ser inteiro') from None
+
+
+def _numero(valor):
+    if isinstance(valor, bool) or not isinstance(valor, (int, float, str)):
+        raise ValueError('deve ser numérico')
+    try:
+        numero = float(valor)
+    except ValueError:
+        raise ValueError('deve ser numérico') from None
+    if not math.isfinite(numero):
+        raise ValueError('deve ser numérico')
+    return numero
+
+
+def _data_hora(valor):
+    try:
+        return datetime.fromisoformat(_texto(valor))
+    except ValueError:
+        raise ValueError('deve ser data/hora ISO 8601') from None
+
+
+class Campo:
+    """
+    Uma coluna aceita na carga em lote: nome, conversor, se é obrigatória,
+    valor padrão e, para chaves estrangeiras, a tabela e a coluna
+    referenciadas (conferidas antes do INSERT, para que o erro saia por
+    linha e não derrube a transação inteira).
+    """
+
+    def __init__(self, nome, conversor=_texto, obrigatorio=False, padrao=None, referencia=None):
+        self.nome = nome
+        self.conversor = conversor
+        self.obrigatorio = obrigatorio
+        self.padrao = padrao
+        self.referencia = referencia
+
+
+# Conversor de cada tipo do PostgreSQL das colunas (`resources.Coluna`).
+_CONVERSORES = {
+    'varchar': _texto,
+    'text': _texto,
+    'integer': _inteiro,
+    'numeric': _numero,
+    'timestamp': _data_hora,
+}
+
+
+def fields_for(recurso):
+    """Os campos da carga em lote de `recurso`: as mesmas colunas do POST unitário."""
+    return [
+        Campo(coluna.nome, _CONVERSORES[coluna.tipo], coluna.obrigatoria, coluna.padrao, coluna.referencia)
+        for coluna in recurso.gravaveis
+    ]
+
+
+CAMPOS_CLIENTES = fields_for(CLIENTES)
+
+CAMPOS_ENTREGAS = fields_for(ENTREGAS)
+
+
+def read_rows():
+    """
+    Lê o corpo da requisição como lista JSON ou, com `Content-Type:
+    application/x-ndjson`, como um objeto JSON por linha (linhas em branco
+    são ignoradas).
+
+    Retorna `(linhas, erros)`: linhas que não são JSON válido ficam como
+    None em `linhas` e com a mensagem em `erros[indice]`.
+    """
+    limite = _max_linhas()
+    linhas, erros = [], {}
+    if request.mimetype == NDJSON:
+        for texto in request.stream:
+            if not texto.strip():
+                continue
+            if len(linhas) >= limite:
+                raise InvalidRequestBody(f"no máximo {limite} linhas por requisição")
+            try:
+                linhas.append(json.loads(texto))
+            except ValueError:
+                erros[len(linhas)] = ['JSON inválido']
+                linhas.append(None)
+        return linhas, erros
+
+    corpo = request.get_json(silent=True)
+    if not isinstance(corpo, list):
+        raise InvalidRequestBody("o corpo deve ser uma lista JSON ou NDJSON")
+    if len(corpo) > limite:
+        raise InvalidRequestBody(f"no máximo {limite} linhas por requisição")
+    return corpo, erros
+
+
+def validate_rows(linhas, campos, erros=None):
+    """
+    Converte cada linha (dicionário) numa tupla com os valores de `campos`,
+    na mesma ordem. Retorna `(valores, erros)`: `valores[i]` é None quando a
+    linha `i` tem erros, e `erros` mapeia o índice para a lista de mensagens.
+    """
+    erros = dict(erros or {})
+    valores = []
+    for indice, linha in enumerate(linhas):
+        if indice in erros:
+            valores.append(None)
+            continue
+        if not isinstance(linha, dict):
+            erros[indice] = ['deve ser um objeto JSON']
+            valores.append(None)
+            continue
+        mensagens, tupla = [], []
+        for campo in campos:
+            valor = linha.get(campo.nome)
+            if valor is None:
+                if campo.obrigatorio:
+                    mensagens.append(f'{campo.nome}: obrigatório')
+                tupla.append(campo.padrao)
+                continue
+            try:
+                tupla.append(campo.conversor(valor))
+            except ValueError as e:
+                mensagens.append(f'{campo.nome}: {e}')
+                tupla.append(None)
+        if mensagens:
+            erros[indice] = mensagens
+            valores.append(None)
+        else:
+            valores.append(tuple(tupla))
+    return valores, erros
+
+
+def check_references(cur, campos, valores, erros):
+    """
+    Confere as chaves estrangeiras de `campos` com uma consulta `= ANY` por
+    tabela referenciada; linhas que apontam para ids inexistentes passam a
+    ter erro (e `valores[i]` vira None). Altera `valores` e `erros`.
+    """
+    for posicao, campo in enumerate(campos):
+        if not campo.referencia:
+            continue
+        tabela, coluna = campo.referencia
+        ids = sorted({v[posicao] for v in valores if v is not None and v[posicao] is not None})
+        if not ids:
+            continue
+        cur.execute(f'SELECT {coluna} FROM cadeiraextensao.{tabela} WHERE {coluna} = ANY(%s);', (ids,))
+        existentes = {linha[0] for linha in cur.fetchall()}
+        for indice, v in enumerate(valores):
+            if v is not None and v[posicao] is not None and v[posicao] not in existentes:
+                erros.setdefault(indice, []).append(f'{campo.nome}: {v[posicao]} não existe')
+                valores[indice] = None
+
+
+def insert_rows(cur, tabela, chave, campos, valores):
+    """
+    Insere as linhas válidas de `valores` com `execute_values` (em páginas
+    de `API_BULK_PAGE_SIZE`) e devolve a lista de ids gerados alinhada com
+    `valores` (None nas posições inválidas). Não faz commit.
+    """
+    validas = [v for v in valores if v is not None]
+    if not validas:
+        return [None] * len(valores)
+    colunas = ', '.join(campo.nome for campo in campos)
+    # O PostgreSQL devolve o RETURNING de um INSERT ... VALUES na ordem das
+    # tuplas, e `execute_values` concatena as páginas na ordem de envio.
+    gerados = execute_values(
+        cur,
+        f'INSERT INTO cadeiraextensao.{tabela} ({colunas}) VALUES %s RETURNING {chave};',
+        validas,
+        page_size=_page_size(),
+        fetch=True
+    )
+    gerados = iter(linha[0] for linha in gerados)
+    return [None if v is None else next(gerados) for v in valores]
+
+
+def error_list(erros):
+    """Erros no formato da resposta, em ordem de índice."""
+    return [{"indice": indice, "erros": erros[indice]} for indice in sorted(erros)]
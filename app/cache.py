@@ -0,0 +1,261 @@
+"""
+Cache de leitura (read-through) para os dados de referência: depósitos,
+veículos, motoristas e a leitura unitária de clientes.
+
+Por padrão cada worker tem o seu `LRUCache` (limitado em entradas e com
+TTL). Com `CACHE_REDIS_URL` o cache passa a ser compartilhado por todos os
+workers num Redis (pacote `redis` opcional); qualquer objeto com os mesmos
+métodos de `LRUCache` (`get`, `set`, `counter`, `incr`) pode ser usado no
+lugar, ex: o próprio `LRUCache` como substituto local em desenvolvimento.
+
+A invalidação é por recurso: cada recurso tem um contador de geração que
+faz parte da chave, e toda escrita incrementa esse contador. Assim uma
+única operação invalida o item e todas as listagens do recurso, e uma
+leitura que carregou dados antigos enquanto a escrita acontecia grava sob a
+geração anterior, que ninguém mais lê.
+
+No cache local a geração é a versão da tabela em `versions.py`, a mesma do
+ETag e compartilhada por todos os workers: uma escrita feita em qualquer
+worker invalida o cache de todos na hora, e uma resposta nunca sai com um
+ETag mais novo que os seus dados. No Redis a geração é um contador no
+próprio Redis.
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import redis
+except ImportError:  # dependência opcional, só para o cache compartilhado
+    redis = None
+
+from . import versions
+
+# Recursos com cache.
+DEPOSITOS = 'depositos'
+VEICULOS = 'veiculos'
+MOTORISTAS = 'motoristas'
+CLIENTES = 'clientes'
+
+
+class LRUCache:
+    """
+    Cache em memória do processo, com no máximo `maxsize` entradas (as
+    menos usadas saem primeiro) e validade de `ttl` segundos.
+
+    Os contadores de geração ficam à parte e nunca são despejados: perder
+    um contador faria entradas já invalidadas voltarem a valer.
+    """
+
+    def __init__(self, maxsize=10000, ttl=30.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._dados = OrderedDict()
+        self._contadores = {}
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, chave):
+        """O valor guardado em `chave`, ou None se não existe ou expirou."""
+        with self._lock:
+            entrada = self._dados.get(chave)
+            if entrada is None:
+                return None
+            expira_em, valor = entrada
+            if expira_em < time.monotonic():
+                del self._dados[chave]
+                self.expirations += 1
+                return None
+            self._dados.move_to_end(chave)
+            return valor
+
+    def set(self, chave, valor, ttl=None):
+        expira_em = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._dados[chave] = (expira_em, valor)
+            self._dados.move_to_end(chave)
+            while len(self._dados) > self.maxsize:
+                self._dados.popitem(last=False)
+                self.evictions += 1
+
+    def counter(self, chave):
+        with self._lock:
+            return self._contadores.get(chave, 0)
+
+    def incr(self, chave):
+        with self._lock:
+            valor = self._contadores.get(chave, 0) + 1
+            self._contadores[chave] = valor
+            return valor
+
+    def size(self):
+        with self._lock:
+            return len(self._dados)
+
+
+class RedisCache:
+    """Mesma interface do `LRUCache` sobre um cliente Redis (valores em JSON)."""
+
+    def __init__(self, cliente, ttl=30.0, prefixo='casasbahia:cache:'):
+        self.cliente = cliente
+        self.ttl = ttl
+        self.prefixo = prefixo
+
+    def get(self, chave):
+        valor = self.cliente.get(self.prefixo + chave)
+        return None if valor is None else json.loads(valor)
+
+    def set(self, chave, valor, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        self.cliente.set(self.prefixo + chave, json.dumps(valor), px=max(1, int(ttl * 1000)))
+
+    def counter(self, chave):
+        return int(self.cliente.get(self.prefixo + chave) or 0)
+
+    def incr(self, chave):
+        return self.cliente.incr(self.prefixo + chave)
+
+
+class EntityCache:
+    """
+    Fachada usada pelos handlers: chaves por recurso e geração, contadores
+    de acerto/falha e invalidação. Falhas do backend nunca derrubam a
+    requisição; a leitura segue direto para o banco.
+    """
+
+    def __init__(self, backend, geracao=None):
+        self.backend = backend
+        # `geracao(recurso)`: valor que muda a cada escrita em `recurso`.
+        self._geracao_no_backend = geracao is None
+        self._geracao = geracao or self._geracao_do_backend
+        self._lock = threading.Lock()
+        self._stats = dict.fromkeys(('hits', 'misses', 'sets', 'invalidations', 'errors'), 0)
+
+    def _contar(self, nome):
+        with self._lock:
+            self._stats[nome] += 1
+
+    def _chave(self, recurso, geracao, chave):
+        return f'{recurso}:{geracao}:{chave}'
+
+    def _geracao_do_backend(self, recurso):
+        return self.backend.counter(f'{recurso}:geracao')
+
+    def read_through(self, recurso, chave, carregar):
+        """
+        Devolve o valor de `chave` em `recurso`, chamando `carregar()` e
+        guardando o resultado quando não está no cache. Resultados None
+        (ex: 404) não são guardados.
+        """
+        try:
+            geracao = self._geracao(recurso)
+            valor = self.backend.get(self._chave(recurso, geracao, chave))
+        except Exception as e:
+            print(f"Erro ao ler o cache: {e}")
+            self._contar('errors')
+            return carregar()
+        if valor is not None:
+            self._contar('hits')
+            return valor
+
+        self._contar('misses')
+        valor = carregar()
+        if valor is not None:
+            try:
+                self.backend.set(self._chave(recurso, geracao, chave), valor)
+                self._contar('sets')
+            except Exception as e:
+                print(f"Erro ao gravar no cache: {e}")
+                self._contar('errors')
+        return valor
+
+    def invalidate(self, recurso):
+        """
+        Invalida todos os itens e listagens de `recurso`. Com a geração de
+        `versions.py` quem invalida é o `versions.bump` da escrita; aqui só
+        se conta a invalidação.
+        """
+        try:
+            if self._geracao_no_backend:
+                self.backend.incr(f'{recurso}:geracao')
+            self._contar('invalidations')
+        except Exception as e:
+            print(f"Erro ao invalidar o cache: {e}")
+            self._contar('errors')
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        consultas = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = round(stats['hits'] / consultas, 4) if consultas else None
+        stats['backend'] = type(self.backend).__name__
+        if isinstance(self.backend, LRUCache):
+            stats.update(size=self.backend.size(), maxsize=self.backend.maxsize,
+                         evictions=self.backend.evictions, expirations=self.backend.expirations)
+        return stats
+
+
+def _geracao_compartilhada(recurso):
+    """A versão de `recurso` em `versions.py` (época e contador da tabela)."""
+    chave, _ = versions.snapshot((recurso,))
+    return '.'.join(map(str, chave))
+
+
+# --- Cache do processo ---
+
+_cache = None
+_cache_pid = None
+_cache_lock = threading.Lock()
+
+
+def _criar():
+    ttl = float(os.getenv('API_CACHE_TTL', '30'))
+    if ttl <= 0:
+        return None
+    url = os.getenv('CACHE_REDIS_URL')
+    if url:
+        if redis is None:
+            raise RuntimeError("CACHE_REDIS_URL definido, mas o pacote 'redis' não está instalado")
+        return EntityCache(RedisCache(redis.Redis.from_url(url), ttl))
+    return EntityCache(LRUCache(int(os.getenv('API_CACHE_MAXSIZE', '10000')), ttl),
+                       geracao=_geracao_compartilhada)
+
+
+def _apos_fork_no_filho():
+    global _cache_lock
+    _cache_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_apos_fork_no_filho)
+
+
+def get_cache():
+    """O cache deste processo, ou None se desligado (`API_CACHE_TTL=0`)."""
+    global _cache, _cache_pid
+    with _cache_lock:
+        if _cache_pid != os.getpid():
+            _cache = _criar()
+            _cache_pid = os.getpid()
+        return _cache
+
+
+def read_through(recurso, chave, carregar):
+    cache = get_cache()
+    if cache is None:
+        return carregar()
+    return cache.read_through(recurso, chave, carregar)
+
+
+def invalidate(recurso):
+    cache = get_cache()
+    if cache is not None:
+        cache.invalidate(recurso)
+
+
+def stats():
+    cache = get_cache()
+    return {"enabled": False} if cache is None else dict(cache.stats(), enabled=True)
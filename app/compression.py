@@ -0,0 +1,272 @@
+"""
+Compressão das respostas, negociada pelo `Accept-Encoding`.
+
+Codificações, na ordem de preferência de `COMPRESS_ALGORITHMS` (padrão
+`zstd,br,gzip`; vazio desliga):
+
+* `gzip`: sempre disponível (zlib), nível `COMPRESS_GZIP_LEVEL` (padrão 6);
+* `br`: com o pacote opcional `brotli`, nível `COMPRESS_BR_LEVEL` (padrão 4);
+* `zstd`: com `compression.zstd` (Python 3.14) ou o pacote opcional
+  `backports.zstd`, nível `COMPRESS_ZSTD_LEVEL` (padrão 3).
+
+Vale a maior qualidade (`q`) pedida pelo cliente; no empate, a ordem acima.
+Só são comprimidas respostas de texto (JSON, NDJSON, text/*, exceto SSE) a
+partir de `COMPRESS_MIN_BYTES` (padrão 1024). Nas respostas em streaming o
+tamanho não é conhecido: os primeiros pedaços são lidos até passar do
+limite (ou o corpo acabar) e o resto é comprimido pedaço a pedaço, com um
+flush a cada pedaço, sem juntar o corpo inteiro na memória.
+
+Bytes antes e depois e o tempo de CPU gasto são contados por codificação
+(medidores `compression_*` de `/api/metrics`), além do histograma
+`compression_seconds` por endpoint.
+"""
+import os
+import threading
+import time
+import zlib
+
+from flask import request
+
+from . import metrics
+
+try:
+    import brotli
+except ImportError:  # dependência opcional
+    brotli = None
+
+try:
+    from compression import zstd
+except ImportError:
+    try:
+        from backports import zstd
+    except ImportError:  # dependência opcional
+        zstd = None
+
+# Tipos comprimidos. text/event-stream fica de fora: cada evento precisa
+# chegar na hora, e os proxies costumam segurar SSE comprimido.
+_TIPOS = ('application/json', 'application/x-ndjson', 'text/plain', 'text/csv', 'text/html')
+
+
+class _Gzip:
+    def __init__(self, nivel):
+        self._c = zlib.compressobj(nivel, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def bloco(self, dados):
+        return self._c.compress(dados) + self._c.flush(zlib.Z_SYNC_FLUSH)
+
+    def fim(self, dados=b''):
+        return self._c.compress(dados) + self._c.flush()
+
+
+class _Brotli:
+    def __init__(self, nivel):
+        self._c = brotli.Compressor(quality=nivel)
+
+    def bloco(self, dados):
+        return self._c.process(dados) + self._c.flush()
+
+    def fim(self, dados=b''):
+        return self._c.process(dados) + self._c.finish()
+
+
+class _Zstd:
+    def __init__(self, nivel):
+        self._c = zstd.ZstdCompressor(level=nivel)
+
+    def bloco(self, dados):
+        return self._c.compress(dados, mode=zstd.ZstdCompressor.FLUSH_BLOCK)
+
+    def fim(self, dados=b''):
+        return self._c.compress(dados, mode=zstd.ZstdCompressor.FLUSH_FRAME)
+
+
+# nome -> (classe, variável do nível, nível padrão, disponível)
+_CODIFICACOES = {
+    'gzip': (_Gzip, 'COMPRESS_GZIP_LEVEL', 6, True),
+    'br': (_Brotli, 'COMPRESS_BR_LEVEL', 4, brotli is not None),
+    'zstd': (_Zstd, 'COMPRESS_ZSTD_LEVEL', 3, zstd is not None),
+}
+
+
+def _config():
+    nomes = [nome.strip() for nome in os.getenv('COMPRESS_ALGORITHMS', 'zstd,br,gzip').split(',')]
+    codificacoes = []
+    for nome in nomes:
+        if nome in _CODIFICACOES and _CODIFICACOES[nome][3]:
+            classe, variavel, padrao, _ = _CODIFICACOES[nome]
+            codificacoes.append((nome, classe, int(os.getenv(variavel, str(padrao)))))
+    return codificacoes, int(os.getenv('COMPRESS_MIN_BYTES', '1024'))
+
+
+_codificacoes, _minimo = _config()
+
+
+# --- Contadores ---
+
+_contadores = {}
+_pequenas = 0
+_contadores_lock = threading.Lock()
+
+
+def _apos_fork_no_filho():
+    global _contadores, _pequenas, _contadores_lock
+    _contadores, _pequenas = {}, 0
+    _contadores_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_apos_fork_no_filho)
+
+
+def _contar(nome, endpoint, entrada, saida, cpu):
+    with _contadores_lock:
+        dados = _contadores.setdefault(
+            nome, {'respostas': 0, 'bytes_originais': 0, 'bytes_enviados': 0, 'cpu_segundos': 0.0}
+        )
+        dados['respostas'] += 1
+        dados['bytes_originais'] += entrada
+        dados['bytes_enviados'] += saida
+        dados['cpu_segundos'] += cpu
+    metrics.observe('compression_seconds', endpoint, cpu)
+
+
+def _contar_pequena():
+    global _pequenas
+    with _contadores_lock:
+        _pequenas += 1
+
+
+def stats():
+    """Contadores deste processo: por codificação e as respostas abaixo do limite."""
+    with _contadores_lock:
+        dados = {nome: dict(valores) for nome, valores in _contadores.items()}
+        dados['abaixo_do_limite'] = _pequenas
+    return dados
+
+
+# --- Negociação ---
+
+def negotiate():
+    """A codificação a usar na requisição atual, ou None."""
+    if not _codificacoes:
+        return None
+    aceitas = request.accept_encodings
+    melhor, melhor_q = None, 0
+    for nome, _, _ in _codificacoes:
+        q = aceitas.quality(nome)
+        if q > melhor_q:
+            melhor, melhor_q = nome, q
+    return melhor
+
+
+def _compressor(nome):
+    for codificacao, classe, nivel in _codificacoes:
+        if codificacao == nome:
+            return classe(nivel)
+    raise KeyError(nome)
+
+
+def _comprimivel(response):
+    if request.method == 'HEAD':
+        return False
+    if response.status_code < 200 or response.status_code in (204, 206, 304):
+        return False
+    if response.direct_passthrough or 'Content-Encoding' in response.headers:
+        return False
+    if 'no-transform' in response.headers.get('Cache-Control', ''):
+        return False
+    return response.mimetype in _TIPOS
+
+
+def _bytes(pedaco):
+    return pedaco.encode() if isinstance(pedaco, str) else pedaco
+
+
+def _comprimir_inteira(response, nome, endpoint):
+    dados = response.get_data()
+    if len(dados) < _minimo:
+        _contar_pequena()
+        return
+    inicio = time.thread_time()
+    comprimido = _compressor(nome).fim(dados)
+    _contar(nome, endpoint, len(dados), len(comprimido), time.thread_time() - inicio)
+    response.set_data(comprimido)
+    response.headers['Content-Encoding'] = nome
+
+
+def _comprimir_stream(response, nome, endpoint):
+    original = response.response
+    pedacos = iter(original)
+    lidos, tamanho = [], 0
+    # Lê o começo do corpo até saber se passa do limite.
+    for pedaco in pedacos:
+        pedaco = _bytes(pedaco)
+        lidos.append(pedaco)
+        tamanho += len(pedaco)
+        if tamanho >= _minimo:
+            break
+    else:
+        if hasattr(original, 'close'):
+            original.close()
+        _contar_pequena()
+        response.set_data(b''.join(lidos))
+        return
+
+    def gerar():
+        compressor = _compressor(nome)
+        entrada = saida = 0
+        cpu = 0.0
+        try:
+            inicio = time.thread_time()
+            saida_pedaco = compressor.bloco(b''.join(lidos))
+            cpu += time.thread_time() - inicio
+            entrada, saida = tamanho, len(saida_pedaco)
+            yield saida_pedaco
+            for pedaco in pedacos:
+                pedaco = _bytes(pedaco)
+                if not pedaco:
+                    continue
+                inicio = time.thread_time()
+                saida_pedaco = compressor.bloco(pedaco)
+                cpu += time.thread_time() - inicio
+                entrada += len(pedaco)
+                saida += len(saida_pedaco)
+                yield saida_pedaco
+            inicio = time.thread_time()
+            saida_pedaco = compressor.fim()
+            cpu += time.thread_time() - inicio
+            saida += len(saida_pedaco)
+            yield saida_pedaco
+        finally:
+            # Também quando o cliente desconecta no meio.
+            _contar(nome, endpoint, entrada, saida, cpu)
+            if hasattr(original, 'close'):
+                original.close()
+
+    response.response = gerar()
+    response.headers.pop('Content-Length', None)
+    response.headers['Content-Encoding'] = nome
+
+
+def compress_response(response):
+    """Comprime `response` (inteira ou em streaming), se couber."""
+    if not _comprimivel(response):
+        return response
+    response.vary.add('Accept-Encoding')
+    nome = negotiate()
+    if nome is None:
+        return response
+    endpoint = request.endpoint or 'nao_encontrado'
+    if response.is_streamed:
+        _comprimir_stream(response, nome, endpoint)
+    else:
+        _comprimir_inteira(response, nome, endpoint)
+    return response
+
+
+def init_app(app):
+    """Liga a compressão nas respostas de `app`."""
+
+    @app.after_request
+    def _comprimir(response):
+        return compress_response(response)
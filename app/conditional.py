@@ -0,0 +1,102 @@
+import functools
+import hashlib
+import os
+from datetime import datetime, timezone
+
+from flask import current_app, make_response, request
+
+from . import compression, versions
+
+# Cache-Control padrão de cada recurso, ajustável por variável de ambiente
+# (ex: CACHE_CONTROL_DEPOSITOS="public, max-age=300"). "no-cache" deixa o
+# cliente guardar a resposta, mas revalidar com o ETag a cada uso.
+_CACHE_CONTROL_PADRAO = {
+    'clientes': 'private, no-cache',
+    'depositos': 'public, max-age=60',
+    'veiculos': 'private, max-age=30',
+    'motoristas': 'private, max-age=60',
+    'rotas': 'private, no-cache',
+    'entregas': 'private, no-cache',
+    'distancias': 'private, no-cache',
+    'estatisticas': 'private, no-cache',
+}
+
+
+def cache_control(recurso):
+    padrao = _CACHE_CONTROL_PADRAO.get(recurso, 'no-cache')
+    return os.getenv(f'CACHE_CONTROL_{recurso.upper()}', padrao)
+
+
+def _etag(chave):
+    """
+    ETag forte: versões das tabelas + URL + formato pedido + codificação
+    (`compression.py`): cada representação comprimida tem o seu ETag.
+    """
+    base = repr((chave, request.full_path, request.headers.get('Accept', ''), compression.negotiate()))
+    return hashlib.sha1(base.encode()).hexdigest()
+
+
+def _nao_modificado(etag, modificacao, por_data=True):
+    # If-None-Match tem precedência; If-Modified-Since só vale sem ele.
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    desde = request.if_modified_since
+    return por_data and desde is not None and modificacao <= desde.timestamp()
+
+
+def _resolver(tabelas):
+    """Nomes das tabelas, chamando os itens que são funções."""
+    nomes = []
+    for tabela in tabelas:
+        for nome in (tabela() if callable(tabela) else (tabela,)):
+            if nome not in nomes:
+                nomes.append(nome)
+    return nomes
+
+
+def conditional(recurso, *tabelas, variante=None):
+    """
+    Decorador de GETs que dependem de `tabelas` (por padrão, a tabela de
+    mesmo nome do `recurso`). Um item de `tabelas` também pode ser uma
+    função, chamada a cada requisição, que devolve nomes de tabelas (para
+    dependências que variam com a query string, como `?include=`).
+
+    `variante`, se dada, é uma função chamada a cada requisição cujo valor
+    também entra no ETag, para respostas que mudam sem mudar a URL nem as
+    tabelas (ex: o dia de hoje, quando ele é o padrão). Nesses recursos só
+    o `If-None-Match` gera `304`: a data de modificação das tabelas não diz
+    nada sobre a variante.
+
+    O ETag é calculado a partir dos contadores de `versions` antes de
+    executar o handler: se o cliente já tem essa versão (`If-None-Match` ou
+    `If-Modified-Since`), a resposta é `304` sem consultar o banco nem
+    serializar nada. Caso contrário o handler roda e
+    as respostas 200 ganham `ETag`, `Last-Modified` e `Cache-Control`.
+
+    A versão é lida antes da consulta: se uma escrita acontecer no meio, o
+    ETag fica mais antigo que os dados e, no pior caso, o cliente baixa a
+    resposta de novo na próxima vez.
+    """
+    tabelas = tabelas or (recurso,)
+
+    def decorador(handler):
+        @functools.wraps(handler)
+        def envolvido(*args, **kwargs):
+            if request.method != 'GET':
+                return handler(*args, **kwargs)
+            chave, modificacao = versions.snapshot(_resolver(tabelas))
+            if variante is not None:
+                chave = (chave, variante())
+            etag = _etag(chave)
+            if _nao_modificado(etag, modificacao, por_data=variante is None):
+                resposta = current_app.response_class(status=304)
+            else:
+                resposta = make_response(handler(*args, **kwargs))
+                if resposta.status_code != 200:
+                    return resposta
+            resposta.set_etag(etag)
+            resposta.last_modified = datetime.fromtimestamp(modificacao, timezone.utc)
+            resposta.headers['Cache-Control'] = cache_control(recurso)
+            return resposta
+        return envolvido
+    return decorador
@@ -0,0 +1,198 @@
+"""
+Estatísticas de operação (`GET /api/estatisticas`) a partir de contadores
+mantidos pelo próprio banco.
+
+Gatilhos em `entregas` e `rotas` atualizam, a cada INSERT/UPDATE/DELETE,
+três tabelas pequenas:
+
+* `estatisticas_entregas`: entregas por (rota, status), com a data da rota
+  e quantas das entregues tinham horário previsto e real (`com_horario`) e
+  quantas chegaram no prazo (`no_prazo`);
+* `estatisticas_rotas`: rotas por (data, status);
+* `estatisticas_veiculos`: rotas por (data, veículo), ou seja, os veículos
+  em uso no dia.
+
+A leitura de um dia percorre só as linhas daquele dia, seja qual for o
+tamanho do histórico. O DDL e a carga inicial dos contadores estão em
+`SQL_ESTATISTICAS` (migração 5 de `app.migrations`). Entregas sem rota
+não têm data e ficam fora dos contadores.
+"""
+from datetime import date
+
+SQL_ESTATISTICAS = """
+CREATE TABLE IF NOT EXISTS cadeiraextensao.estatisticas_entregas (
+    rota_id integer NOT NULL,
+    status_entrega text NOT NULL,
+    data_rota date,
+    quantidade integer NOT NULL DEFAULT 0,
+    com_horario integer NOT NULL DEFAULT 0,
+    no_prazo integer NOT NULL DEFAULT 0,
+    PRIMARY KEY (rota_id, status_entrega)
+);
+CREATE INDEX IF NOT EXISTS estatisticas_entregas_data_idx
+    ON cadeiraextensao.estatisticas_entregas (data_rota);
+
+CREATE TABLE IF NOT EXISTS cadeiraextensao.estatisticas_rotas (
+    data_rota date NOT NULL,
+    status_rota text NOT NULL,
+    quantidade integer NOT NULL DEFAULT 0,
+    PRIMARY KEY (data_rota, status_rota)
+);
+
+CREATE TABLE IF NOT EXISTS cadeiraextensao.estatisticas_veiculos (
+    data_rota date NOT NULL,
+    veiculo_id integer NOT NULL,
+    rotas integer NOT NULL DEFAULT 0,
+    PRIMARY KEY (data_rota, veiculo_id)
+);
+
+CREATE OR REPLACE FUNCTION cadeiraextensao.contabilizar_entrega() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.rota_id IS NOT NULL THEN
+        UPDATE cadeiraextensao.estatisticas_entregas
+        SET quantidade = quantidade - 1,
+            com_horario = com_horario - coalesce((OLD.status_entrega = 'Entregue'
+                AND OLD.data_hora_real_entrega IS NOT NULL
+                AND OLD.data_hora_prevista_entrega IS NOT NULL)::integer, 0),
+            no_prazo = no_prazo - coalesce((OLD.status_entrega = 'Entregue'
+                AND OLD.data_hora_real_entrega <= OLD.data_hora_prevista_entrega)::integer, 0)
+        WHERE rota_id = OLD.rota_id AND status_entrega = coalesce(OLD.status_entrega, '');
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.rota_id IS NOT NULL THEN
+        INSERT INTO cadeiraextensao.estatisticas_entregas AS e
+            (rota_id, status_entrega, data_rota, quantidade, com_horario, no_prazo)
+        VALUES (
+            NEW.rota_id,
+            coalesce(NEW.status_entrega, ''),
+            (SELECT data_rota FROM cadeiraextensao.rotas WHERE rota_id = NEW.rota_id),
+            1,
+            coalesce((NEW.status_entrega = 'Entregue'
+                AND NEW.data_hora_real_entrega IS NOT NULL
+                AND NEW.data_hora_prevista_entrega IS NOT NULL)::integer, 0),
+            coalesce((NEW.status_entrega = 'Entregue'
+                AND NEW.data_hora_real_entrega <= NEW.data_hora_prevista_entrega)::integer, 0)
+        )
+        ON CONFLICT (rota_id, status_entrega) DO UPDATE
+        SET quantidade = e.quantidade + 1,
+            com_horario = e.com_horario + EXCLUDED.com_horario,
+            no_prazo = e.no_prazo + EXCLUDED.no_prazo;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION cadeiraextensao.contabilizar_rota() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.data_rota IS NOT NULL THEN
+        UPDATE cadeiraextensao.estatisticas_rotas SET quantidade = quantidade - 1
+        WHERE data_rota = OLD.data_rota AND status_rota = coalesce(OLD.status_rota, '');
+        UPDATE cadeiraextensao.estatisticas_veiculos SET rotas = rotas - 1
+        WHERE data_rota = OLD.data_rota AND veiculo_id = OLD.veiculo_id;
+        DELETE FROM cadeiraextensao.estatisticas_veiculos
+        WHERE data_rota = OLD.data_rota AND veiculo_id = OLD.veiculo_id AND rotas <= 0;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.data_rota IS NOT NULL THEN
+        INSERT INTO cadeiraextensao.estatisticas_rotas AS r (data_rota, status_rota, quantidade)
+        VALUES (NEW.data_rota, coalesce(NEW.status_rota, ''), 1)
+        ON CONFLICT (data_rota, status_rota) DO UPDATE SET quantidade = r.quantidade + 1;
+        IF NEW.veiculo_id IS NOT NULL THEN
+            INSERT INTO cadeiraextensao.estatisticas_veiculos AS v (data_rota, veiculo_id, rotas)
+            VALUES (NEW.data_rota, NEW.veiculo_id, 1)
+            ON CONFLICT (data_rota, veiculo_id) DO UPDATE SET rotas = v.rotas + 1;
+        END IF;
+    END IF;
+    IF TG_OP = 'UPDATE' AND OLD.data_rota IS DISTINCT FROM NEW.data_rota THEN
+        UPDATE cadeiraextensao.estatisticas_entregas SET data_rota = NEW.data_rota
+        WHERE rota_id = NEW.rota_id;
+    ELSIF TG_OP = 'DELETE' THEN
+        DELETE FROM cadeiraextensao.estatisticas_entregas WHERE rota_id = OLD.rota_id;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS entregas_contabilizar ON cadeiraextensao.entregas;
+CREATE TRIGGER entregas_contabilizar
+    AFTER INSERT OR DELETE OR UPDATE OF rota_id, status_entrega, data_hora_real_entrega, data_hora_prevista_entrega
+    ON cadeiraextensao.entregas
+    FOR EACH ROW EXECUTE FUNCTION cadeiraextensao.contabilizar_entrega();
+
+DROP TRIGGER IF EXISTS rotas_contabilizar ON cadeiraextensao.rotas;
+CREATE TRIGGER rotas_contabilizar
+    AFTER INSERT OR DELETE OR UPDATE OF data_rota, status_rota, veiculo_id
+    ON cadeiraextensao.rotas
+    FOR EACH ROW EXECUTE FUNCTION cadeiraextensao.contabilizar_rota();
+
+-- Carga inicial (ou correção) dos contadores, sem escritas concorrentes.
+LOCK TABLE cadeiraextensao.rotas, cadeiraextensao.entregas IN SHARE MODE;
+TRUNCATE cadeiraextensao.estatisticas_entregas, cadeiraextensao.estatisticas_rotas,
+         cadeiraextensao.estatisticas_veiculos;
+
+INSERT INTO cadeiraextensao.estatisticas_entregas
+    (rota_id, status_entrega, data_rota, quantidade, com_horario, no_prazo)
+SELECT e.rota_id, coalesce(e.status_entrega, ''), r.data_rota, count(*),
+       count(*) FILTER (WHERE e.status_entrega = 'Entregue'
+                          AND e.data_hora_real_entrega IS NOT NULL
+                          AND e.data_hora_prevista_entrega IS NOT NULL),
+       count(*) FILTER (WHERE e.status_entrega = 'Entregue'
+                          AND e.data_hora_real_entrega <= e.data_hora_prevista_entrega)
+FROM cadeiraextensao.entregas e
+JOIN cadeiraextensao.rotas r ON r.rota_id = e.rota_id
+GROUP BY e.rota_id, coalesce(e.status_entrega, ''), r.data_rota;
+
+INSERT INTO cadeiraextensao.estatisticas_rotas (data_rota, status_rota, quantidade)
+SELECT data_rota, coalesce(status_rota, ''), count(*)
+FROM cadeiraextensao.rotas WHERE data_rota IS NOT NULL
+GROUP BY data_rota, coalesce(status_rota, '');
+
+INSERT INTO cadeiraextensao.estatisticas_veiculos (data_rota, veiculo_id, rotas)
+SELECT data_rota, veiculo_id, count(*)
+FROM cadeiraextensao.rotas WHERE data_rota IS NOT NULL AND veiculo_id IS NOT NULL
+GROUP BY data_rota, veiculo_id;
+"""
+
+
+# As três leituras de um dia, cada uma com o parâmetro `data_rota`.
+SQL_ENTREGAS_DO_DIA = (
+    'SELECT rota_id, status_entrega, quantidade, com_horario, no_prazo '
+    'FROM cadeiraextensao.estatisticas_entregas '
+    'WHERE data_rota = %s AND quantidade > 0 ORDER BY rota_id, status_entrega;'
+)
+SQL_ROTAS_DO_DIA = (
+    'SELECT status_rota, quantidade FROM cadeiraextensao.estatisticas_rotas '
+    'WHERE data_rota = %s AND quantidade > 0 ORDER BY status_rota;'
+)
+SQL_VEICULOS_DO_DIA = 'SELECT count(*) FROM cadeiraextensao.estatisticas_veiculos WHERE data_rota = %s;'
+
+
+def daily_stats(cur, data):
+    """Estatísticas do dia `data` lidas das tabelas de contadores."""
+    cur.execute(SQL_ENTREGAS_DO_DIA, (data,))
+    por_status = {}
+    rotas = {}
+    com_horario = no_prazo = 0
+    for rota_id, status, quantidade, rota_com_horario, rota_no_prazo in cur.fetchall():
+        por_status[status] = por_status.get(status, 0) + quantidade
+        rota = rotas.setdefault(rota_id, {
+            "rota_id": rota_id, "entregas_por_status": {}, "no_prazo": 0, "com_horario": 0
+        })
+        rota["entregas_por_status"][status] = quantidade
+        rota["com_horario"] += rota_com_horario
+        rota["no_prazo"] += rota_no_prazo
+        com_horario += rota_com_horario
+        no_prazo += rota_no_prazo
+
+    cur.execute(SQL_ROTAS_DO_DIA, (data,))
+    rotas_por_status = dict(cur.fetchall())
+
+    cur.execute(SQL_VEICULOS_DO_DIA, (data,))
+    veiculos_em_uso = cur.fetchone()[0]
+
+    return {
+        "data": data.isoformat() if isinstance(data, date) else data,
+        "entregas_por_status": por_status,
+        "taxa_no_prazo": round(no_prazo / com_horario, 4) if com_horario else None,
+        "rotas_por_status": rotas_por_status,
+        "veiculos_em_uso": veiculos_em_uso,
+        "rotas": list(rotas.values()),
+    }
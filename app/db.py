@@ -1,10 +1,45 @@
+import atexit
 import os
+import threading
+import time
+from contextlib import contextmanager
+
 import psycopg2
+from psycopg2 import extensions
 from dotenv import load_dotenv
 
+from . import metrics, slowlog
+
 # Carrega as variáveis de ambiente do arquivo .env
 load_dotenv()
 
+
+class DatabaseConnectionError(Exception):
+    """Levantada quando não é possível obter uma conexão com o banco."""
+
+
+class MeteredCursor(extensions.cursor):
+    """
+    Cursor padrão das conexões da API. Mede cada `execute`: soma o tempo e
+    as linhas lidas ou alteradas na medição da requisição atual
+    (`metrics.py`) e manda para o registro de consultas lentas
+    (`slowlog.py`) as que passarem do limite.
+    """
+
+    def execute(self, query, vars=None):
+        inicio = time.perf_counter()
+        super().execute(query, vars)
+        duracao = time.perf_counter() - inicio
+        medicao = metrics.current()
+        if medicao is not None:
+            medicao.consulta += duracao
+            if self.rowcount > 0:
+                medicao.linhas += self.rowcount
+        registro = slowlog.get_log()
+        if registro.lenta(duracao):
+            registro.registrar(self, query, vars, duracao)
+
+
 def get_db_connection():
     """Estabelece e retorna uma conexão com o banco de dados."""
     try:
@@ -13,9 +48,284 @@ def get_db_connection():
             user=os.getenv('DB_USER'),
             password=os.getenv('DB_PASSWORD'),
             host=os.getenv('DB_HOST'),
-            port=os.getenv('DB_PORT')
+            port=os.getenv('DB_PORT'),
+            cursor_factory=MeteredCursor
         )
         return conn
     except psycopg2.OperationalError as e:
         print(f"Erro ao conectar ao banco de dados: {e}")
-        return None
\ No newline at end of file
+        return None
+
+
+class ConnectionPool:
+    """
+    Pool de conexões limitado e thread-safe.
+
+    Diferente do `psycopg2.pool.ThreadedConnectionPool`, que levanta erro
+    quando esgota, este pool bloqueia o chamador até `timeout` segundos
+    esperando uma conexão ser devolvida, e registra quanto tempo foi gasto
+    nessa espera. Conexões ociosas há mais de `max_idle` segundos passam por
+    um `SELECT 1` antes de serem entregues, e são recriadas se estiverem
+    mortas (ex: derrubadas pelo servidor ou por um proxy).
+    """
+
+    def __init__(self, minconn, maxconn, timeout=30.0, max_idle=60.0, connect=get_db_connection):
+        if minconn < 0 or maxconn < 1 or minconn > maxconn:
+            raise ValueError("Tamanhos de pool inválidos: é preciso 0 <= min <= max e max >= 1")
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self._connect = connect
+        self._cond = threading.Condition()
+        self._idle = []          # pilha de (conexão, instante em que foi devolvida)
+        self._in_use = set()
+        self._abrindo = 0        # conexões sendo abertas fora do lock
+        self._closed = False
+
+        # Estatísticas
+        self._waiting = 0
+        self._checkouts = 0
+        self._timeouts = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._descartadas = 0
+
+        for _ in range(minconn):
+            conn = self._connect()
+            if conn is None:
+                break
+            self._idle.append((conn, time.monotonic()))
+
+    # --- Checkout / devolução ---
+
+    def getconn(self):
+        """Retira uma conexão do pool, bloqueando até `timeout` se estiver cheio."""
+        inicio = time.monotonic()
+        prazo = inicio + self.timeout
+        with self._cond:
+            esperou = False
+            while True:
+                if self._closed:
+                    raise DatabaseConnectionError("Pool de conexões fechado")
+                if self._idle:
+                    conn, devolvida_em = self._idle.pop()
+                    self._in_use.add(conn)
+                    break
+                if len(self._in_use) + self._abrindo < self.maxconn:
+                    conn, devolvida_em = None, None
+                    self._abrindo += 1
+                    break
+                restante = prazo - time.monotonic()
+                if restante <= 0:
+                    self._timeouts += 1
+                    raise DatabaseConnectionError("Tempo esgotado aguardando conexão do pool")
+                self._waiting += 1
+                esperou = True
+                try:
+                    self._cond.wait(restante)
+                finally:
+                    self._waiting -= 1
+            espera = time.monotonic() - inicio if esperou else 0.0
+            self._checkouts += 1
+            self._wait_total += espera
+            if espera > self._wait_max:
+                self._wait_max = espera
+
+        # Abrir conexões e verificar saúde acontece fora do lock, para não
+        # segurar as outras threads durante um handshake de rede.
+        if conn is None:
+            return self._abrir_nova()
+        if conn.closed or (time.monotonic() - devolvida_em > self.max_idle and not self._saudavel(conn)):
+            with self._cond:
+                self._in_use.discard(conn)
+                self._descartar(conn)
+                self._abrindo += 1
+            return self._abrir_nova()
+        return conn
+
+    def putconn(self, conn, close=False):
+        """Devolve uma conexão ao pool, desfazendo transações pendentes."""
+        if not close and not conn.closed:
+            try:
+                if conn.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                close = True
+        with self._cond:
+            self._in_use.discard(conn)
+            if close or conn.closed or self._closed:
+                self._descartar(conn)
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def closeall(self):
+        """Fecha todas as conexões ociosas e impede novos checkouts."""
+        with self._cond:
+            self._closed = True
+            for conn, _ in self._idle:
+                self._descartar(conn)
+            self._idle.clear()
+            self._cond.notify_all()
+
+    def stats(self):
+        """Retorna um retrato das métricas do pool."""
+        with self._cond:
+            return {
+                "min": self.minconn,
+                "max": self.maxconn,
+                "in_use": len(self._in_use),
+                "idle": len(self._idle),
+                "waiting": self._waiting,
+                "checkouts": self._checkouts,
+                "timeouts": self._timeouts,
+                "discarded": self._descartadas,
+                "wait_time_total_s": self._wait_total,
+                "wait_time_max_s": self._wait_max,
+                "wait_time_avg_s": self._wait_total / self._checkouts if self._checkouts else 0.0,
+            }
+
+    # --- Internos ---
+
+    def _abrir_nova(self):
+        conn = None
+        try:
+            conn = self._connect()
+        finally:
+            with self._cond:
+                self._abrindo -= 1
+                if conn is not None:
+                    self._in_use.add(conn)
+                else:
+                    # Libera a vaga reservada para quem estiver esperando.
+                    self._cond.notify()
+        if conn is None:
+            raise DatabaseConnectionError("Database connection failed")
+        return conn
+
+    def _saudavel(self, conn):
+        try:
+            with conn.cursor() as cur:
+                cur.execute('SELECT 1;')
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _descartar(self, conn):
+        self._descartadas += 1
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+
+# --- Pool por processo (um por worker do gunicorn) ---
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+# Conexões herdadas de um processo pai após um fork. Elas compartilham o
+# socket com o pai, então não podem ser fechadas no filho (isso encerraria a
+# sessão do pai); mantemos a referência para que o coletor de lixo também
+# não as feche.
+_conexoes_herdadas = []
+
+
+def _config_do_pool():
+    return {
+        "minconn": int(os.getenv('DB_POOL_MIN', '1')),
+        "maxconn": int(os.getenv('DB_POOL_MAX', '10')),
+        "timeout": float(os.getenv('DB_POOL_TIMEOUT', '30')),
+        "max_idle": float(os.getenv('DB_POOL_MAX_IDLE', '60')),
+    }
+
+
+def get_pool():
+    """Retorna o pool do processo atual, criando-o na primeira chamada."""
+    global _pool, _pool_pid
+    pid = os.getpid()
+    if _pool is not None and _pool_pid == pid:
+        return _pool
+    with _pool_lock:
+        if _pool is not None and _pool_pid != pid:
+            _abandonar_pool_herdado()
+        if _pool is None:
+            _pool = ConnectionPool(**_config_do_pool())
+            _pool_pid = pid
+        return _pool
+
+
+def _abandonar_pool_herdado():
+    global _pool, _pool_pid
+    if _pool is not None:
+        _conexoes_herdadas.extend(conn for conn, _ in _pool._idle)
+        _conexoes_herdadas.extend(_pool._in_use)
+    _pool = None
+    _pool_pid = None
+
+
+def _apos_fork_no_filho():
+    global _pool_lock
+    # O lock pode ter sido copiado travado por outra thread do pai.
+    _pool_lock = threading.Lock()
+    _abandonar_pool_herdado()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_apos_fork_no_filho)
+
+
+def close_pool():
+    """Fecha o pool do processo atual (ex: no desligamento do worker)."""
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            _pool.closeall()
+        _pool = None
+        _pool_pid = None
+
+
+atexit.register(close_pool)
+
+
+def pool_stats():
+    """Métricas do pool do processo atual, ou None se ainda não foi criado."""
+    pool = _pool
+    if pool is None or _pool_pid != os.getpid():
+        return None
+    return pool.stats()
+
+
+@contextmanager
+def db_connection():
+    """
+    Empresta uma conexão do pool durante o bloco `with`.
+
+    Se o bloco levantar uma exceção, a transação é desfeita antes da
+    devolução; conexões quebradas são descartadas em vez de voltarem ao pool.
+    """
+    pool = get_pool()
+    medicao = metrics.current()
+    if medicao is None:
+        conn = pool.getconn()
+    else:
+        inicio = time.perf_counter()
+        try:
+            conn = pool.getconn()
+        finally:
+            medicao.checkout += time.perf_counter() - inicio
+    try:
+        yield conn
+    except BaseException:
+        quebrada = False
+        try:
+            if not conn.closed:
+                conn.rollback()
+        except psycopg2.Error:
+            quebrada = True
+        pool.putconn(conn, close=quebrada or bool(conn.closed))
+        raise
+    else:
+        pool.putconn(conn)
@@ -0,0 +1,449 @@
+"""
+Cache de distâncias entre clientes e depósitos.
+
+Guarda em disco, em arquivos `.npy` abertos com `numpy.memmap`:
+
+* as coordenadas de todos os clientes e depósitos (`clientes.npy`,
+  `depositos.npy`, linhas `[id, lat, lon]`);
+* a matriz de distâncias haversine cliente x depósito (`matriz.npy`,
+  float32), que é o que roteirização e busca do depósito mais próximo
+  consultam o tempo todo;
+* um pequeno cabeçalho (`meta.npy`) com a versão dos dados e quantas
+  linhas de cada tabela estão em uso.
+
+Como os arquivos são mapeados com MAP_SHARED, todos os workers do gunicorn
+enxergam a mesma página de memória: uma atualização feita por um worker
+aparece imediatamente para os outros, sem recarregar nada. As escritas
+são serializadas entre processos com `fcntl.flock`. Quando os arquivos
+precisam ser recriados (carga inicial ou aumento de capacidade), eles são
+substituídos atomicamente e os outros workers percebem a troca pelo inode
+de `meta.npy`.
+
+Distâncias cliente x cliente não são guardadas (com ~50 mil clientes a
+matriz completa teria ~10 GB); elas são calculadas sob demanda, de forma
+vetorizada, a partir das coordenadas em cache.
+"""
+import fcntl
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+from .db import db_connection
+from .tsp import RAIO_TERRA_KM
+
+CLIENTE = 'cliente'
+DEPOSITO = 'deposito'
+
+# Posições em meta.npy
+_VERSAO, _N_CLIENTES, _N_DEPOSITOS = range(3)
+
+_CAPACIDADE_INICIAL_CLIENTES = 1024
+_CAPACIDADE_INICIAL_DEPOSITOS = 16
+
+
+def haversine_matrix(lat1, lon1, lat2, lon2):
+    """
+    Matriz `len(lat1) x len(lat2)` de distâncias em km, calculada de uma
+    vez com broadcasting do NumPy. Coordenadas em graus; NaN propaga.
+    """
+    lat1 = np.radians(np.asarray(lat1, dtype=np.float64))[:, None]
+    lon1 = np.radians(np.asarray(lon1, dtype=np.float64))[:, None]
+    lat2 = np.radians(np.asarray(lat2, dtype=np.float64))[None, :]
+    lon2 = np.radians(np.asarray(lon2, dtype=np.float64))[None, :]
+    a = (np.sin((lat2 - lat1) / 2) ** 2
+         + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * RAIO_TERRA_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def _float(valor):
+    return np.nan if valor is None else float(valor)
+
+
+class DistanceCache:
+    """Acesso ao cache de distâncias guardado em `diretorio`."""
+
+    def __init__(self, diretorio, carregar=None):
+        self.diretorio = diretorio
+        # `carregar(cache)` reconstrói os arquivos do zero (ex: a partir do
+        # banco) quando eles somem no meio do caminho.
+        self._carregar = carregar
+        self._lock = threading.RLock()
+        self._travado = False
+        self._inode = None
+        self._meta = None
+        self._clientes = None
+        self._depositos = None
+        self._matriz = None
+        self._indices = {CLIENTE: {}, DEPOSITO: {}}
+        self._lidos = {CLIENTE: 0, DEPOSITO: 0}
+
+    def _caminho(self, nome):
+        return os.path.join(self.diretorio, nome)
+
+    def exists(self):
+        return os.path.exists(self._caminho('meta.npy'))
+
+    def version(self):
+        """
+        Identifica o estado atual dos dados: muda a cada escrita feita por
+        qualquer worker. Serve para caches derivados saberem quando refazer.
+        """
+        with self._lock:
+            self._sincronizar()
+            return (self._inode, int(self._meta[_VERSAO]))
+
+    # --- Sincronização entre processos ---
+
+    @contextmanager
+    def _exclusivo(self):
+        """Lock de escrita entre threads e entre workers."""
+        os.makedirs(self.diretorio, exist_ok=True)
+        with self._lock:
+            if self._travado:
+                # Reentrada na mesma thread (ex: uma reconstrução no meio de
+                # uma escrita). Um segundo flock em outro descritor do mesmo
+                # arquivo travaria o próprio processo.
+                yield
+                return
+            with open(self._caminho('.lock'), 'a+') as arquivo:
+                fcntl.flock(arquivo, fcntl.LOCK_EX)
+                self._travado = True
+                try:
+                    yield
+                finally:
+                    self._travado = False
+                    fcntl.flock(arquivo, fcntl.LOCK_UN)
+
+    def _abrir(self, inode):
+        self._meta = np.load(self._caminho('meta.npy'), mmap_mode='r+')
+        self._clientes = np.load(self._caminho('clientes.npy'), mmap_mode='r+')
+        self._depositos = np.load(self._caminho('depositos.npy'), mmap_mode='r+')
+        self._matriz = np.load(self._caminho('matriz.npy'), mmap_mode='r+')
+        self._inode = inode
+        self._indices = {CLIENTE: {}, DEPOSITO: {}}
+        self._lidos = {CLIENTE: 0, DEPOSITO: 0}
+
+    def _tabela(self, tipo):
+        if tipo == CLIENTE:
+            return self._clientes, int(self._meta[_N_CLIENTES])
+        return self._depositos, int(self._meta[_N_DEPOSITOS])
+
+    def _sincronizar(self):
+        """
+        Reabre os arquivos se algum worker os recriou (outro inode) e
+        acrescenta aos índices id -> posição só as linhas novas desde a
+        última leitura. Remoções não mexem no índice: a linha fica com id -1
+        e `_posicoes` deixa de encontrá-la.
+        """
+        try:
+            inode = os.stat(self._caminho('meta.npy')).st_ino
+        except FileNotFoundError:
+            # Outro worker apagou os arquivos depois de uma falha (ver
+            # `_atualizar`): reconstrói em vez de derrubar a requisição.
+            if self._carregar is None:
+                raise
+            self._carregar(self)
+            inode = os.stat(self._caminho('meta.npy')).st_ino
+        if inode != self._inode:
+            self._abrir(inode)
+        for tipo in (CLIENTE, DEPOSITO):
+            tabela, n = self._tabela(tipo)
+            lidos = self._lidos[tipo]
+            if n > lidos:
+                ids = tabela[lidos:n, 0].tolist()
+                self._indices[tipo].update(
+                    (int(i), posicao) for posicao, i in enumerate(ids, start=lidos) if i >= 0
+                )
+                self._lidos[tipo] = n
+
+    def _posicoes(self, tipo, ids):
+        """Posições (linha de cliente / coluna de depósito) dos ids; -1 se não existir."""
+        tabela, _ = self._tabela(tipo)
+        indice = self._indices[tipo]
+        ids = np.asarray(ids, dtype=np.int64)
+        posicoes = np.array([indice.get(i, -1) for i in ids.tolist()], dtype=np.int64)
+        encontrados = posicoes >= 0
+        # Confirma que a linha ainda pertence ao id (pode ter sido removida).
+        encontrados[encontrados] = tabela[posicoes[encontrados], 0] == ids[encontrados]
+        posicoes[~encontrados] = -1
+        return posicoes
+
+    def _posicao(self, tipo, identificador):
+        posicao = int(self._posicoes(tipo, [identificador])[0])
+        return None if posicao < 0 else posicao
+
+    def _publicar(self):
+        # Sem flush/msync: o cache não precisa sobreviver a uma queda da
+        # máquina, e os outros workers já enxergam as páginas alteradas.
+        self._meta[_VERSAO] += 1
+
+    # --- Construção ---
+
+    def build(self, clientes, depositos):
+        """
+        (Re)cria todos os arquivos a partir de listas `(id, lat, lon)`.
+        Os arquivos novos substituem os antigos atomicamente.
+        """
+        with self._exclusivo():
+            self._gravar(
+                np.array(clientes, dtype=np.float64).reshape(-1, 3),
+                np.array(depositos, dtype=np.float64).reshape(-1, 3),
+            )
+            self._sincronizar()
+
+    def _gravar(self, clientes, depositos, cap_clientes=None, cap_depositos=None):
+        n_cli, n_dep = len(clientes), len(depositos)
+        cap_cli = max(cap_clientes or 0, _CAPACIDADE_INICIAL_CLIENTES, 2 * n_cli)
+        cap_dep = max(cap_depositos or 0, _CAPACIDADE_INICIAL_DEPOSITOS, 2 * n_dep)
+
+        tabela_cli = np.full((cap_cli, 3), np.nan)
+        tabela_cli[:, 0] = -1
+        tabela_cli[:n_cli] = clientes
+        tabela_dep = np.full((cap_dep, 3), np.nan)
+        tabela_dep[:, 0] = -1
+        tabela_dep[:n_dep] = depositos
+
+        matriz = np.full((cap_cli, cap_dep), np.nan, dtype=np.float32)
+        # Em blocos, para não alocar a matriz float64 inteira de uma vez.
+        for inicio in range(0, n_cli, 8192):
+            fim = min(inicio + 8192, n_cli)
+            matriz[inicio:fim, :n_dep] = haversine_matrix(
+                clientes[inicio:fim, 1], clientes[inicio:fim, 2], depositos[:, 1], depositos[:, 2]
+            )
+
+        # meta.npy é o último a ser trocado: é a troca do seu inode que avisa
+        # os outros workers de que há arquivos novos.
+        meta = np.array([0, n_cli, n_dep], dtype=np.int64)
+        for nome, dados in (('clientes.npy', tabela_cli), ('depositos.npy', tabela_dep),
+                            ('matriz.npy', matriz), ('meta.npy', meta)):
+            fd, temporario = tempfile.mkstemp(dir=self.diretorio, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as arquivo:
+                np.save(arquivo, dados)
+            os.replace(temporario, self._caminho(nome))
+
+    def _crescer(self, clientes=0, depositos=0):
+        """Recria os arquivos com mais capacidade (chamado sob o lock)."""
+        n_cli = int(self._meta[_N_CLIENTES])
+        n_dep = int(self._meta[_N_DEPOSITOS])
+        self._gravar(
+            np.array(self._clientes[:n_cli]), np.array(self._depositos[:n_dep]),
+            cap_clientes=2 * (n_cli + clientes), cap_depositos=2 * (n_dep + depositos),
+        )
+        self._sincronizar()
+
+    # --- Atualização incremental ---
+
+    def upsert_cliente(self, cliente_id, lat, lon):
+        """Grava as coordenadas do cliente e recalcula apenas a sua linha."""
+        self.upsert_clientes([(cliente_id, lat, lon)])
+
+    def upsert_clientes(self, clientes):
+        """
+        Versão em lote de `upsert_cliente` para listas `(id, lat, lon)`: um
+        único lock e um único cálculo vetorizado para todas as linhas. Ids
+        repetidos ficam com a última coordenada.
+        """
+        ultimos = {int(i): (_float(lat), _float(lon)) for i, lat, lon in clientes}
+        if not ultimos:
+            return
+        dados = np.array([(i, lat, lon) for i, (lat, lon) in ultimos.items()], dtype=np.float64)
+        with self._exclusivo():
+            self._sincronizar()
+            linhas = self._posicoes(CLIENTE, dados[:, 0])
+            novos = linhas < 0
+            n_novos = int(novos.sum())
+            n_cli = int(self._meta[_N_CLIENTES])
+            if n_cli + n_novos > len(self._clientes):
+                self._crescer(clientes=n_novos)
+            linhas[novos] = np.arange(n_cli, n_cli + n_novos)
+            self._clientes[linhas] = dados
+            n_dep = int(self._meta[_N_DEPOSITOS])
+            self._matriz[linhas, :n_dep] = haversine_matrix(
+                dados[:, 1], dados[:, 2], self._depositos[:n_dep, 1], self._depositos[:n_dep, 2]
+            )
+            # A contagem por último: os leitores não pegam lock, e uma linha
+            # só pode ficar visível para eles já com id e distâncias gravados.
+            self._meta[_N_CLIENTES] = n_cli + n_novos
+            self._publicar()
+
+    def upsert_deposito(self, deposito_id, lat, lon):
+        """Grava as coordenadas do depósito e recalcula apenas a sua coluna."""
+        with self._exclusivo():
+            self._sincronizar()
+            coluna = self._posicao(DEPOSITO, deposito_id)
+            n_dep = int(self._meta[_N_DEPOSITOS])
+            if coluna is None:
+                coluna = n_dep
+                if coluna >= len(self._depositos):
+                    self._crescer(depositos=1)
+            lat, lon = _float(lat), _float(lon)
+            self._depositos[coluna] = (deposito_id, lat, lon)
+            n_cli = int(self._meta[_N_CLIENTES])
+            self._matriz[:n_cli, coluna] = haversine_matrix(
+                self._clientes[:n_cli, 1], self._clientes[:n_cli, 2], [lat], [lon]
+            )[:, 0]
+            # Como em `upsert_clientes`: a contagem só depois da coluna pronta.
+            self._meta[_N_DEPOSITOS] = max(n_dep, coluna + 1)
+            self._publicar()
+
+    def remove_cliente(self, cliente_id):
+        with self._exclusivo():
+            self._sincronizar()
+            linha = self._posicao(CLIENTE, cliente_id)
+            if linha is not None:
+                self._clientes[linha] = (-1, np.nan, np.nan)
+                self._matriz[linha, :] = np.nan
+                self._publicar()
+
+    def remove_deposito(self, deposito_id):
+        with self._exclusivo():
+            self._sincronizar()
+            coluna = self._posicao(DEPOSITO, deposito_id)
+            if coluna is not None:
+                self._depositos[coluna] = (-1, np.nan, np.nan)
+                self._matriz[:, coluna] = np.nan
+                self._publicar()
+
+    # --- Consulta ---
+
+    def coordinates(self, tipo, ids=None):
+        """
+        Retorna `(ids, lat, lon)` como arrays para os `ids` pedidos (ou para
+        todos os cadastrados). Ids desconhecidos voltam com coordenadas NaN.
+        """
+        with self._lock:
+            self._sincronizar()
+            tabela, n = self._tabela(tipo)
+            if ids is None:
+                dados = np.array(tabela[:n])
+                dados = dados[dados[:, 0] >= 0]
+                return dados[:, 0].astype(np.int64), dados[:, 1], dados[:, 2]
+            posicoes = self._posicoes(tipo, ids)
+            dados = np.array(tabela[np.maximum(posicoes, 0)])
+            dados[posicoes < 0, 1:] = np.nan
+            return np.asarray(ids, dtype=np.int64), dados[:, 1], dados[:, 2]
+
+    def distances(self, origem, destinos):
+        """
+        Distâncias em km de `origem` (`(tipo, id)`) para `destinos`, que é
+        uma lista de `(tipo, id)`. Pares cliente x depósito saem direto da
+        matriz em cache; os demais são calculados a partir das coordenadas.
+        Retorna um array alinhado com `destinos` (NaN quando desconhecido).
+        """
+        tipo_origem, id_origem = origem
+        outro = DEPOSITO if tipo_origem == CLIENTE else CLIENTE
+        resultado = np.full(len(destinos), np.nan)
+        tipos = np.array([tipo == outro for tipo, _ in destinos], dtype=bool)
+        ids = np.array([i for _, i in destinos], dtype=np.int64)
+        with self._lock:
+            self._sincronizar()
+
+            # Tipo oposto: leitura direta da matriz cliente x depósito.
+            if tipos.any():
+                origem_pos = self._posicao(tipo_origem, id_origem)
+                destino_pos = self._posicoes(outro, ids[tipos])
+                if origem_pos is not None:
+                    valores = np.full(len(destino_pos), np.nan)
+                    ok = destino_pos >= 0
+                    if tipo_origem == CLIENTE:
+                        valores[ok] = self._matriz[origem_pos, destino_pos[ok]]
+                    else:
+                        valores[ok] = self._matriz[destino_pos[ok], origem_pos]
+                    resultado[tipos] = valores
+
+            # Mesmo tipo: cálculo vetorizado a partir das coordenadas.
+            if (~tipos).any():
+                _, lat0, lon0 = self.coordinates(tipo_origem, [id_origem])
+                _, lat, lon = self.coordinates(tipo_origem, ids[~tipos])
+                resultado[~tipos] = haversine_matrix(lat0, lon0, lat, lon)[0]
+        return resultado
+
+
+# --- Instância do processo ---
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def _diretorio_do_cache():
+    return os.getenv(
+        'DISTANCE_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'casasbahia_distancias')
+    )
+
+
+def _carregar_do_banco(cache):
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute('SELECT cliente_id, gps_latitude_cliente, gps_longitude_cliente FROM cadeiraextensao.clientes;')
+        clientes = [(i, _float(lat), _float(lon)) for i, lat, lon in cur.fetchall()]
+        cur.execute('SELECT deposito_id, gps_latitude_deposito, gps_longitude_deposito FROM cadeiraextensao.depositos;')
+        depositos = [(i, _float(lat), _float(lon)) for i, lat, lon in cur.fetchall()]
+        cur.close()
+    cache.build(clientes, depositos)
+
+
+def get_distance_cache():
+    """
+    Retorna o cache do processo. Na primeira chamada, se os arquivos ainda
+    não existem (nenhum worker os criou), eles são montados a partir do banco.
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = DistanceCache(_diretorio_do_cache(), carregar=_carregar_do_banco)
+        if not _cache.exists():
+            _carregar_do_banco(_cache)
+        return _cache
+
+
+def _se_existir():
+    """O cache do processo, sem construí-lo (para os ganchos de escrita)."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = DistanceCache(_diretorio_do_cache(), carregar=_carregar_do_banco)
+    return _cache if _cache.exists() else None
+
+
+# --- Ganchos chamados pelos handlers de escrita ---
+# Se o cache ainda não foi construído não há nada a atualizar: a construção
+# lerá os dados já gravados no banco. Falhas no cache nunca devem derrubar a
+# requisição; nesse caso os arquivos são apagados para forçar uma
+# reconstrução no próximo uso (um worker que dê com eles sumidos no meio de
+# uma leitura reconstrói na hora, ver `_sincronizar`).
+
+def _atualizar(metodo, *args):
+    cache = _se_existir()
+    if cache is None:
+        return
+    try:
+        getattr(cache, metodo)(*args)
+    except (OSError, ValueError) as e:
+        print(f"Erro ao atualizar o cache de distâncias: {e}")
+        try:
+            os.remove(cache._caminho('meta.npy'))
+        except OSError:
+            pass
+
+
+def cliente_changed(cliente_id, lat, lon):
+    _atualizar('upsert_cliente', cliente_id, lat, lon)
+
+
+def clientes_changed(clientes):
+    _atualizar('upsert_clientes', clientes)
+
+
+def cliente_removed(cliente_id):
+    _atualizar('remove_cliente', cliente_id)
+
+
+def deposito_changed(deposito_id, lat, lon):
+    _atualizar('upsert_deposito', deposito_id, lat, lon)
+
+
+def deposito_removed(deposito_id):
+    _atualizar('remove_deposito', deposito_id)
@@ -0,0 +1,5 @@
+"""Exceções que os handlers do blueprint (`routes.py`) transformam em respostas de erro."""
+
+
+class InvalidRequestBody(ValueError):
+    """Levantada quando o corpo de uma escrita (unitária ou em lote) não pode ser lido."""
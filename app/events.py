@@ -0,0 +1,246 @@
+"""
+Eventos de entregas em tempo real (Server-Sent Events) a partir do
+`LISTEN/NOTIFY` do PostgreSQL.
+
+Um gatilho na tabela `entregas` (`SQL_GATILHO`, criado pela migração 3 de
+`app.migrations`) publica cada INSERT/UPDATE/DELETE no canal
+`entregas_eventos`. Cada worker tem uma única thread ouvinte, com uma
+conexão própria fora do pool, que distribui as notificações para as
+assinaturas em memória. Quem está esperando eventos não segura conexão com
+o banco, só uma fila pequena e um `threading.Event`.
+"""
+import json
+import os
+import select
+import threading
+import time
+from collections import deque
+
+from .db import get_db_connection
+
+CANAL = 'entregas_eventos'
+
+SQL_GATILHO = f"""
+CREATE OR REPLACE FUNCTION cadeiraextensao.notificar_entrega() RETURNS trigger AS $$
+DECLARE
+    linha cadeiraextensao.entregas;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        linha := OLD;
+    ELSE
+        linha := NEW;
+    END IF;
+    PERFORM pg_notify('{CANAL}', json_build_object(
+        'op', TG_OP,
+        'entrega_id', linha.entrega_id,
+        'rota_id', linha.rota_id,
+        'rota_id_anterior', CASE WHEN TG_OP = 'UPDATE' THEN OLD.rota_id END,
+        'cliente_id', linha.cliente_id,
+        'status_entrega', linha.status_entrega,
+        'sequencia_na_rota', linha.sequencia_na_rota
+    )::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS entregas_notificar ON cadeiraextensao.entregas;
+CREATE TRIGGER entregas_notificar
+    AFTER INSERT OR UPDATE OR DELETE ON cadeiraextensao.entregas
+    FOR EACH ROW EXECUTE FUNCTION cadeiraextensao.notificar_entrega();
+"""
+
+
+class EventLimitReached(Exception):
+    """Levantada quando o worker já tem o máximo de assinaturas abertas."""
+
+
+class Subscription:
+    """
+    Uma conexão SSE: fila limitada de eventos ainda não enviados. Se o
+    cliente não consome rápido o bastante, os mais antigos são descartados
+    e `perdeu_eventos` avisa que ele precisa recarregar o estado.
+    """
+
+    def __init__(self, rota_id=None, tamanho=256):
+        self.rota_id = rota_id
+        self.fila = deque(maxlen=tamanho)
+        self.sinal = threading.Event()
+        self.perdeu_eventos = False
+
+    def publicar(self, evento):
+        if len(self.fila) == self.fila.maxlen:
+            self.perdeu_eventos = True
+        self.fila.append(evento)
+        self.sinal.set()
+
+    def esperar(self, timeout):
+        """Espera até haver eventos (ou `timeout`) e devolve os pendentes."""
+        self.sinal.wait(timeout)
+        self.sinal.clear()
+        eventos = []
+        while self.fila:
+            eventos.append(self.fila.popleft())
+        return eventos
+
+
+class Broadcaster:
+    """
+    Ouvinte único do canal no worker e as assinaturas, indexadas por rota
+    para que cada notificação só percorra quem se interessa por ela.
+    """
+
+    def __init__(self, limite=10000, connect=get_db_connection):
+        self.limite = limite
+        self._connect = connect
+        self._lock = threading.Lock()
+        self._por_rota = {}
+        self._todas = set()
+        self._total = 0
+        self._thread = None
+        self.publicados = 0
+        self.reconexoes = 0
+
+    def subscribe(self, rota_id=None):
+        with self._lock:
+            if self._total >= self.limite:
+                raise EventLimitReached()
+            assinatura = Subscription(rota_id, int(os.getenv('SSE_QUEUE_SIZE', '256')))
+            if rota_id is None:
+                self._todas.add(assinatura)
+            else:
+                self._por_rota.setdefault(rota_id, set()).add(assinatura)
+            self._total += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._ouvir, name='entregas-listen', daemon=True)
+                self._thread.start()
+        return assinatura
+
+    def unsubscribe(self, assinatura):
+        """Cancela a assinatura; chamar de novo para a mesma não faz nada."""
+        with self._lock:
+            if assinatura.rota_id is None:
+                grupo = self._todas
+            else:
+                grupo = self._por_rota.get(assinatura.rota_id, set())
+            if assinatura in grupo:
+                grupo.discard(assinatura)
+                self._total -= 1
+                if assinatura.rota_id is not None and not grupo:
+                    del self._por_rota[assinatura.rota_id]
+
+    def publish(self, evento):
+        """Entrega `evento` (dicionário) às assinaturas interessadas."""
+        rotas = {evento.get('rota_id'), evento.get('rota_id_anterior')} - {None}
+        with self._lock:
+            destinos = list(self._todas)
+            for rota_id in rotas:
+                destinos.extend(self._por_rota.get(rota_id, ()))
+            self.publicados += 1
+        for assinatura in destinos:
+            assinatura.publicar(evento)
+
+    def _ouvir(self):
+        espera = 1
+        while True:
+            conn = self._connect()
+            if conn is None:
+                time.sleep(espera)
+                espera = min(espera * 2, 30)
+                continue
+            try:
+                conn.autocommit = True
+                cur = conn.cursor()
+                cur.execute(f'LISTEN {CANAL};')
+                cur.close()
+                espera = 1
+                while True:
+                    # O timeout só serve para perceber conexões mortas.
+                    prontos, _, _ = select.select([conn], [], [], 30)
+                    conn.poll()
+                    while conn.notifies:
+                        notificacao = conn.notifies.pop(0)
+                        try:
+                            self.publish(json.loads(notificacao.payload))
+                        except ValueError:
+                            continue
+                    if not prontos:
+                        cur = conn.cursor()
+                        cur.execute('SELECT 1;')
+                        cur.close()
+            except Exception as e:
+                print(f"Ouvinte de eventos desconectado: {e}")
+                self.reconexoes += 1
+            finally:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+            time.sleep(espera)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "assinaturas": self._total,
+                "rotas_assinadas": len(self._por_rota),
+                "publicados": self.publicados,
+                "reconexoes": self.reconexoes,
+            }
+
+
+_broadcaster = None
+_broadcaster_pid = None
+_broadcaster_lock = threading.Lock()
+
+
+def _apos_fork_no_filho():
+    global _broadcaster_lock
+    _broadcaster_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_apos_fork_no_filho)
+
+
+def get_broadcaster():
+    """O ouvinte deste processo (a thread só começa com a primeira assinatura)."""
+    global _broadcaster, _broadcaster_pid
+    with _broadcaster_lock:
+        if _broadcaster is None or _broadcaster_pid != os.getpid():
+            _broadcaster = Broadcaster(int(os.getenv('SSE_MAX_SUBSCRIBERS', '10000')))
+            _broadcaster_pid = os.getpid()
+        return _broadcaster
+
+
+def stats():
+    """Contadores do ouvinte deste processo, ou None se ele ainda não foi criado."""
+    with _broadcaster_lock:
+        ouvinte = _broadcaster if _broadcaster_pid == os.getpid() else None
+    return None if ouvinte is None else ouvinte.stats()
+
+
+def sse_stream(assinatura, heartbeat=None):
+    """
+    Gerador do corpo `text/event-stream` de uma assinatura. Manda um
+    comentário a cada `heartbeat` segundos sem eventos, para manter a
+    conexão viva em proxies, e cancela a assinatura ao terminar.
+    """
+    heartbeat = heartbeat or float(os.getenv('SSE_HEARTBEAT_S', '15'))
+    broadcaster = get_broadcaster()
+    sequencia = 0
+    try:
+        yield 'retry: 3000\n\n'
+        while True:
+            eventos = assinatura.esperar(heartbeat)
+            if assinatura.perdeu_eventos:
+                assinatura.perdeu_eventos = False
+                yield 'event: resync\ndata: {}\n\n'
+            if not eventos:
+                yield ': keepalive\n\n'
+                continue
+            partes = []
+            for evento in eventos:
+                sequencia += 1
+                partes.append(f'id: {sequencia}\nevent: entrega\ndata: {json.dumps(evento)}\n\n')
+            yield ''.join(partes)
+    finally:
+        broadcaster.unsubscribe(assinatura)
@@ -0,0 +1,128 @@
+from .pagination import InvalidQueryParameter
+from .resources import RECURSOS, ENTREGAS
+from .serialization import fetch_all
+
+# Expansões aceitas em `?include=` nas rotas. `entregas` só faz diferença
+# na listagem, já que `GET /rotas/<id>` sempre traz as entregas.
+INCLUDES_ROTAS = ('clientes', 'veiculo', 'motorista', 'depositos', 'entregas')
+
+
+# Tabelas de que cada expansão depende (para o ETag das respostas).
+_TABELAS = {
+    'clientes': ('entregas', 'clientes'),
+    'veiculo': ('veiculos',),
+    'motorista': ('motoristas',),
+    'depositos': ('depositos',),
+    'entregas': ('entregas',),
+}
+
+# Entregas de várias rotas de uma vez (`entregas` e `clientes`).
+SQL_ENTREGAS_DAS_ROTAS = (
+    f'SELECT {ENTREGAS.select} FROM {ENTREGAS.tabela} WHERE rota_id = ANY(%s) '
+    'ORDER BY rota_id, sequencia_na_rota, entrega_id;'
+)
+
+# Colunas da rota de que cada expansão precisa (mantidas mesmo com `?fields=`).
+COLUNAS = {
+    'clientes': (),
+    'veiculo': ('veiculo_id',),
+    'motorista': ('motorista_id',),
+    'depositos': ('deposito_partida_id', 'deposito_chegada_id'),
+    'entregas': (),
+}
+
+
+def parse_includes(args, permitidos=INCLUDES_ROTAS):
+    """Lê `?include=a,b` e valida cada nome contra `permitidos`."""
+    texto = args.get('include', '')
+    includes = {nome.strip() for nome in texto.split(',') if nome.strip()}
+    invalidos = includes - set(permitidos)
+    if invalidos:
+        raise InvalidQueryParameter(
+            f"include inválido: {', '.join(sorted(invalidos))} "
+            f"(aceitos: {', '.join(permitidos)})"
+        )
+    return includes
+
+
+def tables_for_includes(args):
+    """Tabelas lidas pelas expansões pedidas em `?include=`."""
+    return [tabela for nome in sorted(parse_includes(args)) for tabela in _TABELAS[nome]]
+
+
+def columns_for_includes(includes):
+    """Colunas da rota lidas pelas expansões em `includes`."""
+    return tuple(coluna for nome in sorted(includes) for coluna in COLUNAS[nome])
+
+
+def select_by_ids(tabela, chave):
+    """SELECT das linhas de `tabela` com `chave` em uma lista (`= ANY(%s)`)."""
+    recurso = RECURSOS[tabela]
+    return f'SELECT {recurso.select} FROM {recurso.tabela} WHERE {chave} = ANY(%s);'
+
+
+def _por_id(cur, tabela, chave, ids):
+    """
+    Busca de uma vez todas as linhas de `tabela` com `chave` em `ids` e
+    devolve um dicionário `id -> linha`. Uma consulta, seja qual for a
+    quantidade de ids.
+    """
+    ids = sorted({i for i in ids if i is not None})
+    if not ids:
+        return {}
+    cur.execute(select_by_ids(tabela, chave), (ids,))
+    return {linha[chave]: linha for linha in fetch_all(cur)}
+
+
+def expand_rotas(cur, rotas, includes):
+    """
+    Embute nas `rotas` (dicionários já serializados) os objetos pedidos em
+    `includes`, usando o cursor `cur` e no máximo uma consulta por tipo:
+
+    * `entregas`: lista `entregas` de cada rota, em ordem de sequência;
+    * `clientes`: objeto `cliente` em cada entrega (implica `entregas`);
+    * `veiculo`, `motorista`: objetos `veiculo` e `motorista`;
+    * `depositos`: objetos `deposito_partida` e `deposito_chegada`.
+
+    Rotas que já trazem `entregas` não são consultadas de novo.
+    """
+    if not rotas or not includes:
+        return rotas
+
+    if 'entregas' in includes or 'clientes' in includes:
+        faltando = [r['rota_id'] for r in rotas if 'entregas' not in r]
+        if faltando:
+            cur.execute(SQL_ENTREGAS_DAS_ROTAS, (faltando,))
+            por_rota = {rota_id: [] for rota_id in faltando}
+            for entrega in fetch_all(cur):
+                por_rota[entrega['rota_id']].append(entrega)
+            for rota in rotas:
+                if 'entregas' not in rota:
+                    rota['entregas'] = por_rota[rota['rota_id']]
+
+    if 'clientes' in includes:
+        entregas = [e for r in rotas for e in r['entregas']]
+        clientes = _por_id(cur, 'clientes', 'cliente_id', (e['cliente_id'] for e in entregas))
+        for entrega in entregas:
+            entrega['cliente'] = clientes.get(entrega['cliente_id'])
+
+    if 'veiculo' in includes:
+        veiculos = _por_id(cur, 'veiculos', 'veiculo_id', (r['veiculo_id'] for r in rotas))
+        for rota in rotas:
+            rota['veiculo'] = veiculos.get(rota['veiculo_id'])
+
+    if 'motorista' in includes:
+        motoristas = _por_id(cur, 'motoristas', 'motorista_id', (r['motorista_id'] for r in rotas))
+        for rota in rotas:
+            rota['motorista'] = motoristas.get(rota['motorista_id'])
+
+    if 'depositos' in includes:
+        depositos = _por_id(
+            cur, 'depositos', 'deposito_id',
+            [r['deposito_partida_id'] for r in rotas] + [r['deposito_chegada_id'] for r in rotas]
+        )
+        for rota in rotas:
+            rota['deposito_partida'] = depositos.get(rota['deposito_partida_id'])
+            rota['deposito_chegada'] = depositos.get(rota['deposito_chegada_id'])
+
+    return rotas
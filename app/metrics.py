@@ -0,0 +1,391 @@
+"""
+Métricas por endpoint no formato de texto do Prometheus (`GET /api/metrics`).
+
+Para cada endpoint do blueprint são registrados histogramas de:
+
+    casasbahia_http_request_duration_seconds   tempo total da requisição
+    casasbahia_db_checkout_seconds             espera por conexão do pool
+    casasbahia_db_query_seconds                tempo nas consultas
+    casasbahia_db_rows                         linhas lidas ou alteradas
+    casasbahia_serialization_seconds           conversão das linhas e JSON
+    casasbahia_compression_seconds             CPU gasta na compressão
+
+além de um contador de requisições por endpoint e status e dos medidores do
+pool, do cache, da fila de escrita adiada, dos eventos SSE e da compressão.
+
+Os tempos de banco e de serialização são acumulados numa `Medicao` da
+requisição atual (um `ContextVar`, que também funciona com gevent): o cursor
+de `db.py`, `db_connection()`, `serialization.py` e o JSON do Flask só
+somam nela, sem lock. Os histogramas são agregados por thread: cada thread
+escreve só nos seus próprios contadores, e a soma entre threads é feita na
+hora de ler.
+
+Com vários workers do gunicorn, cada um grava de tempos em tempos
+(`METRICS_FLUSH_S`, padrão 5 s) um retrato das suas métricas em
+`<METRICS_DIR>/<pid>.json`; quem atende `/api/metrics` soma os retratos de
+todos os workers vivos. Os medidores vêm com o rótulo `worker` (o pid).
+"""
+import contextvars
+import json
+import os
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+
+PREFIXO = 'casasbahia'
+
+_SEGUNDOS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+_LINHAS = (0, 1, 10, 100, 1000, 10000, 100000)
+
+# nome -> (ajuda, limites dos buckets)
+HISTOGRAMAS = {
+    'http_request_duration_seconds': ('Tempo total da requisição', _SEGUNDOS),
+    'db_checkout_seconds': ('Espera por uma conexão do pool na requisição', _SEGUNDOS),
+    'db_query_seconds': ('Tempo gasto em consultas na requisição', _SEGUNDOS),
+    'db_rows': ('Linhas lidas ou alteradas pelas consultas da requisição', _LINHAS),
+    'serialization_seconds': ('Conversão das linhas do banco e geração do JSON na requisição', _SEGUNDOS),
+    'compression_seconds': ('CPU gasta comprimindo a resposta', _SEGUNDOS),
+}
+
+
+class Medicao:
+    """Acumuladores de uma requisição em andamento."""
+
+    __slots__ = ('inicio', 'checkout', 'consulta', 'linhas', 'serializacao', 'ate_fechar')
+
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.checkout = 0.0
+        self.consulta = 0.0
+        self.linhas = 0
+        self.serializacao = 0.0
+        # O corpo é gerado depois do handler: a medição termina no close.
+        self.ate_fechar = False
+
+
+_atual = contextvars.ContextVar('casasbahia_medicao', default=None)
+
+
+def current():
+    """A `Medicao` da requisição atual, ou None fora de uma requisição."""
+    return _atual.get()
+
+
+# --- Agregação por thread ---
+
+try:
+    # Com o worker gevent, `threading.local` vira local da greenlet e cada
+    # requisição entraria no registro; as greenlets de uma thread de verdade
+    # não se interrompem no meio de um `+=`, então podem dividir os dicionários.
+    from gevent.monkey import get_original
+    _thread_local = get_original('threading', 'local')
+except ImportError:
+    _thread_local = threading.local
+
+
+class _Local(_thread_local):
+    def __init__(self):
+        # Os dicionários (não o `threading.local`) entram no registro, para
+        # continuarem visíveis para as outras threads, mesmo depois que a
+        # thread dona terminar.
+        self.histogramas = {}     # (nome, endpoint) -> [bucket..., +Inf, soma]
+        self.requisicoes = {}     # (endpoint, status) -> quantidade
+        with _registro_lock:
+            _registro.append((self.histogramas, self.requisicoes))
+
+
+_registro = []
+_registro_lock = threading.Lock()
+_local = _Local()
+
+
+def _apos_fork_no_filho():
+    global _registro, _registro_lock, _local, _ultimo_retrato
+    # O filho começa do zero; as métricas do pai são do pai.
+    _registro = []
+    _registro_lock = threading.Lock()
+    _local = _Local()
+    _ultimo_retrato = 0.0
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_apos_fork_no_filho)
+
+
+def observe(nome, endpoint, valor):
+    """Registra `valor` no histograma `nome` do `endpoint`."""
+    limites = HISTOGRAMAS[nome][1]
+    dados = _local.histogramas
+    serie = dados.get((nome, endpoint))
+    if serie is None:
+        serie = dados[(nome, endpoint)] = [0] * (len(limites) + 1) + [0.0]
+    serie[bisect_left(limites, valor)] += 1
+    serie[-1] += valor
+
+
+def _contar_requisicao(endpoint, status):
+    dados = _local.requisicoes
+    chave = (endpoint, status)
+    dados[chave] = dados.get(chave, 0) + 1
+
+
+def _somar_threads():
+    """Histogramas e contadores deste processo, somados entre as threads."""
+    with _registro_lock:
+        locais = list(_registro)
+    histogramas, requisicoes = {}, {}
+    for dados_histogramas, dados_requisicoes in locais:
+        for chave, serie in list(dados_histogramas.items()):
+            total = histogramas.setdefault(chave, [0] * (len(serie) - 1) + [0.0])
+            for i, valor in enumerate(serie):
+                total[i] += valor
+        for chave, quantidade in list(dados_requisicoes.items()):
+            requisicoes[chave] = requisicoes.get(chave, 0) + quantidade
+    return histogramas, requisicoes
+
+
+# --- Middleware ---
+
+def _endpoint():
+    from flask import request
+    return request.endpoint or 'nao_encontrado'
+
+
+def _inicio():
+    _atual.set(Medicao())
+
+
+def _fim(status):
+    medicao = _atual.get()
+    if medicao is None:
+        return
+    _atual.set(None)
+    _registrar(medicao, _endpoint(), status)
+
+
+def _fim_ao_fechar(medicao, endpoint, status):
+    if _atual.get() is medicao:
+        _atual.set(None)
+    _registrar(medicao, endpoint, status)
+
+
+def _registrar(medicao, endpoint, status):
+    observe('http_request_duration_seconds', endpoint, time.perf_counter() - medicao.inicio)
+    observe('db_checkout_seconds', endpoint, medicao.checkout)
+    observe('db_query_seconds', endpoint, medicao.consulta)
+    observe('db_rows', endpoint, medicao.linhas)
+    observe('serialization_seconds', endpoint, medicao.serializacao)
+    _contar_requisicao(endpoint, status)
+    _talvez_gravar_retrato()
+
+
+def init_app(app):
+    """Liga a medição em todas as requisições de `app`."""
+    from flask.json.provider import DefaultJSONProvider
+
+    class JSONMedido(DefaultJSONProvider):
+        def dumps(self, obj, **kwargs):
+            medicao = _atual.get()
+            if medicao is None:
+                return super().dumps(obj, **kwargs)
+            inicio = time.perf_counter()
+            texto = super().dumps(obj, **kwargs)
+            medicao.serializacao += time.perf_counter() - inicio
+            return texto
+
+    app.json = JSONMedido(app)
+
+    @app.before_request
+    def _metricas_inicio():
+        _inicio()
+
+    @app.after_request
+    def _metricas_fim(response):
+        medicao = _atual.get()
+        if medicao is not None and response.is_streamed:
+            # Streaming, NDJSON, SSE e arquivos: o servidor ainda vai gerar o
+            # corpo, com as consultas dele somando nesta medição, que só
+            # termina quando a resposta for fechada.
+            medicao.ate_fechar = True
+            endpoint, status = _endpoint(), response.status_code
+            response.call_on_close(lambda: _fim_ao_fechar(medicao, endpoint, status))
+        else:
+            _fim(response.status_code)
+        return response
+
+    @app.teardown_request
+    def _metricas_erro(_erro):
+        # Só sobra medição aqui se uma exceção pulou o after_request.
+        medicao = _atual.get()
+        if medicao is not None and not medicao.ate_fechar:
+            _fim(500)
+
+
+# --- Retratos por worker ---
+
+_ultimo_retrato = 0.0
+
+
+def _diretorio():
+    return os.getenv('METRICS_DIR', os.path.join(tempfile.gettempdir(), 'casasbahia_metricas'))
+
+
+def _medidores():
+    """Valores atuais do pool, do cache, da fila e dos eventos deste worker."""
+    from . import cache, compression, events, slowlog, write_queue
+    from .db import pool_stats
+
+    medidores = {}
+    pool = pool_stats()
+    if pool is not None:
+        for nome in ('in_use', 'idle', 'waiting', 'max', 'checkouts', 'timeouts', 'discarded'):
+            medidores[f'db_pool_{nome}'] = pool[nome]
+        medidores['db_pool_wait_seconds_total'] = pool['wait_time_total_s']
+    dados_cache = cache.stats()
+    medidores['cache_enabled'] = int(dados_cache['enabled'])
+    for nome in ('hits', 'misses', 'sets', 'invalidations', 'errors', 'size', 'evictions', 'expirations'):
+        if nome in dados_cache:
+            medidores[f'cache_{nome}'] = dados_cache[nome]
+    for prefixo, dados in (('write_queue', write_queue.stats()), ('sse', events.stats())):
+        for nome, valor in (dados or {}).items():
+            medidores[f'{prefixo}_{nome}'] = valor
+    lentas = slowlog.stats()
+    medidores['db_slow_queries'] = lentas['registradas']
+    medidores['db_slow_queries_explained'] = lentas['explicadas']
+    for nome, valor in compression.stats().items():
+        if isinstance(valor, dict):
+            for contador, total in valor.items():
+                medidores[f'compression_{nome}_{contador}'] = total
+        else:
+            medidores[f'compression_{nome}'] = valor
+    return medidores
+
+
+def _retrato():
+    histogramas, requisicoes = _somar_threads()
+    return {
+        'pid': os.getpid(),
+        'histogramas': [[nome, endpoint, serie] for (nome, endpoint), serie in histogramas.items()],
+        'requisicoes': [[endpoint, status, n] for (endpoint, status), n in requisicoes.items()],
+        'medidores': _medidores(),
+    }
+
+
+def _gravar_retrato(retrato):
+    diretorio = _diretorio()
+    try:
+        os.makedirs(diretorio, exist_ok=True)
+        fd, temporario = tempfile.mkstemp(dir=diretorio, suffix='.tmp')
+        with os.fdopen(fd, 'w') as arquivo:
+            json.dump(retrato, arquivo)
+        os.replace(temporario, os.path.join(diretorio, f"{retrato['pid']}.json"))
+    except OSError as e:
+        print(f"Erro ao gravar as métricas do worker: {e}")
+
+
+def _talvez_gravar_retrato():
+    global _ultimo_retrato
+    agora = time.monotonic()
+    if agora - _ultimo_retrato < float(os.getenv('METRICS_FLUSH_S', '5')):
+        return
+    _ultimo_retrato = agora
+    _gravar_retrato(_retrato())
+
+
+def _vivo(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _retratos():
+    """O retrato atual deste worker mais os gravados pelos outros workers vivos."""
+    global _ultimo_retrato
+    proprio = _retrato()
+    _gravar_retrato(proprio)
+    _ultimo_retrato = time.monotonic()
+    retratos = [proprio]
+    diretorio = _diretorio()
+    try:
+        nomes = os.listdir(diretorio)
+    except OSError:
+        nomes = []
+    for nome in nomes:
+        if not nome.endswith('.json') or nome == f'{os.getpid()}.json':
+            continue
+        caminho = os.path.join(diretorio, nome)
+        try:
+            pid = int(nome[:-5])
+            if not _vivo(pid):
+                # Worker que morreu (ou de uma execução anterior).
+                os.remove(caminho)
+                continue
+            with open(caminho) as arquivo:
+                retratos.append(json.load(arquivo))
+        except (ValueError, OSError) as e:
+            print(f"Erro ao ler as métricas de {nome}: {e}")
+    return retratos
+
+
+# --- Formato de texto do Prometheus ---
+
+def _rotulos(**rotulos):
+    def escapar(valor):
+        return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{nome}="{escapar(valor)}"' for nome, valor in rotulos.items()) + '}'
+
+
+def _numero(valor):
+    if valor == float('inf'):
+        return '+Inf'
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+def render():
+    """Todas as métricas, de todos os workers, no formato de texto do Prometheus."""
+    retratos = _retratos()
+    histogramas, requisicoes = {}, {}
+    for retrato in retratos:
+        for nome, endpoint, serie in retrato['histogramas']:
+            total = histogramas.setdefault((nome, endpoint), [0] * (len(serie) - 1) + [0.0])
+            for i, valor in enumerate(serie):
+                total[i] += valor
+        for endpoint, status, n in retrato['requisicoes']:
+            requisicoes[(endpoint, status)] = requisicoes.get((endpoint, status), 0) + n
+
+    linhas = []
+    for nome, (ajuda, limites) in HISTOGRAMAS.items():
+        metrica = f'{PREFIXO}_{nome}'
+        linhas.append(f'# HELP {metrica} {ajuda}')
+        linhas.append(f'# TYPE {metrica} histogram')
+        for (nome_serie, endpoint), serie in sorted(histogramas.items()):
+            if nome_serie != nome:
+                continue
+            acumulado = 0
+            for limite, quantidade in zip(limites + (float('inf'),), serie):
+                acumulado += quantidade
+                linhas.append(f'{metrica}_bucket{_rotulos(endpoint=endpoint, le=_numero(limite))} {acumulado}')
+            linhas.append(f'{metrica}_sum{_rotulos(endpoint=endpoint)} {_numero(serie[-1])}')
+            linhas.append(f'{metrica}_count{_rotulos(endpoint=endpoint)} {acumulado}')
+
+    metrica = f'{PREFIXO}_http_requests_total'
+    linhas.append(f'# HELP {metrica} Requisições atendidas, por endpoint e status')
+    linhas.append(f'# TYPE {metrica} counter')
+    for (endpoint, status), n in sorted(requisicoes.items()):
+        linhas.append(f'{metrica}{_rotulos(endpoint=endpoint, status=status)} {n}')
+
+    medidores = {}
+    for retrato in retratos:
+        for nome, valor in retrato['medidores'].items():
+            medidores.setdefault(nome, []).append((retrato['pid'], valor))
+    for nome, valores in sorted(medidores.items()):
+        metrica = f'{PREFIXO}_{nome}'
+        linhas.append(f'# TYPE {metrica} gauge')
+        for pid, valor in sorted(valores):
+            linhas.append(f'{metrica}{_rotulos(worker=pid)} {_numero(valor)}')
+    return '\n'.join(linhas) + '\n'
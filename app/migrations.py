@@ -0,0 +1,200 @@
+"""
+Migrações versionadas do schema `cadeiraextensao`.
+
+Cada migração é um bloco de SQL com um número de versão; as já aplicadas
+ficam registradas em `cadeiraextensao.schema_migrations`, e
+`python -m app.migrations` aplica as que faltam, em ordem, cada uma na sua
+transação. Um advisory lock impede que dois deploys migrem ao mesmo tempo.
+
+A versão 1 cria o schema com `IF NOT EXISTS`, então também pode ser
+aplicada no banco que já existia antes das migrações: nada é recriado, só
+passa a ser registrado.
+
+Uso:
+    python -m app.migrations            # aplica as pendentes
+    python -m app.migrations status     # lista aplicadas e pendentes
+"""
+import sys
+
+from .dashboard import SQL_ESTATISTICAS
+from .db import get_db_connection
+from .events import SQL_GATILHO
+from .sync import SQL_SYNC
+
+# Chave do advisory lock das migrações (qualquer número fixo serve).
+_LOCK = 827_331_001
+
+SQL_SCHEMA = """
+CREATE SCHEMA IF NOT EXISTS cadeiraextensao;
+
+CREATE TABLE IF NOT EXISTS cadeiraextensao.clientes (
+    cliente_id serial PRIMARY KEY,
+    nome_cliente varchar(255) NOT NULL,
+    endereco_cliente varchar(255),
+    gps_latitude_cliente numeric(9, 6),
+    gps_longitude_cliente numeric(9, 6),
+    telefone_cliente varchar(20),
+    email_cliente varchar(255)
+);
+
+CREATE TABLE IF NOT EXISTS cadeiraextensao.depositos (
+    deposito_id serial PRIMARY KEY,
+    nome_deposito varchar(255) NOT NULL,
+    endereco_deposito varchar(255),
+    gps_latitude_deposito numeric(9, 6),
+    gps_longitude_deposito numeric(9, 6)
+);
+
+CREATE TABLE IF NOT EXISTS cadeiraextensao.veiculos (
+    veiculo_id serial PRIMARY KEY,
+    placa_veiculo varchar(10) NOT NULL UNIQUE,
+    modelo_veiculo varchar(100),
+    ano_fabricacao integer,
+    status_veiculo varchar(50) DEFAULT 'Disponível',
+    deposito_id_base integer REFERENCES cadeiraextensao.depositos (deposito_id)
+);
+
+CREATE TABLE IF NOT EXISTS cadeiraextensao.motoristas (
+    motorista_id serial PRIMARY KEY,
+    nome_motorista varchar(255) NOT NULL,
+    cpf_motorista varchar(14) NOT NULL UNIQUE,
+    cnh_motorista varchar(20) UNIQUE,
+    telefone_motorista varchar(20)
+);
+
+CREATE TABLE IF NOT EXISTS cadeiraextensao.rotas (
+    rota_id serial PRIMARY KEY,
+    veiculo_id integer REFERENCES cadeiraextensao.veiculos (veiculo_id),
+    motorista_id integer REFERENCES cadeiraextensao.motoristas (motorista_id),
+    deposito_partida_id integer REFERENCES cadeiraextensao.depositos (deposito_id),
+    deposito_chegada_id integer REFERENCES cadeiraextensao.depositos (deposito_id),
+    data_rota date NOT NULL,
+    horario_saida_previsto time,
+    horario_chegada_previsto time,
+    status_rota varchar(50) DEFAULT 'Planejada'
+);
+
+CREATE TABLE IF NOT EXISTS cadeiraextensao.entregas (
+    entrega_id serial PRIMARY KEY,
+    rota_id integer REFERENCES cadeiraextensao.rotas (rota_id),
+    cliente_id integer NOT NULL REFERENCES cadeiraextensao.clientes (cliente_id),
+    sequencia_na_rota integer,
+    status_entrega varchar(50) DEFAULT 'Pendente',
+    data_hora_prevista_entrega timestamp,
+    data_hora_real_entrega timestamp,
+    observacoes text
+);
+"""
+
+# Índices dos predicados quentes de `routes.py`. As chaves estrangeiras
+# também ganham índice: sem ele, apagar um cliente, rota ou depósito lê a
+# tabela filha inteira.
+SQL_INDICES = """
+-- GET /rotas/<id>, include=entregas, DELETE /rotas/<id>, PATCH /rotas/<id>/entregas
+CREATE INDEX IF NOT EXISTS entregas_rota_sequencia_idx
+    ON cadeiraextensao.entregas (rota_id, sequencia_na_rota);
+-- DELETE /clientes/<id>, filtro cliente_id
+CREATE INDEX IF NOT EXISTS entregas_cliente_idx
+    ON cadeiraextensao.entregas (cliente_id);
+-- POST /rotas/planejar: entregas pendentes sem rota
+CREATE INDEX IF NOT EXISTS entregas_pendentes_sem_rota_idx
+    ON cadeiraextensao.entregas (entrega_id)
+    WHERE rota_id IS NULL AND status_entrega = 'Pendente';
+
+-- Filtros data_rota*, e o filtro de data das entregas
+CREATE INDEX IF NOT EXISTS rotas_data_idx
+    ON cadeiraextensao.rotas (data_rota);
+-- POST /rotas/planejar: veículos e motoristas sem rota na data; filtros
+CREATE INDEX IF NOT EXISTS rotas_veiculo_data_idx
+    ON cadeiraextensao.rotas (veiculo_id, data_rota);
+CREATE INDEX IF NOT EXISTS rotas_motorista_data_idx
+    ON cadeiraextensao.rotas (motorista_id, data_rota);
+CREATE INDEX IF NOT EXISTS rotas_deposito_partida_idx
+    ON cadeiraextensao.rotas (deposito_partida_id);
+CREATE INDEX IF NOT EXISTS rotas_deposito_chegada_idx
+    ON cadeiraextensao.rotas (deposito_chegada_id);
+
+CREATE INDEX IF NOT EXISTS veiculos_deposito_base_idx
+    ON cadeiraextensao.veiculos (deposito_id_base);
+"""
+
+# (versão, nome, SQL). Nunca altere uma migração já publicada: crie outra.
+MIGRACOES = [
+    (1, 'schema', SQL_SCHEMA),
+    (2, 'indices', SQL_INDICES),
+    (3, 'eventos_entregas', SQL_GATILHO),
+    (4, 'sincronizacao', SQL_SYNC),
+    (5, 'estatisticas', SQL_ESTATISTICAS),
+]
+
+_SQL_CONTROLE = """
+CREATE SCHEMA IF NOT EXISTS cadeiraextensao;
+CREATE TABLE IF NOT EXISTS cadeiraextensao.schema_migrations (
+    versao integer PRIMARY KEY,
+    nome text NOT NULL,
+    aplicada_em timestamptz NOT NULL DEFAULT now()
+);
+"""
+
+
+def applied(conn):
+    """Versões já aplicadas no banco de `conn`."""
+    cur = conn.cursor()
+    cur.execute(_SQL_CONTROLE)
+    cur.execute('SELECT versao FROM cadeiraextensao.schema_migrations;')
+    versoes = {linha[0] for linha in cur.fetchall()}
+    conn.commit()
+    cur.close()
+    return versoes
+
+
+def migrate(conn, alvo=None):
+    """
+    Aplica, em ordem, as migrações pendentes até a versão `alvo` (todas por
+    padrão) e devolve a lista das versões aplicadas agora.
+    """
+    cur = conn.cursor()
+    cur.execute('SELECT pg_advisory_lock(%s);', (_LOCK,))
+    try:
+        ja_aplicadas = applied(conn)
+        aplicadas = []
+        for versao, nome, sql in MIGRACOES:
+            if versao in ja_aplicadas or (alvo is not None and versao > alvo):
+                continue
+            try:
+                cur.execute(sql)
+                cur.execute(
+                    'INSERT INTO cadeiraextensao.schema_migrations (versao, nome) VALUES (%s, %s);',
+                    (versao, nome)
+                )
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            aplicadas.append(versao)
+        return aplicadas
+    finally:
+        cur.execute('SELECT pg_advisory_unlock(%s);', (_LOCK,))
+        conn.commit()
+        cur.close()
+
+
+if __name__ == '__main__':
+    comando = sys.argv[1] if len(sys.argv) > 1 else 'aplicar'
+    if comando not in ('aplicar', 'status'):
+        print('uso: python -m app.migrations [aplicar|status]')
+        sys.exit(2)
+    conexao = get_db_connection()
+    if conexao is None:
+        sys.exit(1)
+    try:
+        if comando == 'status':
+            ja_aplicadas = applied(conexao)
+            for versao, nome, _ in MIGRACOES:
+                print(f"{versao:4d} {nome:<20} {'aplicada' if versao in ja_aplicadas else 'pendente'}")
+        else:
+            aplicadas = migrate(conexao)
+            print(f"Migrações aplicadas: {', '.join(map(str, aplicadas))}" if aplicadas
+                  else 'Nenhuma migração pendente.')
+    finally:
+        conexao.close()
@@ -0,0 +1,188 @@
+import os
+from datetime import date
+from urllib.parse import urlencode
+
+from flask import jsonify, request
+
+
+class InvalidQueryParameter(ValueError):
+    """Levantada quando um parâmetro de consulta (query string) é inválido."""
+
+
+class Filtro:
+    """
+    Um filtro de listagem: o fragmento SQL do WHERE (com um único `%s`), a
+    função que converte o valor recebido na query string e as outras
+    tabelas que o fragmento lê (para o ETag da listagem, `conditional.py`).
+    """
+
+    def __init__(self, condicao, conversor=str, tabelas=()):
+        self.condicao = condicao
+        self.conversor = conversor
+        self.tabelas = tabelas
+
+
+def tables_for_filters(filtros, args):
+    """Outras tabelas lidas pelos filtros de `filtros` presentes em `args`."""
+    return [tabela for nome, filtro in filtros.items() if args.get(nome) for tabela in filtro.tabelas]
+
+
+def _data(valor):
+    return date.fromisoformat(valor)
+
+
+# --- Filtros aceitos por recurso ---
+# Apenas os nomes listados aqui viram condições no WHERE; qualquer outro
+# parâmetro da query string é ignorado, então nada vindo do cliente é
+# interpolado diretamente no SQL.
+
+FILTROS_CLIENTES = {}
+
+FILTROS_DEPOSITOS = {}
+
+FILTROS_VEICULOS = {
+    'status_veiculo': Filtro('status_veiculo = %s'),
+    'deposito_id_base': Filtro('deposito_id_base = %s', int),
+}
+
+FILTROS_MOTORISTAS = {}
+
+FILTROS_ROTAS = {
+    'status_rota': Filtro('status_rota = %s'),
+    'veiculo_id': Filtro('veiculo_id = %s', int),
+    'motorista_id': Filtro('motorista_id = %s', int),
+    'data_rota': Filtro('data_rota = %s', _data),
+    'data_rota_de': Filtro('data_rota >= %s', _data),
+    'data_rota_ate': Filtro('data_rota <= %s', _data),
+}
+
+FILTROS_ENTREGAS = {
+    'status_entrega': Filtro('status_entrega = %s'),
+    'rota_id': Filtro('rota_id = %s', int),
+    'cliente_id': Filtro('cliente_id = %s', int),
+    # Entregas não têm data própria: o intervalo é o da rota a que pertencem.
+    # Para um único dia, `= ANY(ARRAY(...))` lê as poucas rotas do dia e
+    # busca as entregas pelo índice de rota_id; com `IN (SELECT ...)` o
+    # planejador prefere ler a tabela de entregas inteira.
+    'data_rota': Filtro('rota_id = ANY(ARRAY(SELECT rota_id FROM cadeiraextensao.rotas WHERE data_rota = %s))',
+                        _data, ('rotas',)),
+    'data_rota_de': Filtro('rota_id IN (SELECT rota_id FROM cadeiraextensao.rotas WHERE data_rota >= %s)',
+                           _data, ('rotas',)),
+    'data_rota_ate': Filtro('rota_id IN (SELECT rota_id FROM cadeiraextensao.rotas WHERE data_rota <= %s)',
+                            _data, ('rotas',)),
+}
+
+
+def _limites():
+    return (
+        int(os.getenv('API_PAGE_DEFAULT_LIMIT', '100')),
+        int(os.getenv('API_PAGE_MAX_LIMIT', '1000')),
+    )
+
+
+class ListQuery:
+    """
+    Consulta de listagem com paginação por chave (keyset) e filtros.
+
+    A ordenação é sempre pela chave primária, então `?after=<id>` retoma
+    exatamente de onde a página anterior parou usando o índice da PK, sem o
+    custo crescente de um OFFSET. A paginação só é aplicada quando `after`
+    ou `limit` são informados; sem eles a listagem continua completa, como
+    antes. `colunas` é a lista do SELECT (a chave precisa estar nela).
+    """
+
+    def __init__(self, tabela, chave, filtros, args, colunas='*'):
+        self.tabela = tabela
+        self.chave = chave
+        self.colunas = colunas
+        self.after = self._inteiro(args, 'after')
+        self.limit = self._inteiro(args, 'limit')
+        self._limit_pedido = self.limit
+        self.paginada = self.after is not None or self.limit is not None
+
+        limite_padrao, limite_maximo = _limites()
+        if self.paginada:
+            if self.limit is None:
+                self.limit = limite_padrao
+            if self.limit < 1:
+                raise InvalidQueryParameter("O parâmetro 'limit' deve ser maior que zero")
+            self.limit = min(self.limit, limite_maximo)
+
+        condicoes = []
+        self.params = []
+        for nome, filtro in filtros.items():
+            valor = args.get(nome)
+            if valor is None or valor == '':
+                continue
+            try:
+                self.params.append(filtro.conversor(valor))
+            except ValueError:
+                raise InvalidQueryParameter(f"Valor inválido para o filtro '{nome}': {valor}")
+            condicoes.append(filtro.condicao)
+        if self.after is not None:
+            condicoes.append(f'{chave} > %s')
+            self.params.append(self.after)
+        self.condicoes = condicoes
+
+    @staticmethod
+    def _inteiro(args, nome):
+        valor = args.get(nome)
+        if valor is None or valor == '':
+            return None
+        try:
+            return int(valor)
+        except ValueError:
+            raise InvalidQueryParameter(f"O parâmetro '{nome}' deve ser um número inteiro")
+
+    def where(self):
+        """Cláusula WHERE (ou string vazia) com os filtros e o cursor."""
+        if not self.condicoes:
+            return ''
+        return ' WHERE ' + ' AND '.join(self.condicoes)
+
+    def _select(self, limite):
+        sql = f'SELECT {self.colunas} FROM {self.tabela}{self.where()} ORDER BY {self.chave}'
+        if limite is not None:
+            sql += f' LIMIT {limite}'
+        return sql + ';'
+
+    @property
+    def sql(self):
+        # Busca uma linha a mais que o limite para saber se há próxima página.
+        return self._select(self.limit + 1 if self.paginada else None)
+
+    @property
+    def sql_stream(self):
+        """
+        Mesma consulta para o modo streaming: respeita filtros e `after`
+        (útil para retomar um dump interrompido), mas só limita o número de
+        linhas se `limit` tiver sido pedido explicitamente.
+        """
+        return self._select(self._limit_pedido)
+
+    def pagina(self, linhas):
+        """
+        Corta a linha extra e retorna `(linhas, proximo_cursor)`; o cursor é
+        a chave da última linha devolvida, ou None quando não há mais páginas.
+        """
+        if not self.paginada or len(linhas) <= self.limit:
+            return linhas, None
+        linhas = linhas[:self.limit]
+        return linhas, linhas[-1][self.chave]
+
+    def response(self, dados, proximo_cursor):
+        """
+        Resposta JSON com a lista. O corpo continua sendo uma lista simples;
+        o cursor da próxima página vai nos cabeçalhos `X-Next-Cursor` e `Link`.
+        """
+        resposta = jsonify(dados)
+        if proximo_cursor is not None:
+            resposta.headers['X-Next-Cursor'] = str(proximo_cursor)
+            resposta.headers['Link'] = f'<{self._url_proxima(proximo_cursor)}>; rel="next"'
+        return resposta
+
+    def _url_proxima(self, proximo_cursor):
+        args = request.args.to_dict()
+        args['after'] = proximo_cursor
+        args['limit'] = self.limit
+        return f'{request.base_url}?{urlencode(args)}'
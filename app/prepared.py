@@ -0,0 +1,146 @@
+"""
+Prepared statements do lado do servidor para as consultas mais frequentes.
+
+Cada `PreparedStatement` é declarado uma vez (aqui ou em `resources.py`)
+com o SQL no formato do psycopg2 (`%s`) e os tipos dos parâmetros. Na
+primeira execução numa conexão ele é preparado com `PREPARE`; daí em diante
+a conexão só recebe `EXECUTE nome (...)`, e o PostgreSQL não precisa
+interpretar e planejar o SQL de novo.
+
+O que já foi preparado é lembrado por conexão (`WeakKeyDictionary`), então
+uma conexão nova do pool (ex: depois de uma reconexão) prepara tudo outra
+vez sem nenhum cuidado extra. Se o servidor perdeu um statement (ex:
+`DISCARD ALL`) ou uma migração mudou as colunas de uma tabela lida ("cached
+plan must not change result type"), todos os statements daquela conexão são
+descartados (`DEALLOCATE ALL`) e preparados de novo: na hora, se o erro veio
+no primeiro comando da transação, ou no próximo uso.
+
+`DB_PREPARED=0` desliga tudo e executa o SQL diretamente (necessário com
+poolers em modo transação, como o PgBouncer, em que cada transação pode cair
+numa conexão diferente do servidor).
+"""
+import os
+import re
+import threading
+import weakref
+
+from psycopg2 import errors, extensions
+
+# Erros que indicam que o statement preparado não vale mais na conexão.
+_PERDIDO = errors.InvalidSqlStatementName          # 26000: não existe (mais)
+_DESATUALIZADO = errors.FeatureNotSupported         # 0A000: colunas mudaram
+
+
+def _ativo():
+    return os.getenv('DB_PREPARED', '1') != '0'
+
+
+def _numerar(sql):
+    """Troca os `%s` do psycopg2 por `$1, $2, ...` e `%%` por `%`."""
+    contador = iter(range(1, 1000))
+    return re.sub(r'%%|%s', lambda m: '%' if m.group() == '%%' else f'${next(contador)}', sql)
+
+
+class _Estado:
+    """O que está preparado numa conexão."""
+
+    def __init__(self):
+        self.preparados = set()
+        # Os statements do servidor não batem mais com `preparados`.
+        self.descartar = False
+
+
+_estados = weakref.WeakKeyDictionary()
+_estados_lock = threading.Lock()
+
+
+def _estado(conn):
+    with _estados_lock:
+        estado = _estados.get(conn)
+        if estado is None:
+            estado = _estados[conn] = _Estado()
+        return estado
+
+
+class PreparedStatement:
+    """
+    Um comando preparado. `sql` usa `%s` como no `cur.execute` e `tipos` são
+    os tipos do PostgreSQL de cada parâmetro, na ordem (ex: `('integer',)`).
+    """
+
+    def __init__(self, nome, sql, tipos=()):
+        self.nome = nome
+        self.sql = sql
+        self.tipos = tuple(tipos)
+        corpo = _numerar(sql.strip().rstrip(';'))
+        declaracao = f' ({", ".join(self.tipos)})' if self.tipos else ''
+        self._prepare = f'PREPARE {nome}{declaracao} AS {corpo};'
+        marcadores = ', '.join(['%s'] * len(self.tipos))
+        self._execute = f'EXECUTE {nome} ({marcadores});' if self.tipos else f'EXECUTE {nome};'
+
+    def _preparar(self, cur, estado):
+        if estado.descartar:
+            cur.execute('DEALLOCATE ALL;')
+            estado.descartar = False
+        cur.execute(self._prepare)
+        estado.preparados.add(self.nome)
+
+    def execute(self, cur, params=()):
+        """Executa no cursor `cur`, preparando na conexão se preciso."""
+        if not _ativo():
+            cur.execute(self.sql, params)
+            return
+        conn = cur.connection
+        estado = _estado(conn)
+        inicio_da_transacao = conn.info.transaction_status == extensions.TRANSACTION_STATUS_IDLE
+        try:
+            if self.nome not in estado.preparados:
+                self._preparar(cur, estado)
+            cur.execute(self._execute, params)
+        except (_PERDIDO, _DESATUALIZADO):
+            # Se um se perdeu ou ficou velho, os outros provavelmente também.
+            estado.preparados.clear()
+            estado.descartar = True
+            if not inicio_da_transacao:
+                # A transação já tinha outros comandos; não dá para repetir.
+                raise
+            conn.rollback()
+            self._preparar(cur, estado)
+            cur.execute(self._execute, params)
+
+
+def prepared_on(conn):
+    """Nomes dos statements já preparados em `conn` (para diagnóstico)."""
+    return sorted(_estado(conn).preparados)
+
+
+# --- Catálogo das consultas quentes de `routes.py` ---
+# A leitura, inserção, atualização e exclusão de cada recurso são montadas
+# a partir da definição do recurso, em `resources.py`; aqui ficam só os
+# comandos escritos à mão.
+
+ROTA_EXISTE = PreparedStatement(
+    'rota_existe', 'SELECT 1 FROM cadeiraextensao.rotas WHERE rota_id = %s;', ('integer',)
+)
+
+# O horário real só é preenchido quando o novo status é 'Entregue'; o CASE
+# mantém um único texto de SQL (e um único plano) para os dois casos.
+ATUALIZAR_ENTREGA = PreparedStatement(
+    'atualizar_entrega',
+    """
+    UPDATE cadeiraextensao.entregas
+    SET status_entrega = %s, sequencia_na_rota = %s, observacoes = %s,
+        data_hora_real_entrega = CASE WHEN %s = 'Entregue' THEN CURRENT_TIMESTAMP
+                                      ELSE data_hora_real_entrega END
+    WHERE entrega_id = %s;
+    """,
+    ('varchar', 'integer', 'text', 'varchar', 'integer')
+)
+
+EXCLUIR_ENTREGAS_DA_ROTA = PreparedStatement(
+    'excluir_entregas_da_rota', 'DELETE FROM cadeiraextensao.entregas WHERE rota_id = %s;', ('integer',)
+)
+
+EXCLUIR_ENTREGAS_DO_CLIENTE = PreparedStatement(
+    'excluir_entregas_do_cliente', 'DELETE FROM cadeiraextensao.entregas WHERE cliente_id = %s;', ('integer',)
+)
@@ -0,0 +1,344 @@
+"""
+Perfis de CPU de requisições, sob demanda.
+
+Uma requisição é perfilada quando traz `X-Profile: 1` junto com o token de
+administrador (ver `admin.py`), ou por sorteio, com a taxa de amostragem
+`PROFILE_SAMPLE_RATE` (padrão 0), que pode ser trocada em tempo de execução
+por `PUT /api/admin/perfis/amostragem`. Sem nenhum dos dois, o custo por
+requisição é uma consulta a um cabeçalho.
+
+Cada perfil tem dois formatos:
+
+* `pstats`: o `cProfile` da requisição (tempo por função, chamadores);
+* `folded`: pilhas amostradas a cada `PROFILE_INTERVAL_MS` (padrão 1 ms) na
+  thread (ou greenlet) da requisição, no formato "a;b;c contagem" do flamegraph.pl e do
+  speedscope.
+
+Os perfis ficam em `PROFILE_DIR` (padrão: `<tmp>/casasbahia_perfis`), uma
+pasta por endpoint com no máximo `PROFILE_MAX_PER_ENDPOINT` (padrão 20)
+perfis, e podem ser listados e baixados de qualquer worker. Só uma
+requisição por worker é perfilada por vez: desde o Python 3.12 o `cProfile`
+vale para o interpretador inteiro. Pelo mesmo motivo, com requisições
+simultâneas o `pstats` pode incluir chamadas de outras threads (ou, no
+worker gevent, de outras greenlets); as pilhas do `folded` são sempre só as
+da requisição.
+"""
+import cProfile
+import io
+import json
+import os
+import pstats
+import random
+import re
+import secrets
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+from flask import g, request
+
+from .admin import is_admin
+
+FORMATOS = ('pstats', 'folded', 'texto')
+_ID = re.compile(r'^[0-9]+-[0-9]+-[0-9a-f]+$')
+
+# Um perfil por vez neste processo.
+_ocupado = threading.Lock()
+
+
+def _diretorio():
+    return os.getenv('PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'casasbahia_perfis'))
+
+
+def _apos_fork_no_filho():
+    global _ocupado, _taxa_lida_em
+    _ocupado = threading.Lock()
+    _taxa_lida_em = 0.0
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_apos_fork_no_filho)
+
+
+# --- Taxa de amostragem ---
+
+_taxa = 0.0
+_taxa_lida_em = 0.0
+
+
+def sample_rate():
+    """
+    A taxa atual: a gravada por `set_sample_rate` (relida no máximo uma vez
+    por segundo, para valer em todos os workers) ou `PROFILE_SAMPLE_RATE`.
+    """
+    global _taxa, _taxa_lida_em
+    agora = time.monotonic()
+    if agora - _taxa_lida_em >= 1.0:
+        _taxa_lida_em = agora
+        try:
+            with open(os.path.join(_diretorio(), 'taxa')) as arquivo:
+                _taxa = float(arquivo.read())
+        except (OSError, ValueError):
+            _taxa = float(os.getenv('PROFILE_SAMPLE_RATE', '0'))
+    return _taxa
+
+
+def set_sample_rate(taxa):
+    """Grava a taxa de amostragem para todos os workers (None volta ao padrão)."""
+    global _taxa_lida_em
+    caminho = os.path.join(_diretorio(), 'taxa')
+    if taxa is None:
+        try:
+            os.remove(caminho)
+        except FileNotFoundError:
+            pass
+    else:
+        os.makedirs(_diretorio(), exist_ok=True)
+        fd, temporario = tempfile.mkstemp(dir=_diretorio(), suffix='.tmp')
+        with os.fdopen(fd, 'w') as arquivo:
+            arquivo.write(repr(float(taxa)))
+        os.replace(temporario, caminho)
+    _taxa_lida_em = 0.0
+    return sample_rate()
+
+
+# --- Coleta ---
+
+try:
+    # Com o worker gevent, `threading` é da greenlet: o `get_ident` dela não é
+    # chave de `sys._current_frames()`, e um amostrador que fosse greenlet só
+    # rodaria quando a requisição cedesse a vez. O amostrador é uma thread de
+    # verdade e o alvo é a thread de verdade, como nos agregados de `metrics.py`.
+    from gevent.monkey import get_original
+    _get_ident, _start_new_thread, _allocate_lock = get_original(
+        '_thread', ['get_ident', 'start_new_thread', 'allocate_lock'])
+    _sleep = get_original('time', 'sleep')
+except ImportError:
+    import _thread
+    _get_ident, _start_new_thread, _allocate_lock = _thread.get_ident, _thread.start_new_thread, _thread.allocate_lock
+    _sleep = time.sleep
+
+try:
+    from greenlet import getcurrent as _greenlet_atual
+except ImportError:
+    _greenlet_atual = None
+
+
+class _Amostrador:
+    """
+    Conta as pilhas da requisição atual a cada `intervalo` segundos.
+
+    Com gevent, a thread alvo também roda as outras greenlets: enquanto a da
+    requisição está parada (esperando o banco, por exemplo), a pilha contada
+    é a que ela deixou em `gr_frame`, e não a de quem estiver rodando.
+    """
+
+    def __init__(self, intervalo):
+        self.alvo = _get_ident()
+        self.greenlet = _greenlet_atual() if _greenlet_atual is not None else None
+        self.intervalo = intervalo
+        self.pilhas = Counter()
+        self._parar = False
+        self._rodando = _allocate_lock()
+
+    def start(self):
+        self._rodando.acquire()
+        _start_new_thread(self._run, ())
+
+    def _frame(self):
+        # `gr_frame` só fica preenchido enquanto a greenlet está parada.
+        frame = self.greenlet.gr_frame if self.greenlet is not None else None
+        return frame if frame is not None else sys._current_frames().get(self.alvo)
+
+    def _run(self):
+        try:
+            while True:
+                _sleep(self.intervalo)
+                if self._parar:
+                    return
+                frame = self._frame()
+                nomes = []
+                while frame is not None:
+                    codigo = frame.f_code
+                    nomes.append(f'{os.path.basename(codigo.co_filename)}:{codigo.co_qualname}')
+                    frame = frame.f_back
+                if nomes:
+                    self.pilhas[';'.join(reversed(nomes))] += 1
+        finally:
+            self._rodando.release()
+
+    def parar(self):
+        # Espera no máximo um intervalo, o da amostra em andamento.
+        self._parar = True
+        with self._rodando:
+            pass
+
+
+class _Perfil:
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.profile = cProfile.Profile()
+        self.amostrador = _Amostrador(float(os.getenv('PROFILE_INTERVAL_MS', '1')) / 1000)
+        self.amostrador.start()
+        self.profile.enable()
+
+    def terminar(self):
+        self.profile.disable()
+        self.amostrador.parar()
+        return time.perf_counter() - self.inicio
+
+
+def _pedido():
+    if 'X-Profile' in request.headers:
+        return request.headers['X-Profile'] not in ('', '0') and is_admin()
+    taxa = sample_rate()
+    return taxa > 0 and random.random() < taxa
+
+
+def _iniciar():
+    if not _pedido() or not _ocupado.acquire(blocking=False):
+        return
+    try:
+        g.perfil = _Perfil()
+    except Exception:
+        _ocupado.release()
+        raise
+
+
+def _terminar(response=None):
+    perfil = g.pop('perfil', None)
+    if perfil is None:
+        return None
+    try:
+        duracao = perfil.terminar()
+    finally:
+        _ocupado.release()
+    try:
+        return _salvar(perfil, duracao, response.status_code if response is not None else 500)
+    except OSError as e:
+        print(f"Erro ao gravar o perfil da requisição: {e}")
+        return None
+
+
+def init_app(app):
+    """Liga a perfilagem sob demanda nas requisições de `app`."""
+
+    @app.before_request
+    def _perfil_inicio():
+        _iniciar()
+
+    @app.after_request
+    def _perfil_fim(response):
+        chave = _terminar(response)
+        if chave is not None:
+            response.headers['X-Profile-Id'] = chave
+        return response
+
+    @app.teardown_request
+    def _perfil_erro(_erro):
+        # Só sobra perfil aqui se uma exceção pulou o after_request.
+        _terminar()
+
+
+# --- Armazenamento ---
+
+def _pasta(endpoint):
+    return os.path.join(_diretorio(), endpoint)
+
+
+def _salvar(perfil, duracao, status):
+    endpoint = request.endpoint or 'nao_encontrado'
+    perfil_id = f'{time.time_ns() // 1_000_000}-{os.getpid()}-{secrets.token_hex(3)}'
+    pasta = _pasta(endpoint)
+    os.makedirs(pasta, exist_ok=True)
+    base = os.path.join(pasta, perfil_id)
+    perfil.profile.dump_stats(base + '.pstats')
+    with open(base + '.folded', 'w') as arquivo:
+        for pilha, quantidade in perfil.amostrador.pilhas.most_common():
+            arquivo.write(f'{pilha} {quantidade}\n')
+    metadados = {
+        "id": perfil_id,
+        "endpoint": endpoint,
+        "instante": time.time(),
+        "metodo": request.method,
+        "caminho": request.full_path.rstrip('?'),
+        "status": status,
+        "duracao_ms": round(duracao * 1000, 3),
+        "amostras": sum(perfil.amostrador.pilhas.values()),
+    }
+    # Os metadados por último: um perfil só aparece na listagem completo.
+    with open(base + '.json', 'w') as arquivo:
+        json.dump(metadados, arquivo)
+    _podar(pasta)
+    return f'{endpoint}/{perfil_id}'
+
+
+def _podar(pasta):
+    """Apaga os perfis mais antigos além do limite por endpoint."""
+    limite = int(os.getenv('PROFILE_MAX_PER_ENDPOINT', '20'))
+    ids = sorted((nome[:-5] for nome in os.listdir(pasta) if nome.endswith('.json')),
+                 key=lambda perfil_id: int(perfil_id.split('-')[0]))
+    for perfil_id in ids[:max(0, len(ids) - limite)]:
+        for extensao in ('.json', '.pstats', '.folded'):
+            try:
+                os.remove(os.path.join(pasta, perfil_id + extensao))
+            except FileNotFoundError:
+                pass
+
+
+def list_profiles(endpoint=None):
+    """Metadados dos perfis guardados, do mais recente para o mais antigo."""
+    diretorio = _diretorio()
+    try:
+        endpoints = [endpoint] if endpoint else sorted(
+            nome for nome in os.listdir(diretorio) if os.path.isdir(os.path.join(diretorio, nome))
+        )
+    except FileNotFoundError:
+        return []
+    perfis = []
+    for nome in endpoints:
+        pasta = _pasta(nome)
+        if not os.path.isdir(pasta):
+            continue
+        for arquivo in os.listdir(pasta):
+            if not arquivo.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(pasta, arquivo)) as dados:
+                    perfis.append(json.load(dados))
+            except (OSError, ValueError):
+                continue
+    perfis.sort(key=lambda perfil: perfil['instante'], reverse=True)
+    return perfis
+
+
+def profile_path(endpoint, perfil_id, formato):
+    """Caminho do arquivo de um perfil, ou None se não existe (ou é inválido)."""
+    if formato not in ('pstats', 'folded') or not _ID.match(perfil_id) or '/' in endpoint or endpoint.startswith('.'):
+        return None
+    caminho = os.path.join(_pasta(endpoint), f'{perfil_id}.{formato}')
+    return caminho if os.path.exists(caminho) else None
+
+
+def profile_text(endpoint, perfil_id, limite=60):
+    """Resumo legível do pstats: as `limite` funções de maior tempo acumulado."""
+    caminho = profile_path(endpoint, perfil_id, 'pstats')
+    if caminho is None:
+        return None
+    saida = io.StringIO()
+    pstats.Stats(caminho, stream=saida).strip_dirs().sort_stats('cumulative').print_stats(limite)
+    return saida.getvalue()
+
+
+def clear():
+    """Apaga todos os perfis guardados (a taxa de amostragem é mantida)."""
+    diretorio = _diretorio()
+    if not os.path.isdir(diretorio):
+        return
+    for nome in os.listdir(diretorio):
+        caminho = os.path.join(diretorio, nome)
+        if os.path.isdir(caminho):
+            shutil.rmtree(caminho, ignore_errors=True)
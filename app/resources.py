@@ -0,0 +1,321 @@
+"""
+Definição declarativa dos recursos da API (clientes, depósitos, veículos,
+motoristas, rotas e entregas).
+
+Cada `Recurso` descreve a tabela, a chave primária e as colunas (tipo, se é
+obrigatória, valor padrão, se pode ser gravada ou atualizada). A partir
+disso são montados, uma única vez, os comandos SQL com a lista explícita de
+colunas (nunca `SELECT *`) e os prepared statements de leitura, inserção,
+atualização e exclusão. `routes.py` gera os endpoints de CRUD de cada
+recurso com `_registrar_recurso`; o que é específico de um recurso (as
+entregas embutidas em `GET /rotas/<id>`, a escrita adiada de
+`PUT /entregas/<id>`) continua escrito à mão lá.
+
+`?fields=a,b` (sparse fieldsets) limita as colunas lidas e devolvidas. A
+chave primária sempre vem, para a paginação e para o cliente identificar a
+linha; um nome fora da lista de colunas é um 400.
+"""
+from functools import lru_cache
+
+from . import distances, prepared
+from .errors import InvalidRequestBody
+from .pagination import (
+    ListQuery, InvalidQueryParameter,
+    FILTROS_CLIENTES, FILTROS_DEPOSITOS, FILTROS_VEICULOS,
+    FILTROS_MOTORISTAS, FILTROS_ROTAS, FILTROS_ENTREGAS,
+)
+
+
+class Coluna:
+    """
+    Uma coluna da tabela: nome, tipo do PostgreSQL (o dos parâmetros dos
+    prepared statements), se é obrigatória no POST/PUT, o valor padrão
+    quando omitida no POST, se o cliente pode gravá-la (`gravavel`) e
+    alterá-la num PUT (`atualizavel`) e, nas chaves estrangeiras, a tabela e
+    a coluna referenciadas (conferidas pelas cargas em lote, `bulk.py`).
+    """
+
+    def __init__(self, nome, tipo, obrigatoria=False, padrao=None, gravavel=True, atualizavel=True,
+                 referencia=None):
+        self.nome = nome
+        self.tipo = tipo
+        self.obrigatoria = obrigatoria
+        self.padrao = padrao
+        self.gravavel = gravavel
+        self.atualizavel = gravavel and atualizavel
+        self.referencia = referencia
+
+
+def _somente_leitura(nome, tipo):
+    return Coluna(nome, tipo, gravavel=False)
+
+
+# Colunas mantidas pelos gatilhos de sincronização (ver `sync.py`).
+_CONTROLE = (_somente_leitura('versao', 'bigint'), _somente_leitura('atualizado_em', 'timestamptz'))
+
+
+@lru_cache(maxsize=512)
+def _select_por_id(tabela, chave, colunas):
+    return f'SELECT {", ".join(colunas)} FROM {tabela} WHERE {chave} = %s;'
+
+
+class Recurso:
+    """
+    Um recurso da API. `nome` é o da tabela e o do caminho (`/api/<nome>`),
+    `item` o singular usado nos nomes dos endpoints e dos statements
+    (`get_cliente`, `atualizar_cliente`) e `rotulo` o das mensagens.
+
+    `cache_item`/`cache_lista` ligam o cache de leitura (`cache.py`) na
+    leitura unitária e nas listagens. `dependentes` são os comandos
+    (prepared statement, tabela afetada) executados antes do DELETE, na
+    mesma transação; `ao_gravar(id, valores)` e `ao_excluir(id)` rodam
+    depois de cada escrita confirmada. Com `put_generico=False` o recurso
+    não ganha o UPDATE pré-montado (o PUT é escrito à mão em `routes.py`).
+    """
+
+    def __init__(self, nome, item, chave, colunas, rotulo, feminino=False, filtros=None,
+                 cache_item=False, cache_lista=False, dependentes=(), ao_gravar=None,
+                 ao_excluir=None, mensagens=None, put_generico=True):
+        self.nome = nome
+        self.item = item
+        self.tabela = f'cadeiraextensao.{nome}'
+        self.chave = chave
+        self.definicoes = (Coluna(chave, 'integer', gravavel=False),) + tuple(colunas)
+        self.colunas = tuple(coluna.nome for coluna in self.definicoes)
+        self.gravaveis = tuple(coluna for coluna in self.definicoes if coluna.gravavel)
+        self.atualizaveis = tuple(coluna for coluna in self.definicoes if coluna.atualizavel)
+        self.filtros = filtros or {}
+        self.cache_item = cache_item
+        self.cache_lista = cache_lista
+        self.dependentes = tuple(dependentes)
+        self.ao_gravar = ao_gravar
+        self.ao_excluir = ao_excluir
+
+        o = 'a' if feminino else 'o'
+        self.mensagens = {
+            'adicionado': f'{rotulo} adicionad{o} com sucesso',
+            'atualizado': f'{rotulo} {{id}} atualizad{o} com sucesso.',
+            'excluido': f'{rotulo} {{id}} apagad{o} com sucesso.',
+            'nao_encontrado': f'{rotulo} não encontrad{o}',
+        }
+        self.mensagens['nao_excluido'] = self.mensagens['nao_encontrado']
+        self.mensagens.update(mensagens or {})
+
+        # --- SQL pré-montado ---
+        self.select = ', '.join(self.colunas)
+        self.por_id = prepared.PreparedStatement(
+            f'{nome}_por_id', _select_por_id(self.tabela, chave, self.colunas), ('integer',)
+        )
+        self.inserir = prepared.PreparedStatement(
+            f'inserir_{item}',
+            f'INSERT INTO {self.tabela} ({", ".join(c.nome for c in self.gravaveis)}) '
+            f'VALUES ({", ".join(["%s"] * len(self.gravaveis))}) RETURNING {chave};',
+            tuple(c.tipo for c in self.gravaveis)
+        )
+        # No PUT, cada coluna opcional vem acompanhada de um booleano que diz
+        # se ela foi enviada; as omitidas ficam como estão (`update_params`).
+        self.atualizar = None
+        if put_generico:
+            atribuicoes, tipos = [], []
+            for c in self.atualizaveis:
+                if c.obrigatoria:
+                    atribuicoes.append(f'{c.nome} = %s')
+                    tipos.append(c.tipo)
+                else:
+                    atribuicoes.append(f'{c.nome} = CASE WHEN %s THEN %s ELSE {c.nome} END')
+                    tipos.extend(('boolean', c.tipo))
+            self.atualizar = prepared.PreparedStatement(
+                f'atualizar_{item}',
+                f'UPDATE {self.tabela} SET {", ".join(atribuicoes)} WHERE {chave} = %s;',
+                (*tipos, 'integer')
+            )
+        self.excluir = prepared.PreparedStatement(
+            f'excluir_{item}', f'DELETE FROM {self.tabela} WHERE {chave} = %s;', ('integer',)
+        )
+
+    def message(self, nome, item_id=None):
+        return self.mensagens[nome].format(id=item_id)
+
+    # --- Leitura ---
+
+    def fields(self, args, extras=()):
+        """
+        Colunas pedidas em `?fields=` (mais a chave e `extras`), na ordem da
+        definição, ou None para todas.
+        """
+        texto = args.get('fields', '')
+        pedidas = {nome.strip() for nome in texto.split(',') if nome.strip()}
+        if not pedidas:
+            return None
+        invalidas = pedidas - set(self.colunas)
+        if invalidas:
+            raise InvalidQueryParameter(
+                f"fields inválido: {', '.join(sorted(invalidas))} (aceitos: {', '.join(self.colunas)})"
+            )
+        pedidas.update((self.chave, *extras))
+        campos = tuple(nome for nome in self.colunas if nome in pedidas)
+        return None if campos == self.colunas else campos
+
+    def select_list(self, campos=None):
+        return self.select if campos is None else ', '.join(campos)
+
+    def fetch_by_id(self, cur, item_id, campos=None):
+        """
+        Executa a leitura unitária em `cur`: com todas as colunas pelo
+        prepared statement, com `campos` por um SQL (também guardado) só
+        com elas.
+        """
+        if campos is None:
+            self.por_id.execute(cur, (item_id,))
+        else:
+            cur.execute(_select_por_id(self.tabela, self.chave, campos), (item_id,))
+
+    @staticmethod
+    def project(linha, campos):
+        """`linha` só com `campos` (para respostas que vêm do cache, sempre completas)."""
+        if linha is None or campos is None:
+            return linha
+        return {nome: linha[nome] for nome in campos}
+
+    def list_query(self, args, campos=None):
+        return ListQuery(self.tabela, self.chave, self.filtros, args, self.select_list(campos))
+
+    # --- Escrita ---
+
+    def values(self, dados, colunas, padroes=True):
+        """
+        Valores de `colunas` no corpo `dados`. Uma obrigatória ausente é um
+        400 (`InvalidRequestBody`); uma opcional ausente recebe o valor
+        padrão ou, com `padroes=False` (PUT), fica de fora.
+        """
+        if not isinstance(dados, dict):
+            raise InvalidRequestBody("O corpo deve ser um objeto JSON")
+        valores = {}
+        for coluna in colunas:
+            if coluna.nome in dados:
+                valores[coluna.nome] = dados[coluna.nome]
+            elif coluna.obrigatoria:
+                raise InvalidRequestBody(f"Campo obrigatório: {coluna.nome}")
+            elif padroes:
+                valores[coluna.nome] = coluna.padrao
+        return valores
+
+    def update_params(self, valores):
+        """Parâmetros de `atualizar` (sem o id) para os `valores` de um PUT."""
+        params = []
+        for coluna in self.atualizaveis:
+            if coluna.obrigatoria:
+                params.append(valores[coluna.nome])
+            else:
+                params.extend((coluna.nome in valores, valores.get(coluna.nome)))
+        return params
+
+
+# --- Recursos ---
+
+CLIENTES = Recurso(
+    'clientes', 'cliente', 'cliente_id',
+    (
+        Coluna('nome_cliente', 'varchar', obrigatoria=True),
+        Coluna('endereco_cliente', 'varchar', obrigatoria=True),
+        Coluna('gps_latitude_cliente', 'numeric', obrigatoria=True),
+        Coluna('gps_longitude_cliente', 'numeric', obrigatoria=True),
+        Coluna('telefone_cliente', 'varchar'),
+        Coluna('email_cliente', 'varchar'),
+        *_CONTROLE,
+    ),
+    rotulo='Cliente', filtros=FILTROS_CLIENTES, cache_item=True,
+    # As entregas do cliente são apagadas junto.
+    dependentes=((prepared.EXCLUIR_ENTREGAS_DO_CLIENTE, 'entregas'),),
+    ao_gravar=lambda i, v: distances.cliente_changed(i, v['gps_latitude_cliente'], v['gps_longitude_cliente']),
+    ao_excluir=distances.cliente_removed,
+    mensagens={'excluido': 'Cliente {id} e suas dependências foram apagados.'},
+)
+
+DEPOSITOS = Recurso(
+    'depositos', 'deposito', 'deposito_id',
+    (
+        Coluna('nome_deposito', 'varchar', obrigatoria=True),
+        Coluna('endereco_deposito', 'varchar', obrigatoria=True),
+        Coluna('gps_latitude_deposito', 'numeric', obrigatoria=True),
+        Coluna('gps_longitude_deposito', 'numeric', obrigatoria=True),
+    ),
+    rotulo='Depósito', filtros=FILTROS_DEPOSITOS, cache_item=True, cache_lista=True,
+    ao_gravar=lambda i, v: distances.deposito_changed(i, v['gps_latitude_deposito'], v['gps_longitude_deposito']),
+    ao_excluir=distances.deposito_removed,
+    # O DELETE falha (chave estrangeira) se algum veículo ou rota usa o depósito.
+    mensagens={'nao_excluido': 'Depósito não encontrado ou em uso'},
+)
+
+VEICULOS = Recurso(
+    'veiculos', 'veiculo', 'veiculo_id',
+    (
+        Coluna('placa_veiculo', 'varchar', obrigatoria=True),
+        Coluna('modelo_veiculo', 'varchar', obrigatoria=True),
+        Coluna('ano_fabricacao', 'integer', obrigatoria=True),
+        Coluna('status_veiculo', 'varchar', padrao='Disponível'),
+        Coluna('deposito_id_base', 'integer', referencia=('depositos', 'deposito_id')),
+    ),
+    rotulo='Veículo', filtros=FILTROS_VEICULOS, cache_item=True, cache_lista=True,
+    mensagens={'nao_excluido': 'Veículo não encontrado ou em uso'},
+)
+
+MOTORISTAS = Recurso(
+    'motoristas', 'motorista', 'motorista_id',
+    (
+        Coluna('nome_motorista', 'varchar', obrigatoria=True),
+        Coluna('cpf_motorista', 'varchar', obrigatoria=True),
+        Coluna('cnh_motorista', 'varchar', obrigatoria=True),
+        Coluna('telefone_motorista', 'varchar'),
+    ),
+    rotulo='Motorista', filtros=FILTROS_MOTORISTAS, cache_item=True, cache_lista=True,
+    mensagens={'nao_excluido': 'Motorista não encontrado ou em uso'},
+)
+
+ROTAS = Recurso(
+    'rotas', 'rota', 'rota_id',
+    (
+        Coluna('veiculo_id', 'integer', obrigatoria=True, referencia=('veiculos', 'veiculo_id')),
+        Coluna('motorista_id', 'integer', obrigatoria=True, referencia=('motoristas', 'motorista_id')),
+        # Os depósitos são definidos na criação; o PUT não os altera.
+        Coluna('deposito_partida_id', 'integer', obrigatoria=True, atualizavel=False,
+               referencia=('depositos', 'deposito_id')),
+        Coluna('deposito_chegada_id', 'integer', obrigatoria=True, atualizavel=False,
+               referencia=('depositos', 'deposito_id')),
+        Coluna('data_rota', 'date', obrigatoria=True),
+        Coluna('horario_saida_previsto', 'time'),
+        Coluna('horario_chegada_previsto', 'time'),
+        Coluna('status_rota', 'varchar', padrao='Planejada'),
+        *_CONTROLE,
+    ),
+    rotulo='Rota', feminino=True, filtros=FILTROS_ROTAS,
+    dependentes=((prepared.EXCLUIR_ENTREGAS_DA_ROTA, 'entregas'),),
+    mensagens={'excluido': 'Rota {id} e suas entregas foram apagadas com sucesso.'},
+)
+
+ENTREGAS = Recurso(
+    'entregas', 'entrega', 'entrega_id',
+    (
+        # Sem rota: a entrega fica pendente para o `POST /rotas/planejar`.
+        Coluna('rota_id', 'integer', referencia=('rotas', 'rota_id')),
+        Coluna('cliente_id', 'integer', obrigatoria=True, referencia=('clientes', 'cliente_id')),
+        Coluna('sequencia_na_rota', 'integer'),
+        Coluna('status_entrega', 'varchar', padrao='Pendente'),
+        Coluna('data_hora_prevista_entrega', 'timestamp'),
+        # Preenchida pelo PUT quando o status passa a 'Entregue'.
+        _somente_leitura('data_hora_real_entrega', 'timestamp'),
+        Coluna('observacoes', 'text'),
+        *_CONTROLE,
+    ),
+    rotulo='Entrega', feminino=True, filtros=FILTROS_ENTREGAS,
+    # PUT com escrita adiada e horário real automático: `prepared.ATUALIZAR_ENTREGA`.
+    put_generico=False,
+)
+
+RECURSOS = {recurso.nome: recurso for recurso in (CLIENTES, DEPOSITOS, VEICULOS, MOTORISTAS, ROTAS, ENTREGAS)}
+
+ENTREGAS_DA_ROTA = prepared.PreparedStatement(
+    'entregas_da_rota',
+    f'SELECT {ENTREGAS.select} FROM {ENTREGAS.tabela} WHERE rota_id = %s ORDER BY sequencia_na_rota;',
+    ('integer',)
+)
@@ -1,12 +1,53 @@
-from flask import Blueprint, jsonify, request
-from .db import get_db_connection
-from datetime import date, time, datetime
-from decimal import Decimal
+import time
+from datetime import date
+from urllib.parse import urlencode
+
+from flask import Blueprint, Response, jsonify, request, send_file
+from psycopg2 import sql
+from psycopg2.extras import execute_values
+
+from . import cache, distances, events, metrics, prepared, profiling, slowlog, spatial, versions, vrp, write_queue
+from .bulk import (
+    CAMPOS_CLIENTES, CAMPOS_ENTREGAS,
+    read_rows, validate_rows, check_references, insert_rows, error_list,
+)
+from .admin import admin_required
+from .conditional import conditional
+from .dashboard import daily_stats
+from .db import db_connection, DatabaseConnectionError
+from .errors import InvalidRequestBody
+from .includes import parse_includes, expand_rotas, tables_for_includes, columns_for_includes
+from .pagination import InvalidQueryParameter, _data, tables_for_filters
+from .resources import (
+    CLIENTES, DEPOSITOS, VEICULOS, MOTORISTAS, ROTAS, ENTREGAS, ENTREGAS_DA_ROTA,
+)
+from .serialization import fetch_all, fetch_one
+from .streaming import wants_stream, stream_query
+from .sync import SyncQuery, TABELAS as SYNC_TABELAS
+from .tsp import sequence_length
 
 # Cria um Blueprint para organizar as rotas
 api = Blueprint('api', __name__)
 
 
+@api.errorhandler(DatabaseConnectionError)
+def database_connection_failed(e):
+    """Resposta padrão quando o pool não consegue fornecer uma conexão."""
+    return jsonify({"error": "Database connection failed"}), 500
+
+
+@api.errorhandler(InvalidQueryParameter)
+def invalid_query_parameter(e):
+    """Parâmetros de paginação ou filtro mal formados."""
+    return jsonify({"error": str(e)}), 400
+
+
+@api.errorhandler(InvalidRequestBody)
+def invalid_request_body(e):
+    """Corpo de uma escrita que não pôde ser lido ou está incompleto."""
+    return jsonify({"error": str(e)}), 400
+
+
 # --- Endpoint para a Página Home da API ---
 
 @api.route('/', methods=['GET'])
@@ -21,784 +62,931 @@ def home():
             "motoristas": "/api/motoristas",
             "depositos": "/api/depositos",
             "rotas": "/api/rotas",
-            "entregas": "/api/entregas"
+            "entregas": "/api/entregas",
+            "estatisticas": "/api/estatisticas"
         }
     }
     return jsonify(doc)
 
 
-# --- Endpoints para Clientes ---
-
-@api.route('/clientes', methods=['GET'])
-def get_clientes():
-    """Retorna todos os clientes cadastrados."""
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "Database connection failed"}), 500
-
-    cur = conn.cursor()
-    cur.execute('SELECT * FROM cadeiraextensao.clientes;')
-    
-    colunas = [desc[0] for desc in cur.description]
-    clientes_com_objetos = [dict(zip(colunas, row)) for row in cur.fetchall()]
-    cur.close()
-    conn.close()
-
-    # Conversão manual para o tipo Decimal do GPS para evitar erros
-    clientes_serializaveis = []
-    for cliente in clientes_com_objetos:
-        for key, value in cliente.items():
-            if isinstance(value, Decimal):
-                cliente[key] = float(value)
-        clientes_serializaveis.append(cliente)
-    
-    return jsonify(clientes_serializaveis)
-
+def _registrar_escrita(*tabelas):
+    """Avisa o cache de leitura e os contadores de ETag de que `tabelas` mudaram."""
+    for tabela in tabelas:
+        cache.invalidate(tabela)
+    versions.bump(*tabelas)
 
-@api.route('/clientes', methods=['POST'])
-def add_cliente():
-    """Adiciona um novo cliente."""
-    novo_cliente = request.get_json()
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "Database connection failed"}), 500
 
-    cur = conn.cursor()
-    cur.execute(
-        'INSERT INTO cadeiraextensao.clientes (nome_cliente, endereco_cliente, gps_latitude_cliente, gps_longitude_cliente, telefone_cliente, email_cliente) VALUES (%s, %s, %s, %s, %s, %s) RETURNING cliente_id;',
-        (novo_cliente['nome_cliente'], novo_cliente['endereco_cliente'], novo_cliente['gps_latitude_cliente'], novo_cliente['gps_longitude_cliente'], novo_cliente.get('telefone_cliente'), novo_cliente.get('email_cliente'))
-    )
-    new_id = cur.fetchone()[0]
-    conn.commit()
-    cur.close()
-    conn.close()
-    return jsonify({"message": "Cliente adicionado com sucesso", "id": new_id}), 201
-
-@api.route('/clientes/<int:cliente_id>', methods=['GET', 'PUT', 'DELETE'])
-def handle_cliente(cliente_id):
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "Database connection failed"}), 500
-    
-    cur = conn.cursor()
-
-    # --- LÓGICA PARA O MÉTODO GET ---
-    if request.method == 'GET':
-        cur.execute('SELECT * FROM cadeiraextensao.clientes WHERE cliente_id = %s;', (cliente_id,))
-        cliente_obj = cur.fetchone()
+def _buscar_por_id(recurso, valor, campos=None):
+    """Lê uma linha pela chave primária, já convertida em dicionário (ou None)."""
+    with db_connection() as conn:
+        cur = conn.cursor()
+        recurso.fetch_by_id(cur, valor, campos)
+        linha = fetch_one(cur)
         cur.close()
-        conn.close()
-
-        if cliente_obj:
-            colunas = [desc[0] for desc in cur.description]
-            cliente_dict = dict(zip(colunas, cliente_obj))
-            for key, value in cliente_dict.items():
-                if isinstance(value, Decimal):
-                    cliente_dict[key] = float(value)
-            return jsonify(cliente_dict)
-        else:
-            return jsonify({"message": "Cliente não encontrado"}), 404
+    return linha
 
-    # --- LÓGICA PARA O MÉTODO PUT ---
-    elif request.method == 'PUT':
-        dados_cliente = request.get_json()
-        cur.execute(
-            """
-            UPDATE cadeiraextensao.clientes 
-            SET nome_cliente = %s, endereco_cliente = %s, gps_latitude_cliente = %s,
-                gps_longitude_cliente = %s, telefone_cliente = %s, email_cliente = %s
-            WHERE cliente_id = %s;
-            """,
-            (
-                dados_cliente['nome_cliente'], dados_cliente['endereco_cliente'],
-                dados_cliente['gps_latitude_cliente'], dados_cliente['gps_longitude_cliente'],
-                dados_cliente['telefone_cliente'], dados_cliente['email_cliente'],
-                cliente_id
-            )
-        )
-        updated_rows = cur.rowcount
-        conn.commit()
-        cur.close()
-        conn.close()
 
-        if updated_rows > 0:
-            return jsonify({"message": f"Cliente {cliente_id} atualizado com sucesso."})
-        else:
-            return jsonify({"message": "Cliente não encontrado"}), 404
-
-    # --- LÓGICA PARA O MÉTODO DELETE ---
-    elif request.method == 'DELETE':
-        # Primeiro, apaga as entregas associadas
-        cur.execute('DELETE FROM cadeiraextensao.entregas WHERE cliente_id = %s;', (cliente_id,))
-        # Em seguida, apaga o cliente
-        cur.execute('DELETE FROM cadeiraextensao.clientes WHERE cliente_id = %s;', (cliente_id,))
-        
-        updated_rows = cur.rowcount
-        conn.commit()
+def _listar(consulta):
+    """Executa uma `ListQuery` e devolve `[linhas, proximo_cursor]`."""
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(consulta.sql, consulta.params)
+        linhas, proximo_cursor = consulta.pagina(fetch_all(cur))
         cur.close()
-        conn.close()
+    return [linhas, proximo_cursor]
 
-        if updated_rows > 0:
-            return jsonify({"message": f"Cliente {cliente_id} e suas dependências foram apagados."})
-        else:
-            return jsonify({"message": "Cliente não encontrado"}), 404
 
+def _chave_da_listagem():
+    """Chave de cache de uma listagem: a query string normalizada."""
+    return 'lista?' + urlencode(sorted(request.args.items(multi=True)))
 
-# --- Endpoints para Depósitos ---
 
-@api.route('/depositos', methods=['GET'])
-def get_depositos():
-    """Retorna todos os depósitos."""
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "Database connection failed"}), 500
+def _sincronizar(recurso, campos=None, includes=()):
+    """Resposta de `?desde=`: só o que mudou em `recurso` desde o token."""
+    if wants_stream():
+        raise InvalidQueryParameter("desde não é suportado em streaming")
+    consulta = SyncQuery(recurso.nome, request.args, recurso.select_list(campos))
+    with db_connection() as conn:
+        cur = conn.cursor()
+        resultado = consulta.run(cur)
+        expand_rotas(cur, resultado['alteradas'], includes)
+        cur.close()
+    return jsonify(resultado)
+
+
+def _registrar_recurso(recurso, exceto=()):
+    """
+    Registra os endpoints de CRUD de `recurso` (uma definição de
+    `resources.py`), menos as operações em `exceto`, escritas à mão:
+
+    * `listar`: `GET /<nome>`, com paginação, filtros, `?fields=`, streaming
+      e, nas tabelas sincronizáveis, `?desde=`;
+    * `ler`: `GET /<nome>/<id>`, com `?fields=`;
+    * `criar`, `atualizar`, `excluir`: `POST /<nome>`, `PUT` e
+      `DELETE /<nome>/<id>`.
+
+    Os endpoints se chamam `get_<nome>`, `get_<item>`, `add_<item>`,
+    `update_<item>` e `delete_<item>` (ex: `api.get_clientes`).
+    """
+    colecao, unitario = f'/{recurso.nome}', f'/{recurso.nome}/<int:item_id>'
+
+    def listar():
+        if 'desde' in request.args and recurso.nome in SYNC_TABELAS:
+            return _sincronizar(recurso, recurso.fields(request.args, ('versao',)))
+        consulta = recurso.list_query(request.args, recurso.fields(request.args))
+        if wants_stream():
+            return stream_query(consulta.sql_stream, consulta.params)
+        if recurso.cache_lista:
+            linhas, proximo_cursor = cache.read_through(recurso.nome, _chave_da_listagem(), lambda: _listar(consulta))
+        else:
+            linhas, proximo_cursor = _listar(consulta)
+        return consulta.response(linhas, proximo_cursor)
+
+    def ler(item_id):
+        campos = recurso.fields(request.args)
+        if recurso.cache_item:
+            # O cache guarda a linha completa; um acerto não precisa do banco.
+            linha = recurso.project(
+                cache.read_through(recurso.nome, item_id, lambda: _buscar_por_id(recurso, item_id)), campos
+            )
+        else:
+            linha = _buscar_por_id(recurso, item_id, campos)
+        if not linha:
+            return jsonify({"message": recurso.message('nao_encontrado')}), 404
+        return jsonify(linha)
+
+    def criar():
+        valores = recurso.values(request.get_json(), recurso.gravaveis)
+        with db_connection() as conn:
+            cur = conn.cursor()
+            recurso.inserir.execute(cur, tuple(valores.values()))
+            new_id = cur.fetchone()[0]
+            conn.commit()
+            cur.close()
+        _registrar_escrita(recurso.nome)
+        if recurso.ao_gravar:
+            recurso.ao_gravar(new_id, valores)
+        return jsonify({"message": recurso.message('adicionado'), "id": new_id}), 201
+
+    def atualizar(item_id):
+        valores = recurso.values(request.get_json(), recurso.atualizaveis, padroes=False)
+        with db_connection() as conn:
+            cur = conn.cursor()
+            recurso.atualizar.execute(cur, (*recurso.update_params(valores), item_id))
+            updated_rows = cur.rowcount
+            conn.commit()
+            cur.close()
+        if updated_rows == 0:
+            return jsonify({"message": recurso.message('nao_encontrado')}), 404
+        _registrar_escrita(recurso.nome)
+        if recurso.ao_gravar:
+            recurso.ao_gravar(item_id, valores)
+        return jsonify({"message": recurso.message('atualizado', item_id)})
+
+    def excluir(item_id):
+        with db_connection() as conn:
+            cur = conn.cursor()
+            # Primeiro as linhas dependentes (ex: as entregas do cliente).
+            for statement, _ in recurso.dependentes:
+                statement.execute(cur, (item_id,))
+            recurso.excluir.execute(cur, (item_id,))
+            updated_rows = cur.rowcount
+            conn.commit()
+            cur.close()
+        if updated_rows == 0:
+            return jsonify({"message": recurso.message('nao_excluido')}), 404
+        _registrar_escrita(recurso.nome, *(tabela for _, tabela in recurso.dependentes))
+        if recurso.ao_excluir:
+            recurso.ao_excluir(item_id)
+        return jsonify({"message": recurso.message('excluido', item_id)})
+
+    def tabelas_dos_filtros():
+        # Ex: `?data_rota=` das entregas lê as rotas.
+        return tables_for_filters(recurso.filtros, request.args)
+
+    operacoes = [
+        ('listar', colecao, f'get_{recurso.nome}',
+         conditional(recurso.nome, recurso.nome, tabelas_dos_filtros)(listar), 'GET'),
+        ('ler', unitario, f'get_{recurso.item}', conditional(recurso.nome)(ler), 'GET'),
+        ('criar', colecao, f'add_{recurso.item}', criar, 'POST'),
+        ('atualizar', unitario, f'update_{recurso.item}', atualizar, 'PUT'),
+        ('excluir', unitario, f'delete_{recurso.item}', excluir, 'DELETE'),
+    ]
+    for operacao, regra, endpoint, view, metodo in operacoes:
+        if operacao in exceto or (operacao == 'atualizar' and recurso.atualizar is None):
+            continue
+        api.add_url_rule(regra, endpoint, view, methods=[metodo])
 
-    cur = conn.cursor()
-    cur.execute('SELECT * FROM cadeiraextensao.depositos;')
-    
-    colunas = [desc[0] for desc in cur.description]
-    depositos_com_objetos = [dict(zip(colunas, row)) for row in cur.fetchall()]
-    cur.close()
-    conn.close()
-
-    # Conversão manual para tipos de dados não-padrão (como Decimal do GPS)
-    depositos_serializaveis = []
-    for deposito in depositos_com_objetos:
-        for key, value in deposito.items():
-            if isinstance(value, Decimal):
-                deposito[key] = float(value)
-        depositos_serializaveis.append(deposito)
-    
-    return jsonify(depositos_serializaveis)
 
+# --- Endpoints para Clientes ---
 
-@api.route('/depositos/<int:deposito_id>', methods=['GET'])
-def get_deposito(deposito_id):
-    """Retorna um depósito específico."""
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "Database connection failed"}), 500
+_registrar_recurso(CLIENTES)
+
+
+def _carga_em_lote(tabela, chave, campos):
+    """
+    Valida e insere numa única transação as linhas do corpo (lista JSON ou
+    NDJSON). Por padrão é tudo ou nada: havendo qualquer linha inválida,
+    nada é gravado e a resposta é 422 com os erros. Com `?parcial=1` as
+    linhas válidas são gravadas mesmo assim.
+
+    Retorna `(ids, erros, linhas_validas)`, com `ids` na ordem da entrada
+    (None nas linhas com erro, ou em todas quando nada foi gravado).
+    """
+    linhas, erros = read_rows()
+    valores, erros = validate_rows(linhas, campos, erros)
+    parcial = request.args.get('parcial', '').lower() in ('1', 'true', 'sim')
+    with db_connection() as conn:
+        cur = conn.cursor()
+        check_references(cur, campos, valores, erros)
+        if erros and not parcial:
+            conn.rollback()
+            cur.close()
+            return [None] * len(linhas), erros, []
+        ids = insert_rows(cur, tabela, chave, campos, valores)
+        conn.commit()
+        cur.close()
+    return ids, erros, [(i, v) for i, v in zip(ids, valores) if v is not None]
 
-    cur = conn.cursor()
-    cur.execute('SELECT * FROM cadeiraextensao.depositos WHERE deposito_id = %s;', (deposito_id,))
-    
-    colunas = [desc[0] for desc in cur.description]
-    deposito_obj = cur.fetchone()
-    cur.close()
-    conn.close()
-
-    if deposito_obj:
-        deposito_dict = dict(zip(colunas, deposito_obj))
-        # Conversão manual para o tipo Decimal do GPS
-        for key, value in deposito_dict.items():
-            if isinstance(value, Decimal):
-                deposito_dict[key] = float(value)
-        return jsonify(deposito_dict)
-        
-    return jsonify({"message": "Depósito não encontrado"}), 404
-
-
-@api.route('/depositos', methods=['POST'])
-def add_deposito():
-    """Adiciona um novo depósito."""
-    novo_deposito = request.get_json()
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "Database connection failed"}), 500
-
-    cur = conn.cursor()
-    cur.execute(
-        'INSERT INTO cadeiraextensao.depositos (nome_deposito, endereco_deposito, gps_latitude_deposito, gps_longitude_deposito) VALUES (%s, %s, %s, %s) RETURNING deposito_id;',
-        (novo_deposito['nome_deposito'], novo_deposito['endereco_deposito'], novo_deposito['gps_latitude_deposito'], novo_deposito['gps_longitude_deposito'])
-    )
-    new_id = cur.fetchone()[0]
-    conn.commit()
-    cur.close()
-    conn.close()
-    return jsonify({"message": "Depósito adicionado com sucesso", "id": new_id}), 201
-
-
-@api.route('/depositos/<int:deposito_id>', methods=['PUT'])
-def update_deposito(deposito_id):
-    """Atualiza os dados de um depósito existente."""
-    dados_deposito = request.get_json()
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "Database connection failed"}), 500
-
-    cur = conn.cursor()
-    cur.execute(
-        """
-        UPDATE cadeiraextensao.depositos 
-        SET nome_deposito = %s, 
-            endereco_deposito = %s, 
-            gps_latitude_deposito = %s,
-            gps_longitude_deposito = %s
-        WHERE deposito_id = %s;
-        """,
-        (
-            dados_deposito['nome_deposito'], 
-            dados_deposito['endereco_deposito'],
-            dados_deposito['gps_latitude_deposito'],
-            dados_deposito['gps_longitude_deposito'],
-            deposito_id
-        )
-    )
-    
-    updated_rows = cur.rowcount
-    conn.commit()
-    cur.close()
-    conn.close()
 
-    if updated_rows > 0:
-        return jsonify({"message": f"Depósito {deposito_id} atualizado com sucesso."})
-    return jsonify({"message": "Depósito não encontrado"}), 404
+def _resposta_em_lote(ids, erros):
+    inseridos = sum(1 for i in ids if i is not None)
+    status = 422 if erros and not inseridos else 201
+    return jsonify({"ids": ids, "inseridos": inseridos, "erros": error_list(erros)}), status
 
 
-@api.route('/depositos/<int:deposito_id>', methods=['DELETE'])
-def delete_deposito(deposito_id):
-    """Apaga um depósito. AVISO: Falhará se o depósito estiver em uso."""
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "Database connection failed"}), 500
+@api.route('/clientes/bulk', methods=['POST'])
+def add_clientes_em_lote():
+    """Adiciona vários clientes de uma vez (lista JSON ou NDJSON)."""
+    ids, erros, gravados = _carga_em_lote('clientes', 'cliente_id', CAMPOS_CLIENTES)
+    if gravados:
+        _registrar_escrita('clientes')
+        distances.clientes_changed([(i, v[2], v[3]) for i, v in gravados])
+    return _resposta_em_lote(ids, erros)
 
-    cur = conn.cursor()
-    
-    # NOTA: Esta operação irá falhar se qualquer veículo ou rota estiver
-    # associado a este depósito, devido às restrições de chave estrangeira.
-    # Uma implementação mais robusta exigiria primeiro reassociar ou apagar
-    # os veículos e rotas dependentes.
-    cur.execute('DELETE FROM cadeiraextensao.depositos WHERE deposito_id = %s;', (deposito_id,))
-    
-    updated_rows = cur.rowcount
-    conn.commit()
-    cur.close()
-    conn.close()
+# --- Endpoints para Depósitos ---
 
-    if updated_rows > 0:
-        return jsonify({"message": f"Depósito {deposito_id} apagado com sucesso."})
-    return jsonify({"message": "Depósito não encontrado ou em uso"}), 404
+_registrar_recurso(DEPOSITOS)
+
+
+def _float_do_parametro(nome, padrao=None):
+    valor = request.args.get(nome)
+    if valor is None or valor == '':
+        if padrao is None:
+            raise InvalidQueryParameter(f"Informe o parâmetro '{nome}'")
+        return padrao
+    try:
+        return float(valor)
+    except ValueError:
+        raise InvalidQueryParameter(f"O parâmetro '{nome}' deve ser numérico")
+
+
+@api.route('/depositos/mais-proximo', methods=['GET'])
+@conditional('depositos')
+def get_deposito_mais_proximo():
+    """Retorna o depósito mais próximo de um ponto (?lat=&lon=)."""
+    lat = _float_do_parametro('lat')
+    lon = _float_do_parametro('lon')
+    deposito_id, distancia = spatial.nearest_deposito(lat, lon)
+    if deposito_id is None:
+        return jsonify({"message": "Nenhum depósito com coordenadas cadastrado"}), 404
+    return jsonify({"deposito_id": deposito_id, "distancia_km": round(distancia, 3)})
+
+
+@api.route('/depositos/<int:deposito_id>/clientes', methods=['GET'])
+@conditional('clientes', 'clientes', 'depositos')
+def get_clientes_do_deposito(deposito_id):
+    """Retorna os clientes a até ?raio_km= (padrão 5) do depósito, do mais perto ao mais longe."""
+    raio_km = _float_do_parametro('raio_km', 5.0)
+    if raio_km < 0:
+        raise InvalidQueryParameter("O parâmetro 'raio_km' não pode ser negativo")
+    _, lat, lon = distances.get_distance_cache().coordinates(distances.DEPOSITO, [deposito_id])
+    if lat[0] != lat[0] or lon[0] != lon[0]:
+        return jsonify({"message": "Depósito não encontrado"}), 404
+    ids, distancias = spatial.clientes_within(float(lat[0]), float(lon[0]), raio_km)
+    return jsonify([
+        {"cliente_id": cliente_id, "distancia_km": round(distancia, 3)}
+        for cliente_id, distancia in zip(ids.tolist(), distancias.tolist())
+    ])
 
 
 # --- Endpoints para Veículos ---
 
-@api.route('/veiculos', methods=['GET'])
-def get_veiculos():
-    """Retorna todos os veículos."""
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "Database connection failed"}), 500
-
-    cur = conn.cursor()
-    cur.execute('SELECT * FROM cadeiraextensao.veiculos;')
-    
-    # Como não há tipos complexos (data/hora), a conversão direta funciona bem.
-    colunas = [desc[0] for desc in cur.description]
-    veiculos = [dict(zip(colunas, row)) for row in cur.fetchall()]
-    
-    cur.close()
-    conn.close()
-    return jsonify(veiculos)
-
-
-@api.route('/veiculos/<int:veiculo_id>', methods=['GET'])
-def get_veiculo(veiculo_id):
-    """Retorna um veículo específico."""
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "Database connection failed"}), 500
-
-    cur = conn.cursor()
-    cur.execute('SELECT * FROM cadeiraextensao.veiculos WHERE veiculo_id = %s;', (veiculo_id,))
-    
-    veiculo_obj = cur.fetchone()
-    cur.close()
-    conn.close()
-
-    if veiculo_obj:
-        colunas = [desc[0] for desc in cur.description]
-        return jsonify(dict(zip(colunas, veiculo_obj)))
-        
-    return jsonify({"message": "Veículo não encontrado"}), 404
-
-
-@api.route('/veiculos', methods=['POST'])
-def add_veiculo():
-    """Adiciona um novo veículo."""
-    novo_veiculo = request.get_json()
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "Database connection failed"}), 500
-
-    cur = conn.cursor()
-    cur.execute(
-        'INSERT INTO cadeiraextensao.veiculos (placa_veiculo, modelo_veiculo, ano_fabricacao, status_veiculo, deposito_id_base) VALUES (%s, %s, %s, %s, %s) RETURNING veiculo_id;',
-        (novo_veiculo['placa_veiculo'], novo_veiculo['modelo_veiculo'], novo_veiculo['ano_fabricacao'], novo_veiculo.get('status_veiculo', 'Disponível'), novo_veiculo.get('deposito_id_base'))
-    )
-    new_id = cur.fetchone()[0]
-    conn.commit()
-    cur.close()
-    conn.close()
-    return jsonify({"message": "Veículo adicionado com sucesso", "id": new_id}), 201
-
-
-@api.route('/veiculos/<int:veiculo_id>', methods=['PUT'])
-def update_veiculo(veiculo_id):
-    """Atualiza os dados de um veículo existente."""
-    dados_veiculo = request.get_json()
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "Database connection failed"}), 500
-
-    cur = conn.cursor()
-    cur.execute(
-        """
-        UPDATE cadeiraextensao.veiculos 
-        SET placa_veiculo = %s, 
-            modelo_veiculo = %s, 
-            ano_fabricacao = %s,
-            status_veiculo = %s,
-            deposito_id_base = %s
-        WHERE veiculo_id = %s;
-        """,
-        (
-            dados_veiculo['placa_veiculo'], 
-            dados_veiculo['modelo_veiculo'],
-            dados_veiculo['ano_fabricacao'],
-            dados_veiculo['status_veiculo'],
-            dados_veiculo['deposito_id_base'],
-            veiculo_id
-        )
-    )
-    
-    updated_rows = cur.rowcount
-    conn.commit()
-    cur.close()
-    conn.close()
-
-    if updated_rows > 0:
-        return jsonify({"message": f"Veículo {veiculo_id} atualizado com sucesso."})
-    return jsonify({"message": "Veículo não encontrado"}), 404
+_registrar_recurso(VEICULOS)
 
 
-@api.route('/veiculos/<int:veiculo_id>', methods=['DELETE'])
-def delete_veiculo(veiculo_id):
-    """Apaga um veículo. AVISO: Falhará se o veículo estiver em uso em uma rota."""
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "Database connection failed"}), 500
+# --- Endpoints para Rotas ---
 
-    cur = conn.cursor()
-    # NOTA: Esta operação irá falhar se este veículo estiver associado a qualquer
-    # rota, devido à restrição de chave estrangeira na tabela 'rotas'.
-    cur.execute('DELETE FROM cadeiraextensao.veiculos WHERE veiculo_id = %s;', (veiculo_id,))
-    
-    updated_rows = cur.rowcount
-    conn.commit()
-    cur.close()
-    conn.close()
+def _tabelas_dos_includes():
+    return tables_for_includes(request.args)
 
-    if updated_rows > 0:
-        return jsonify({"message": f"Veículo {veiculo_id} apagado com sucesso."})
-    return jsonify({"message": "Veículo não encontrado ou em uso"}), 404
 
+# As leituras das rotas aceitam `?include=` e são escritas à mão.
+_registrar_recurso(ROTAS, exceto=('listar', 'ler'))
 
-# --- Endpoints para Rotas ---
 
 @api.route('/rotas', methods=['GET'])
+@conditional('rotas', 'rotas', _tabelas_dos_includes)
 def get_rotas():
-    """Retorna todas as rotas."""
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "Database connection failed"}), 500
-
-    cur = conn.cursor()
-    cur.execute('SELECT * FROM cadeiraextensao.rotas;')
-    
-    colunas = [desc[0] for desc in cur.description]
-    rotas_com_objetos = [dict(zip(colunas, row)) for row in cur.fetchall()]
-    cur.close()
-    conn.close()
-
-    # Conversão manual para os tipos date e time, evitando o TypeError
-    rotas_serializaveis = []
-    for rota in rotas_com_objetos:
-        for key, value in rota.items():
-            if isinstance(value, (date, time, datetime)):
-                rota[key] = value.isoformat()
-        rotas_serializaveis.append(rota)
-    
-    return jsonify(rotas_serializaveis)
+    """
+    Retorna todas as rotas. Aceita `?include=entregas,clientes,veiculo,
+    motorista,depositos` para embutir os objetos relacionados e
+    `?desde=<token>` para receber só o que mudou.
+    """
+    includes = parse_includes(request.args)
+    # As colunas que as expansões usam vêm mesmo fora de `?fields=`.
+    extras = columns_for_includes(includes)
+    if 'desde' in request.args:
+        return _sincronizar(ROTAS, ROTAS.fields(request.args, ('versao', *extras)), includes)
+    consulta = ROTAS.list_query(request.args, ROTAS.fields(request.args, extras))
+    if wants_stream():
+        if includes:
+            raise InvalidQueryParameter("include não é suportado em streaming")
+        return stream_query(consulta.sql_stream, consulta.params)
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(consulta.sql, consulta.params)
+        rotas, proximo_cursor = consulta.pagina(fetch_all(cur))
+        expand_rotas(cur, rotas, includes)
+        cur.close()
+    return consulta.response(rotas, proximo_cursor)
 
 
 @api.route('/rotas/<int:rota_id>', methods=['GET'])
+@conditional('rotas', 'rotas', 'entregas', _tabelas_dos_includes)
 def get_rota(rota_id):
-    """Retorna uma rota específica e suas entregas associadas."""
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "Database connection failed"}), 500
-
-    cur = conn.cursor()
-    # Busca os detalhes da rota
-    cur.execute('SELECT * FROM cadeiraextensao.rotas WHERE rota_id = %s;', (rota_id,))
-    
-    rota_obj = cur.fetchone()
-    if not rota_obj:
-        cur.close()
-        conn.close()
-        return jsonify({"message": "Rota não encontrada"}), 404
+    """
+    Retorna uma rota específica e suas entregas associadas. Com
+    `?include=clientes,veiculo,motorista,depositos` os objetos relacionados
+    vêm embutidos, com uma consulta por tipo seja qual for o número de
+    entregas.
+    """
+    includes = parse_includes(request.args)
+    campos = ROTAS.fields(request.args, columns_for_includes(includes))
+    with db_connection() as conn:
+        cur = conn.cursor()
+        # Busca os detalhes da rota
+        ROTAS.fetch_by_id(cur, rota_id, campos)
+        rota_json = fetch_one(cur)
+        if not rota_json:
+            cur.close()
+            return jsonify({"message": "Rota não encontrada"}), 404
+
+        # Busca as entregas associadas
+        ENTREGAS_DA_ROTA.execute(cur, (rota_id,))
+        rota_json['entregas'] = fetch_all(cur)
+        expand_rotas(cur, [rota_json], includes)
 
-    # Converte os dados da rota, tratando os tipos especiais
-    colunas_rota = [desc[0] for desc in cur.description]
-    rota_json = dict(zip(colunas_rota, rota_obj))
-    for key, value in rota_json.items():
-        if isinstance(value, (date, time, datetime)):
-            rota_json[key] = value.isoformat()
-
-    # Busca as entregas associadas
-    cur.execute('SELECT * FROM cadeiraextensao.entregas WHERE rota_id = %s ORDER BY sequencia_na_rota;', (rota_id,))
-    colunas_entregas = [desc[0] for desc in cur.description]
-    entregas_com_objetos = [dict(zip(colunas_entregas, row)) for row in cur.fetchall()]
-    
-    # Converte os dados das entregas, tratando os tipos especiais
-    entregas_serializaveis = []
-    for entrega in entregas_com_objetos:
-        for key, value in entrega.items():
-            if isinstance(value, (date, time, datetime)):
-                entrega[key] = value.isoformat()
-        entregas_serializaveis.append(entrega)
-    
-    rota_json['entregas'] = entregas_serializaveis
-
-    cur.close()
-    conn.close()
+        cur.close()
     return jsonify(rota_json)
 
 
-@api.route('/rotas', methods=['POST'])
-def add_rota():
-    """Adiciona uma nova rota."""
-    nova_rota = request.get_json()
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "Database connection failed"}), 500
-
-    cur = conn.cursor()
-    cur.execute(
-        'INSERT INTO cadeiraextensao.rotas (veiculo_id, motorista_id, deposito_partida_id, deposito_chegada_id, data_rota, horario_saida_previsto, horario_chegada_previsto, status_rota) VALUES (%s, %s, %s, %s, %s, %s, %s, %s) RETURNING rota_id;',
-        (nova_rota['veiculo_id'], nova_rota['motorista_id'], nova_rota['deposito_partida_id'], nova_rota['deposito_chegada_id'], nova_rota['data_rota'], nova_rota.get('horario_saida_previsto'), nova_rota.get('horario_chegada_previsto'), nova_rota.get('status_rota', 'Planejada'))
-    )
-    new_id = cur.fetchone()[0]
-    conn.commit()
-    cur.close()
-    conn.close()
-    return jsonify({"message": "Rota adicionada com sucesso", "id": new_id}), 201
-
-
-@api.route('/rotas/<int:rota_id>', methods=['PUT'])
-def update_rota(rota_id):
-    """Atualiza os dados de uma rota existente."""
-    dados_rota = request.get_json()
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "Database connection failed"}), 500
-
-    cur = conn.cursor()
-    cur.execute(
-        """
-        UPDATE cadeiraextensao.rotas 
-        SET veiculo_id = %s, 
-            motorista_id = %s, 
-            data_rota = %s,
-            status_rota = %s,
-            horario_saida_previsto = %s,
-            horario_chegada_previsto = %s
-        WHERE rota_id = %s;
-        """,
-        (
-            dados_rota['veiculo_id'], 
-            dados_rota['motorista_id'],
-            dados_rota['data_rota'],
-            dados_rota['status_rota'],
-            dados_rota.get('horario_saida_previsto'),
-            dados_rota.get('horario_chegada_previsto'),
-            rota_id
+# Paradas de uma rota com as coordenadas dos clientes, na sequência atual.
+SQL_PARADAS_DA_ROTA = """
+SELECT e.entrega_id, c.gps_latitude_cliente, c.gps_longitude_cliente
+FROM cadeiraextensao.entregas e
+JOIN cadeiraextensao.clientes c ON c.cliente_id = e.cliente_id
+WHERE e.rota_id = %s
+ORDER BY e.sequencia_na_rota NULLS LAST, e.entrega_id;
+"""
+
+
+@api.route('/rotas/<int:rota_id>/otimizar', methods=['POST'])
+def otimizar_rota(rota_id):
+    """
+    Reordena as entregas da rota pelo menor caminho entre o depósito de
+    partida e o de chegada (PCV) e grava a nova `sequencia_na_rota`.
+
+    Corpo opcional: {"tempo_limite_ms": 500}. Entregas cujo cliente não tem
+    coordenadas vão para o fim da sequência, na ordem em que já estavam.
+    """
+    parametros = request.get_json(silent=True) or {}
+    try:
+        tempo_limite = min(float(parametros.get('tempo_limite_ms', 500)), 10000) / 1000
+    except (TypeError, ValueError):
+        return jsonify({"error": "tempo_limite_ms deve ser numérico"}), 400
+
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            """
+            SELECT dp.gps_latitude_deposito, dp.gps_longitude_deposito,
+                   dc.gps_latitude_deposito, dc.gps_longitude_deposito
+            FROM cadeiraextensao.rotas r
+            LEFT JOIN cadeiraextensao.depositos dp ON dp.deposito_id = r.deposito_partida_id
+            LEFT JOIN cadeiraextensao.depositos dc ON dc.deposito_id = r.deposito_chegada_id
+            WHERE r.rota_id = %s;
+            """,
+            (rota_id,)
         )
-    )
-    
-    updated_rows = cur.rowcount
-    conn.commit()
-    cur.close()
-    conn.close()
-
-    if updated_rows > 0:
-        return jsonify({"message": f"Rota {rota_id} atualizada com sucesso."})
-    return jsonify({"message": "Rota não encontrada"}), 404
-
+        rota_obj = cur.fetchone()
+        if not rota_obj:
+            cur.close()
+            return jsonify({"message": "Rota não encontrada"}), 404
+
+        cur.execute(SQL_PARADAS_DA_ROTA, (rota_id,))
+        entregas = cur.fetchall()
+
+        inicio = time.perf_counter()
+        partida = _coordenada(rota_obj[0], rota_obj[1])
+        chegada = _coordenada(rota_obj[2], rota_obj[3])
+        paradas = [(e[0], _coordenada(e[1], e[2])) for e in entregas]
+        com_gps = [(entrega_id, ponto) for entrega_id, ponto in paradas if ponto]
+        sem_gps = [entrega_id for entrega_id, ponto in paradas if not ponto]
+        pontos = [ponto for _, ponto in com_gps]
+
+        distancia_antes = sequence_length(pontos, range(len(pontos)), partida, chegada)
+        try:
+            ordem, distancia_depois = vrp.sequence_route(pontos, partida, chegada, tempo_limite)
+        except vrp.PlanningTimeout as e:
+            cur.close()
+            resposta = jsonify({"error": str(e)})
+            resposta.headers['Retry-After'] = '30'
+            return resposta, 503
+        sequencia = [com_gps[i][0] for i in ordem] + sem_gps
+        tempo_ms = (time.perf_counter() - inicio) * 1000
+
+        # Grava todas as novas posições num único UPDATE ... FROM (VALUES ...).
+        if sequencia:
+            execute_values(
+                cur,
+                """
+                UPDATE cadeiraextensao.entregas AS e
+                SET sequencia_na_rota = v.sequencia
+                FROM (VALUES %s) AS v(entrega_id, sequencia)
+                WHERE e.entrega_id = v.entrega_id;
+                """,
+                [(entrega_id, posicao) for posicao, entrega_id in enumerate(sequencia, start=1)],
+                page_size=len(sequencia)
+            )
+        conn.commit()
+        cur.close()
 
-@api.route('/rotas/<int:rota_id>', methods=['DELETE'])
-def delete_rota(rota_id):
-    """Apaga uma rota e todas as suas entregas associadas."""
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "Database connection failed"}), 500
+    if sequencia:
+        _registrar_escrita('entregas')
+    return jsonify({
+        "rota_id": rota_id,
+        "sequencia": sequencia,
+        "sem_coordenadas": sem_gps,
+        "distancia_antes_km": round(distancia_antes, 3),
+        "distancia_depois_km": round(distancia_depois, 3),
+        "tempo_ms": round(tempo_ms, 1)
+    })
+
+
+def _coordenada(lat, lon):
+    """Par (lat, lon) em float, ou None se alguma das coordenadas faltar."""
+    if lat is None or lon is None:
+        return None
+    return (float(lat), float(lon))
+
+
+# Entregas que o planejamento distribui e veículos livres na data (`%s`).
+SQL_ENTREGAS_PENDENTES = """
+SELECT e.entrega_id, c.gps_latitude_cliente, c.gps_longitude_cliente
+FROM cadeiraextensao.entregas e
+JOIN cadeiraextensao.clientes c ON c.cliente_id = e.cliente_id
+WHERE e.rota_id IS NULL AND e.status_entrega = 'Pendente'
+ORDER BY e.entrega_id;
+"""
+SQL_VEICULOS_LIVRES = """
+SELECT v.veiculo_id, d.deposito_id, d.gps_latitude_deposito, d.gps_longitude_deposito
+FROM cadeiraextensao.veiculos v
+JOIN cadeiraextensao.depositos d ON d.deposito_id = v.deposito_id_base
+WHERE v.status_veiculo = 'Disponível'
+  AND d.gps_latitude_deposito IS NOT NULL
+  AND d.gps_longitude_deposito IS NOT NULL
+  AND NOT EXISTS (SELECT 1 FROM cadeiraextensao.rotas r
+                  WHERE r.veiculo_id = v.veiculo_id AND r.data_rota = %s)
+ORDER BY d.deposito_id, v.veiculo_id;
+"""
+
+
+@api.route('/rotas/planejar', methods=['POST'])
+def planejar_rotas():
+    """
+    Distribui as entregas pendentes sem rota entre os veículos disponíveis
+    e cria as rotas do dia, minimizando a distância total (VRP).
+
+    Corpo: {"data_rota": "2024-05-20", "tempo_limite_ms": 2000,
+    "max_entregas_por_veiculo": 40, "dry_run": false}.
+
+    Entram no plano as entregas com `rota_id` nulo e status 'Pendente', e os
+    veículos com status 'Disponível' que têm depósito base e ainda não têm
+    rota na data. Cada veículo recebe um motorista sem rota na data (em
+    ordem de id); veículos sem motorista livre ficam de fora. Cada rota sai
+    e volta ao depósito base do veículo. Sem `max_entregas_por_veiculo`, as
+    entregas de cada depósito são divididas por igual entre os veículos.
+    Com `dry_run` o plano é devolvido sem gravar nada.
+    """
+    parametros = request.get_json(silent=True) or {}
+    if not parametros.get('data_rota'):
+        return jsonify({"error": "data_rota é obrigatório"}), 400
+    try:
+        data_rota = _data(parametros['data_rota'])
+    except (TypeError, ValueError):
+        return jsonify({"error": "data_rota deve ser uma data no formato AAAA-MM-DD"}), 400
+    try:
+        tempo_limite = min(float(parametros.get('tempo_limite_ms', 2000)), 60000) / 1000
+        max_por_veiculo = parametros.get('max_entregas_por_veiculo')
+        if max_por_veiculo is not None:
+            max_por_veiculo = int(max_por_veiculo)
+            if max_por_veiculo < 1:
+                raise ValueError
+    except (TypeError, ValueError):
+        return jsonify({"error": "tempo_limite_ms e max_entregas_por_veiculo devem ser numéricos e positivos"}), 400
+    dry_run = bool(parametros.get('dry_run', False))
+
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(SQL_ENTREGAS_PENDENTES)
+        entregas = cur.fetchall()
+        cur.execute(SQL_VEICULOS_LIVRES, (data_rota,))
+        veiculos = cur.fetchall()
+        cur.execute(
+            """
+            SELECT m.motorista_id
+            FROM cadeiraextensao.motoristas m
+            WHERE NOT EXISTS (SELECT 1 FROM cadeiraextensao.rotas r
+                              WHERE r.motorista_id = m.motorista_id AND r.data_rota = %s)
+            ORDER BY m.motorista_id;
+            """,
+            (data_rota,)
+        )
+        motoristas = [linha[0] for linha in cur.fetchall()]
+        conn.commit()
+        cur.close()
 
-    cur = conn.cursor()
-    # Para manter a integridade dos dados, primeiro apagamos as entregas
-    # que pertencem a esta rota.
-    cur.execute('DELETE FROM cadeiraextensao.entregas WHERE rota_id = %s;', (rota_id,))
-    
-    # Em seguida, apagamos a rota principal
-    cur.execute('DELETE FROM cadeiraextensao.rotas WHERE rota_id = %s;', (rota_id,))
-    
-    updated_rows = cur.rowcount
-    conn.commit()
-    cur.close()
-    conn.close()
+    inicio = time.perf_counter()
+    veiculos = [(v[0], m, v[1], _coordenada(v[2], v[3])) for v, m in zip(veiculos, motoristas)]
+    com_gps = [(e[0], _coordenada(e[1], e[2])) for e in entregas if _coordenada(e[1], e[2])]
+    sem_gps = [e[0] for e in entregas if not _coordenada(e[1], e[2])]
+
+    # Frota de cada depósito, na ordem dos veículos.
+    frotas = {}
+    for veiculo_id, motorista_id, deposito_id, base in veiculos:
+        frotas.setdefault(deposito_id, (base, []))[1].append((veiculo_id, motorista_id))
+    depositos = list(frotas)
+
+    rotas, nao_atribuidas = [], []
+    if depositos and com_gps:
+        mais_proximo = vrp.assign_to_depots([p for _, p in com_gps],
+                                            [frotas[d][0] for d in depositos])
+        por_deposito = [[] for _ in depositos]
+        for (entrega_id, ponto), i in zip(com_gps, mais_proximo.tolist()):
+            por_deposito[i].append((entrega_id, ponto))
+
+        subproblemas = []
+        for deposito_id, paradas in zip(depositos, por_deposito):
+            base, frota = frotas[deposito_id]
+            limite = max_por_veiculo or max(1, -(-len(paradas) // len(frota)))
+            subproblemas.append((base, [p for _, p in paradas], len(frota), limite))
+        try:
+            solucoes = vrp.solve_depots(subproblemas, tempo_limite)
+        except vrp.PlanningTimeout as e:
+            resposta = jsonify({"error": str(e)})
+            resposta.headers['Retry-After'] = '30'
+            return resposta, 503
+
+        for deposito_id, paradas, (rotas_deposito, sobra) in zip(depositos, por_deposito, solucoes):
+            frota = frotas[deposito_id][1]
+            for (veiculo_id, motorista_id), (ordem, distancia) in zip(frota, rotas_deposito):
+                rotas.append({
+                    "veiculo_id": veiculo_id,
+                    "motorista_id": motorista_id,
+                    "deposito_id": deposito_id,
+                    "entregas": [paradas[i][0] for i in ordem],
+                    "distancia_km": round(distancia, 3)
+                })
+            nao_atribuidas.extend(paradas[i][0] for i in sobra)
+    else:
+        nao_atribuidas = [entrega_id for entrega_id, _ in com_gps]
+    tempo_ms = (time.perf_counter() - inicio) * 1000
+
+    if rotas and not dry_run:
+        with db_connection() as conn:
+            cur = conn.cursor()
+            ids = execute_values(
+                cur,
+                """
+                INSERT INTO cadeiraextensao.rotas
+                    (veiculo_id, motorista_id, deposito_partida_id, deposito_chegada_id, data_rota, status_rota)
+                VALUES %s RETURNING rota_id;
+                """,
+                [(r['veiculo_id'], r['motorista_id'], r['deposito_id'], r['deposito_id'], data_rota, 'Planejada')
+                 for r in rotas],
+                page_size=len(rotas),
+                fetch=True
+            )
+            valores = []
+            for rota, (rota_id,) in zip(rotas, ids):
+                rota['rota_id'] = rota_id
+                valores.extend((entrega_id, rota_id, posicao)
+                               for posicao, entrega_id in enumerate(rota['entregas'], start=1))
+            # `rota_id IS NULL` protege contra entregas atribuídas por outra
+            # requisição enquanto o plano era calculado.
+            execute_values(
+                cur,
+                """
+                UPDATE cadeiraextensao.entregas AS e
+                SET rota_id = v.rota_id, sequencia_na_rota = v.sequencia
+                FROM (VALUES %s) AS v(entrega_id, rota_id, sequencia)
+                WHERE e.entrega_id = v.entrega_id AND e.rota_id IS NULL;
+                """,
+                valores,
+                page_size=len(valores)
+            )
+            if cur.rowcount != len(valores):
+                conn.rollback()
+                cur.close()
+                return jsonify({"error": "Entregas foram alteradas durante o planejamento; tente novamente"}), 409
+            conn.commit()
+            cur.close()
+        _registrar_escrita('rotas', 'entregas')
+
+    return jsonify({
+        "data_rota": data_rota.isoformat(),
+        "dry_run": dry_run,
+        "rotas": rotas,
+        "nao_atribuidas": nao_atribuidas,
+        "sem_coordenadas": sem_gps,
+        "distancia_total_km": round(sum(r['distancia_km'] for r in rotas), 3),
+        "tempo_ms": round(tempo_ms, 1)
+    })
+
+
+# Campos que podem ser alterados em lote pelo PATCH /rotas/<id>/entregas e
+# o conversor de cada um (None é sempre aceito para apagar o valor).
+_CAMPOS_PATCH_ENTREGA = {
+    'status_entrega': str,
+    'sequencia_na_rota': int,
+    'observacoes': str,
+}
+
+# Cada campo vem acompanhado de um booleano que diz se ele foi enviado; os
+# casts evitam que colunas só com NULL virem `text`. O `{}` é a rota.
+SQL_PATCH_ENTREGAS = sql.SQL(
+    """
+    UPDATE cadeiraextensao.entregas AS e
+    SET status_entrega = CASE WHEN v.tem_status THEN v.status_entrega ELSE e.status_entrega END,
+        sequencia_na_rota = CASE WHEN v.tem_sequencia THEN v.sequencia_na_rota ELSE e.sequencia_na_rota END,
+        observacoes = CASE WHEN v.tem_observacoes THEN v.observacoes ELSE e.observacoes END,
+        data_hora_real_entrega = CASE WHEN v.tem_status AND v.status_entrega = 'Entregue'
+                                      THEN CURRENT_TIMESTAMP ELSE e.data_hora_real_entrega END
+    FROM (VALUES %s) AS v(entrega_id, status_entrega, tem_status, sequencia_na_rota,
+                          tem_sequencia, observacoes, tem_observacoes)
+    WHERE e.entrega_id = v.entrega_id AND e.rota_id = {}
+    RETURNING e.entrega_id;
+    """
+)
+TEMPLATE_PATCH_ENTREGA = '(%s::int, %s::text, %s::boolean, %s::int, %s::boolean, %s::text, %s::boolean)'
+
+
+@api.route('/rotas/<int:rota_id>/entregas', methods=['PATCH'])
+def patch_entregas_da_rota(rota_id):
+    """
+    Aplica numa única transação (e num único UPDATE) uma lista de alterações
+    nas entregas da rota:
+
+        [{"entrega_id": 10, "status_entrega": "Entregue"},
+         {"entrega_id": 11, "sequencia_na_rota": 2, "observacoes": "Portaria"}]
+
+    Só os campos presentes em cada item são alterados. Como no PUT de
+    entrega, o status 'Entregue' grava `data_hora_real_entrega` com o
+    horário atual. Ids que não pertencem à rota são ignorados e devolvidos
+    em `nao_pertencem`.
+    """
+    alteracoes = request.get_json(silent=True)
+    if not isinstance(alteracoes, list):
+        return jsonify({"error": "O corpo deve ser uma lista de alterações"}), 400
+
+    valores, vistos = [], set()
+    for indice, item in enumerate(alteracoes):
+        entrega_id = item.get('entrega_id') if isinstance(item, dict) else None
+        if not isinstance(entrega_id, int) or isinstance(entrega_id, bool):
+            return jsonify({"error": f"Item {indice}: entrega_id inteiro é obrigatório"}), 400
+        if entrega_id in vistos:
+            return jsonify({"error": f"Item {indice}: entrega {entrega_id} repetida"}), 400
+        vistos.add(entrega_id)
+        linha = [entrega_id]
+        for campo, tipo in _CAMPOS_PATCH_ENTREGA.items():
+            valor = item.get(campo)
+            if valor is not None and (not isinstance(valor, tipo) or isinstance(valor, bool)):
+                return jsonify({"error": f"Item {indice}: {campo} com tipo inválido"}), 400
+            linha.extend((valor, campo in item))
+        valores.append(tuple(linha))
+
+    with db_connection() as conn:
+        cur = conn.cursor()
+        prepared.ROTA_EXISTE.execute(cur, (rota_id,))
+        if not cur.fetchone():
+            cur.close()
+            return jsonify({"message": "Rota não encontrada"}), 404
+
+        atualizadas = []
+        if valores:
+            atualizadas = execute_values(
+                cur,
+                SQL_PATCH_ENTREGAS.format(sql.Literal(rota_id)),
+                valores,
+                template=TEMPLATE_PATCH_ENTREGA,
+                page_size=len(valores),
+                fetch=True
+            )
+        conn.commit()
+        cur.close()
 
-    if updated_rows > 0:
-        return jsonify({"message": f"Rota {rota_id} e suas entregas foram apagadas com sucesso."})
-    return jsonify({"message": "Rota não encontrada"}), 404
+    atualizadas = {linha[0] for linha in atualizadas}
+    if atualizadas:
+        _registrar_escrita('entregas')
+    return jsonify({
+        "rota_id": rota_id,
+        "atualizadas": [v[0] for v in valores if v[0] in atualizadas],
+        "nao_pertencem": [v[0] for v in valores if v[0] not in atualizadas]
+    })
+
+
+@api.route('/rotas/<int:rota_id>/eventos', methods=['GET'])
+def get_eventos_da_rota(rota_id):
+    """
+    Acompanha as entregas da rota em tempo real (Server-Sent Events): um
+    evento `entrega` a cada inclusão, alteração ou exclusão, inclusive de
+    entregas que entram ou saem da rota.
+    """
+    if _buscar_por_id(ROTAS, rota_id) is None:
+        return jsonify({"message": "Rota não encontrada"}), 404
+    return _resposta_sse(rota_id)
+
+
+def _resposta_sse(rota_id=None):
+    """Resposta `text/event-stream` de uma nova assinatura (ou 503 se lotado)."""
+    try:
+        assinatura = events.get_broadcaster().subscribe(rota_id)
+    except events.EventLimitReached:
+        resposta = jsonify({"error": "Limite de assinaturas de eventos atingido"})
+        resposta.headers['Retry-After'] = '5'
+        return resposta, 503
+    resposta = Response(events.sse_stream(assinatura), mimetype='text/event-stream')
+    # O `finally` do gerador só roda se o corpo começou a ser lido; num HEAD
+    # ou num cliente que cai antes do primeiro pedaço, quem cancela é o close.
+    resposta.call_on_close(lambda: events.get_broadcaster().unsubscribe(assinatura))
+    resposta.headers['Cache-Control'] = 'no-cache'
+    # Desliga o buffer de proxies como o nginx, que atrasaria os eventos.
+    resposta.headers['X-Accel-Buffering'] = 'no'
+    return resposta
 
 
 # --- Endpoints para Entregas ---
 
-@api.route('/entregas', methods=['GET'])
-def get_entregas():
-    """Retorna todas as entregas cadastradas."""
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "Database connection failed"}), 500
+# O PUT (com a escrita adiada) é o `update_entrega`, mais abaixo.
+_registrar_recurso(ENTREGAS)
 
-    cur = conn.cursor()
-    cur.execute('SELECT * FROM cadeiraextensao.entregas;')
-    
-    colunas = [desc[0] for desc in cur.description]
-    entregas_com_objetos = [dict(zip(colunas, row)) for row in cur.fetchall()]
-    cur.close()
-    conn.close()
-
-    # Conversão manual para os tipos timestamp
-    entregas_serializaveis = []
-    for entrega in entregas_com_objetos:
-        for key, value in entrega.items():
-            if isinstance(value, (datetime, date, time)):
-                entrega[key] = value.isoformat()
-        entregas_serializaveis.append(entrega)
-    
-    return jsonify(entregas_serializaveis)
 
-@api.route('/entregas/<int:entrega_id>', methods=['GET'])
-def get_entrega(entrega_id):
-    """Retorna uma entrega específica."""
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "Database connection failed"}), 500
+@api.route('/entregas/eventos', methods=['GET'])
+def get_eventos_das_entregas():
+    """Eventos (SSE) de todas as entregas, de qualquer rota."""
+    return _resposta_sse()
 
-    cur = conn.cursor()
-    cur.execute('SELECT * FROM cadeiraextensao.entregas WHERE entrega_id = %s;', (entrega_id,))
-    
-    colunas = [desc[0] for desc in cur.description]
-    entrega_obj = cur.fetchone()
-    cur.close()
-    conn.close()
-
-    if entrega_obj:
-        entrega_dict = dict(zip(colunas, entrega_obj))
-        for key, value in entrega_dict.items():
-            if isinstance(value, (datetime, date, time)):
-                entrega_dict[key] = value.isoformat()
-        return jsonify(entrega_dict)
-        
-    return jsonify({"message": "Entrega não encontrada"}), 404
-
-@api.route('/entregas', methods=['POST'])
-def add_entrega():
-    """Adiciona uma nova entrega a uma rota."""
-    nova_entrega = request.get_json()
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "Database connection failed"}), 500
-
-    cur = conn.cursor()
-    cur.execute(
-        'INSERT INTO cadeiraextensao.entregas (rota_id, cliente_id, sequencia_na_rota, status_entrega, data_hora_prevista_entrega, observacoes) VALUES (%s, %s, %s, %s, %s, %s) RETURNING entrega_id;',
-        (nova_entrega['rota_id'], nova_entrega['cliente_id'], nova_entrega.get('sequencia_na_rota'), nova_entrega.get('status_entrega', 'Pendente'), nova_entrega.get('data_hora_prevista_entrega'), nova_entrega.get('observacoes'))
-    )
-    new_id = cur.fetchone()[0]
-    conn.commit()
-    cur.close()
-    conn.close()
-    return jsonify({"message": "Entrega adicionada com sucesso", "id": new_id}), 201
+@api.route('/entregas/bulk', methods=['POST'])
+def add_entregas_em_lote():
+    """Adiciona várias entregas de uma vez (lista JSON ou NDJSON)."""
+    ids, erros, gravados = _carga_em_lote('entregas', 'entrega_id', CAMPOS_ENTREGAS)
+    if gravados:
+        _registrar_escrita('entregas')
+    return _resposta_em_lote(ids, erros)
 
 @api.route('/entregas/<int:entrega_id>', methods=['PUT'])
 def update_entrega(entrega_id):
-    """Atualiza os dados de uma entrega (status, observações, etc.)."""
+    """
+    Atualiza os dados de uma entrega (status, observações, etc.).
+
+    Com a escrita adiada ligada (`ENTREGA_WRITE_BEHIND=1`) a alteração só é
+    enfileirada e a resposta é 202, sem conferir se a entrega existe; com a
+    fila cheia a resposta é 429.
+    """
     dados_update = request.get_json()
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "Database connection failed"}), 500
-
-    cur = conn.cursor()
-    # Adicionando a data/hora real da entrega se o status for 'Entregue'
-    data_hora_real = 'data_hora_real_entrega = CURRENT_TIMESTAMP' if dados_update.get('status_entrega') == 'Entregue' else 'data_hora_real_entrega = data_hora_real_entrega'
-
-    cur.execute(
-        f"""
-        UPDATE cadeiraextensao.entregas 
-        SET status_entrega = %s, 
-            sequencia_na_rota = %s,
-            observacoes = %s,
-            {data_hora_real}
-        WHERE entrega_id = %s;
-        """,
-        (dados_update.get('status_entrega'), dados_update.get('sequencia_na_rota'), dados_update.get('observacoes'), entrega_id)
-    )
+    if write_queue.enabled():
+        aceita = write_queue.get_queue().submit(
+            entrega_id, dados_update.get('status_entrega'),
+            dados_update.get('sequencia_na_rota'), dados_update.get('observacoes')
+        )
+        if not aceita:
+            resposta = jsonify({"error": "Fila de atualizações cheia, tente novamente"})
+            resposta.headers['Retry-After'] = '1'
+            return resposta, 429
+        return jsonify({"message": f"Atualização da entrega {entrega_id} enfileirada."}), 202
+    with db_connection() as conn:
+        cur = conn.cursor()
+        # A data/hora real da entrega é preenchida se o status for 'Entregue'
+        status = dados_update.get('status_entrega')
+        prepared.ATUALIZAR_ENTREGA.execute(
+            cur,
+            (status, dados_update.get('sequencia_na_rota'), dados_update.get('observacoes'), status, entrega_id)
+        )
     
-    updated_rows = cur.rowcount
-    conn.commit()
-    cur.close()
-    conn.close()
+        updated_rows = cur.rowcount
+        conn.commit()
+        cur.close()
 
     if updated_rows > 0:
+        _registrar_escrita('entregas')
         return jsonify({"message": f"Entrega {entrega_id} atualizada com sucesso."})
     return jsonify({"message": "Entrega não encontrada"}), 404
 
-@api.route('/entregas/<int:entrega_id>', methods=['DELETE'])
-def delete_entrega(entrega_id):
-    """Apaga uma entrega específica."""
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "Database connection failed"}), 500
-
-    cur = conn.cursor()
-    cur.execute('DELETE FROM cadeiraextensao.entregas WHERE entrega_id = %s;', (entrega_id,))
-    
-    updated_rows = cur.rowcount
-    conn.commit()
-    cur.close()
-    conn.close()
-
-    if updated_rows > 0:
-        return jsonify({"message": f"Entrega {entrega_id} apagada com sucesso."})
-    return jsonify({"message": "Entrega não encontrada"}), 404
-
-
 # --- Endpoints para Motoristas ---
 
-@api.route('/motoristas', methods=['GET'])
-def get_motoristas():
-    """Retorna todos os motoristas."""
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "Database connection failed"}), 500
-
-    cur = conn.cursor()
-    cur.execute('SELECT * FROM cadeiraextensao.motoristas;')
-    
-    colunas = [desc[0] for desc in cur.description]
-    motoristas = [dict(zip(colunas, row)) for row in cur.fetchall()]
-    
-    cur.close()
-    conn.close()
-    return jsonify(motoristas)
-
-
-@api.route('/motoristas/<int:motorista_id>', methods=['GET'])
-def get_motorista(motorista_id):
-    """Retorna um motorista específico."""
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "Database connection failed"}), 500
-
-    cur = conn.cursor()
-    cur.execute('SELECT * FROM cadeiraextensao.motoristas WHERE motorista_id = %s;', (motorista_id,))
-    
-    motorista_obj = cur.fetchone()
-    cur.close()
-    conn.close()
-
-    if motorista_obj:
-        colunas = [desc[0] for desc in cur.description]
-        return jsonify(dict(zip(colunas, motorista_obj)))
-        
-    return jsonify({"message": "Motorista não encontrado"}), 404
-
-
-@api.route('/motoristas', methods=['POST'])
-def add_motorista():
-    """Adiciona um novo motorista."""
-    novo_motorista = request.get_json()
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "Database connection failed"}), 500
-
-    cur = conn.cursor()
-    cur.execute(
-        'INSERT INTO cadeiraextensao.motoristas (nome_motorista, cpf_motorista, cnh_motorista, telefone_motorista) VALUES (%s, %s, %s, %s) RETURNING motorista_id;',
-        (novo_motorista['nome_motorista'], novo_motorista['cpf_motorista'], novo_motorista['cnh_motorista'], novo_motorista.get('telefone_motorista'))
-    )
-    new_id = cur.fetchone()[0]
-    conn.commit()
-    cur.close()
-    conn.close()
-    return jsonify({"message": "Motorista adicionado com sucesso", "id": new_id}), 201
-
-
-@api.route('/motoristas/<int:motorista_id>', methods=['PUT'])
-def update_motorista(motorista_id):
-    """Atualiza os dados de um motorista existente."""
-    dados_motorista = request.get_json()
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "Database connection failed"}), 500
-
-    cur = conn.cursor()
-    cur.execute(
-        """
-        UPDATE cadeiraextensao.motoristas 
-        SET nome_motorista = %s, 
-            cpf_motorista = %s, 
-            cnh_motorista = %s,
-            telefone_motorista = %s
-        WHERE motorista_id = %s;
-        """,
-        (
-            dados_motorista['nome_motorista'], 
-            dados_motorista['cpf_motorista'],
-            dados_motorista['cnh_motorista'],
-            dados_motorista.get('telefone_motorista'),
-            motorista_id
-        )
+_registrar_recurso(MOTORISTAS)
+
+
+# --- Endpoint de Estatísticas ---
+
+def _data_das_estatisticas():
+    """O dia de `?data=AAAA-MM-DD`, ou hoje."""
+    texto = request.args.get('data')
+    try:
+        return date.fromisoformat(texto) if texto else date.today()
+    except ValueError:
+        raise InvalidQueryParameter(f"Valor inválido para o parâmetro 'data': {texto}")
+
+
+# Sem `?data=`, a mesma URL responde outro dia depois da meia-noite.
+@api.route('/estatisticas', methods=['GET'])
+@conditional('estatisticas', 'rotas', 'entregas', variante=_data_das_estatisticas)
+def get_estatisticas():
+    """
+    Entregas por status (no total e por rota), taxa de entregas no prazo,
+    rotas por status e veículos em uso no dia `?data=AAAA-MM-DD` (padrão:
+    hoje), lidos dos contadores mantidos pelo banco.
+    """
+    data = _data_das_estatisticas()
+    with db_connection() as conn:
+        cur = conn.cursor()
+        estatisticas = daily_stats(cur, data)
+        cur.close()
+    return jsonify(estatisticas)
+
+
+# --- Endpoint de Distâncias ---
+
+def _ponto(texto):
+    """Converte 'cliente:12' / 'deposito:3' em ('cliente', 12)."""
+    tipo, _, identificador = texto.strip().partition(':')
+    if tipo not in (distances.CLIENTE, distances.DEPOSITO) or not identificador.isdigit():
+        raise InvalidQueryParameter(f"Ponto inválido: '{texto}'. Use 'cliente:<id>' ou 'deposito:<id>'")
+    return tipo, int(identificador)
+
+
+@api.route('/distancias', methods=['GET'])
+@conditional('distancias', 'clientes', 'depositos')
+def get_distancias():
+    """
+    Distâncias em km (haversine) de um ponto de origem para vários destinos.
+
+    Ex: /api/distancias?origem=cliente:12&destinos=deposito:1,cliente:5
+    `destinos` também aceita 'clientes' ou 'depositos' para todos de um tipo.
+    """
+    origem_texto = request.args.get('origem')
+    destinos_texto = request.args.get('destinos')
+    if not origem_texto or not destinos_texto:
+        raise InvalidQueryParameter("Informe os parâmetros 'origem' e 'destinos'")
+    origem = _ponto(origem_texto)
+
+    cache = distances.get_distance_cache()
+    if destinos_texto in ('clientes', 'depositos'):
+        tipo = destinos_texto[:-1]
+        ids, _, _ = cache.coordinates(tipo)
+        destinos = [(tipo, int(i)) for i in ids]
+    else:
+        destinos = [_ponto(texto) for texto in destinos_texto.split(',') if texto.strip()]
+
+    valores = cache.distances(origem, destinos)
+    return jsonify({
+        "origem": f"{origem[0]}:{origem[1]}",
+        "destinos": [
+            {"destino": f"{tipo}:{destino_id}", "distancia_km": None if valor != valor else round(float(valor), 3)}
+            for (tipo, destino_id), valor in zip(destinos, valores.tolist())
+        ]
+    })
+
+
+# --- Monitoramento ---
+
+@api.route('/cache/stats', methods=['GET'])
+def get_cache_stats():
+    """Contadores do cache de leitura deste worker (acertos, falhas, despejos)."""
+    return jsonify(cache.stats())
+
+
+@api.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Métricas de todos os workers no formato de texto do Prometheus."""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+
+@api.route('/admin/consultas-lentas', methods=['GET', 'DELETE'])
+@admin_required
+def handle_consultas_lentas():
+    """
+    Consultas lentas deste worker, da mais recente para a mais antiga, com
+    os parâmetros redigidos e, quando amostrado, o plano real. DELETE
+    esvazia o registro.
+    """
+    registro = slowlog.get_log()
+    if request.method == 'DELETE':
+        registro.clear()
+        return jsonify({"message": "Registro de consultas lentas esvaziado."})
+    return jsonify({"stats": registro.stats(), "consultas": registro.entries()})
+
+
+@api.route('/admin/perfis', methods=['GET', 'DELETE'])
+@admin_required
+def handle_perfis():
+    """
+    Perfis de requisição guardados (de todos os workers), do mais recente
+    para o mais antigo; `?endpoint=` filtra. DELETE apaga todos.
+    """
+    if request.method == 'DELETE':
+        profiling.clear()
+        return jsonify({"message": "Perfis apagados."})
+    perfis = profiling.list_profiles(request.args.get('endpoint'))
+    return jsonify({"amostragem": profiling.sample_rate(), "total": len(perfis), "perfis": perfis})
+
+
+@api.route('/admin/perfis/amostragem', methods=['PUT'])
+@admin_required
+def set_perfis_amostragem():
+    """Troca a fração de requisições perfiladas ({"taxa": 0.01}; null volta ao padrão)."""
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or 'taxa' not in data:
+        return jsonify({"error": "Campo obrigatório: taxa"}), 400
+    taxa = data['taxa']
+    if taxa is not None and (isinstance(taxa, bool) or not isinstance(taxa, (int, float)) or not 0 <= taxa <= 1):
+        return jsonify({"error": "taxa deve ser um número entre 0 e 1, ou null"}), 400
+    return jsonify({"amostragem": profiling.set_sample_rate(taxa)})
+
+
+@api.route('/admin/perfis/<endpoint>/<perfil_id>', methods=['GET'])
+@admin_required
+def get_perfil(endpoint, perfil_id):
+    """
+    Baixa um perfil: `?formato=pstats` (padrão; abre com `python -m pstats`
+    ou snakeviz), `folded` (pilhas para flamegraph.pl/speedscope) ou `texto`
+    (resumo por tempo acumulado).
+    """
+    formato = request.args.get('formato', 'pstats')
+    if formato not in profiling.FORMATOS:
+        return jsonify({"error": f"formato deve ser um de: {', '.join(profiling.FORMATOS)}"}), 400
+    if formato == 'texto':
+        texto = profiling.profile_text(endpoint, perfil_id)
+        if texto is None:
+            return jsonify({"error": "Perfil não encontrado"}), 404
+        return Response(texto, mimetype='text/plain; charset=utf-8')
+    caminho = profiling.profile_path(endpoint, perfil_id, formato)
+    if caminho is None:
+        return jsonify({"error": "Perfil não encontrado"}), 404
+    return send_file(
+        caminho,
+        mimetype='application/octet-stream' if formato == 'pstats' else 'text/plain; charset=utf-8',
+        as_attachment=True,
+        download_name=f'{endpoint}-{perfil_id}.{formato}',
     )
-    
-    updated_rows = cur.rowcount
-    conn.commit()
-    cur.close()
-    conn.close()
-
-    if updated_rows > 0:
-        return jsonify({"message": f"Motorista {motorista_id} atualizado com sucesso."})
-    return jsonify({"message": "Motorista não encontrado"}), 404
-
-
-@api.route('/motoristas/<int:motorista_id>', methods=['DELETE'])
-def delete_motorista(motorista_id):
-    """Apaga um motorista. AVISO: Falhará se o motorista estiver em uso em uma rota."""
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "Database connection failed"}), 500
-
-    cur = conn.cursor()
-    # NOTA: Esta operação irá falhar se este motorista estiver associado a qualquer
-    # rota, devido à restrição de chave estrangeira na tabela 'rotas'.
-    cur.execute('DELETE FROM cadeiraextensao.motoristas WHERE motorista_id = %s;', (motorista_id,))
-    
-    updated_rows = cur.rowcount
-    conn.commit()
-    cur.close()
-    conn.close()
-
-    if updated_rows > 0:
-        return jsonify({"message": f"Motorista {motorista_id} apagado com sucesso."})
-    return jsonify({"message": "Motorista não encontrado ou em uso"}), 404
@@ -0,0 +1,93 @@
+import time
+
+from . import metrics
+
+# OIDs dos tipos do PostgreSQL que o `jsonify` não sabe serializar
+# (ver `SELECT oid, typname FROM pg_type`).
+NUMERIC = 1700
+DATE = 1082
+TIME = 1083
+TIMETZ = 1266
+TIMESTAMP = 1114
+TIMESTAMPTZ = 1184
+
+
+def _float(valor):
+    return None if valor is None else float(valor)
+
+
+def _iso(valor):
+    return None if valor is None else valor.isoformat()
+
+
+# Como cada tipo vira JSON: float para NUMERIC (ex: as coordenadas GPS, que
+# chegam como Decimal) e ISO 8601 para datas e horários. Os demais tipos
+# passam direto.
+_CONVERSOES = {
+    NUMERIC: _float,
+    DATE: _iso,
+    TIME: _iso,
+    TIMETZ: _iso,
+    TIMESTAMP: _iso,
+    TIMESTAMPTZ: _iso,
+}
+
+
+class RowSerializer:
+    """
+    Converte linhas de um cursor em dicionários prontos para `jsonify`.
+
+    O plano de conversão é montado a partir dos OIDs de `cur.description`,
+    ou seja, uma vez por consulta e não uma vez por valor: em vez de testar
+    `isinstance` em cada valor de cada linha, só as colunas que precisam de
+    conversão (NUMERIC, datas e horários) passam pela sua função.
+    """
+
+    def __init__(self, description):
+        self.colunas = tuple(desc[0] for desc in description)
+        # (coluna, conversão) só das colunas que não vão direto para o JSON
+        self.conversoes = tuple(
+            (desc[0], _CONVERSOES[desc[1]]) for desc in description if desc[1] in _CONVERSOES
+        )
+
+    @classmethod
+    def from_cursor(cls, cur):
+        return cls(cur.description)
+
+    def row(self, linha):
+        """Converte uma linha em dicionário."""
+        dados = dict(zip(self.colunas, linha))
+        for coluna, converter in self.conversoes:
+            dados[coluna] = converter(dados[coluna])
+        return dados
+
+    def rows(self, linhas):
+        """Converte uma lista de linhas em uma lista de dicionários."""
+        row = self.row
+        return [row(linha) for linha in linhas]
+
+
+def _medir(inicio):
+    medicao = metrics.current()
+    if medicao is not None:
+        medicao.serializacao += time.perf_counter() - inicio
+
+
+def fetch_all(cur):
+    """Lê todas as linhas pendentes do cursor já convertidas em dicionários."""
+    linhas = cur.fetchall()
+    inicio = time.perf_counter()
+    dados = RowSerializer.from_cursor(cur).rows(linhas)
+    _medir(inicio)
+    return dados
+
+
+def fetch_one(cur):
+    """Lê a próxima linha do cursor convertida em dicionário, ou None."""
+    linha = cur.fetchone()
+    if linha is None:
+        return None
+    inicio = time.perf_counter()
+    dados = RowSerializer.from_cursor(cur).row(linha)
+    _medir(inicio)
+    return dados
@@ -0,0 +1,197 @@
+"""
+Registro de consultas lentas.
+
+O cursor de `db.py` mede todo `execute`; os que passam de
+`DB_SLOW_QUERY_MS` (padrão 500 ms; 0 desliga) são registrados aqui com o
+endpoint, o tempo e o número de linhas. Os parâmetros nunca aparecem: cada
+um vira só o seu tipo (ex: `<str:11>`), e os textos entre aspas do SQL e do
+plano viram `'?'`.
+
+Uma fração `DB_SLOW_QUERY_EXPLAIN` (padrão 0) das consultas lentas ganha o
+plano real, capturado com `EXPLAIN (ANALYZE, BUFFERS)` logo em seguida, na
+mesma conexão. Como o ANALYZE executa o comando de novo, isso é feito num
+SAVEPOINT desfeito logo depois: um UPDATE não é aplicado duas vezes.
+
+As últimas `DB_SLOW_QUERY_BUFFER` (padrão 100) ficam na memória do worker,
+visíveis em `GET /api/admin/consultas-lentas`.
+"""
+import os
+import random
+import re
+import threading
+from collections import deque
+from datetime import datetime, timezone
+
+from psycopg2 import extensions
+
+_TEXTO = re.compile(r"'(?:[^']|'')*'")
+_ESPACOS = re.compile(r'\s+')
+# Comandos que o EXPLAIN aceita (PREPARE, DDL etc. ficam sem plano).
+_EXPLICAVEL = re.compile(r'\s*(SELECT|WITH|INSERT|UPDATE|DELETE|EXECUTE|VALUES)\b', re.IGNORECASE)
+_MAX_SQL = 2000
+
+
+def _config():
+    return {
+        "limite_s": float(os.getenv('DB_SLOW_QUERY_MS', '500')) / 1000,
+        "amostra": float(os.getenv('DB_SLOW_QUERY_EXPLAIN', '0')),
+        "tamanho": int(os.getenv('DB_SLOW_QUERY_BUFFER', '100')),
+    }
+
+
+class SlowQueryLog:
+    """Buffer circular das consultas lentas de um processo."""
+
+    def __init__(self, limite_s, amostra, tamanho):
+        self.limite_s = limite_s
+        self.amostra = amostra
+        self._entradas = deque(maxlen=tamanho)
+        self._lock = threading.Lock()
+        self.registradas = 0
+        self.explicadas = 0
+
+    def lenta(self, duracao):
+        return 0 < self.limite_s <= duracao
+
+    def registrar(self, cur, query, vars, duracao):
+        """Guarda (e imprime) uma execução lenta de `query` em `cur`."""
+        plano = None
+        if self.amostra > 0 and random.random() < self.amostra:
+            plano = _explicar(cur, query, vars)
+        entrada = {
+            "instante": datetime.now(timezone.utc).isoformat(),
+            "endpoint": _endpoint(),
+            "duracao_ms": round(duracao * 1000, 3),
+            "linhas": cur.rowcount,
+            "sql": redact_sql(query),
+            "parametros": redact_params(vars),
+            "plano": plano,
+        }
+        with self._lock:
+            self._entradas.append(entrada)
+            self.registradas += 1
+            if plano is not None:
+                self.explicadas += 1
+        print(f"Consulta lenta ({entrada['duracao_ms']:.1f} ms, {entrada['linhas']} linhas, "
+              f"{entrada['endpoint'] or 'fora de requisição'}): {entrada['sql'][:300]}")
+
+    def entries(self):
+        """As entradas guardadas, da mais recente para a mais antiga."""
+        with self._lock:
+            return list(reversed(self._entradas))
+
+    def clear(self):
+        with self._lock:
+            self._entradas.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "limite_ms": self.limite_s * 1000,
+                "amostra_explain": self.amostra,
+                "registradas": self.registradas,
+                "explicadas": self.explicadas,
+                "guardadas": len(self._entradas),
+            }
+
+
+def redact_sql(query):
+    """SQL numa linha, sem os textos literais e limitado a 2000 caracteres."""
+    if isinstance(query, bytes):
+        query = query.decode('utf-8', 'replace')
+    elif not isinstance(query, str):
+        # psycopg2.sql.Composed e afins
+        query = str(query)
+    sql = _ESPACOS.sub(' ', _TEXTO.sub("'?'", query)).strip()
+    return sql if len(sql) <= _MAX_SQL else sql[:_MAX_SQL] + '...'
+
+
+def _tipo(valor):
+    if valor is None:
+        return None
+    if isinstance(valor, (str, bytes, list, tuple)):
+        return f'<{type(valor).__name__}:{len(valor)}>'
+    return f'<{type(valor).__name__}>'
+
+
+def redact_params(vars):
+    """Os parâmetros trocados pelos seus tipos (e tamanhos)."""
+    if vars is None:
+        return None
+    if isinstance(vars, dict):
+        return {chave: _tipo(valor) for chave, valor in vars.items()}
+    return [_tipo(valor) for valor in vars]
+
+
+def _endpoint():
+    from flask import has_request_context, request
+    return request.endpoint if has_request_context() else None
+
+
+def _explicar(cur, query, vars):
+    """
+    Plano real de `query`, rodado num SAVEPOINT desfeito em seguida. Devolve
+    None quando não dá para capturar (cursor nomeado, autocommit, erro).
+    """
+    conn = cur.connection
+    if cur.name is not None or conn.autocommit:
+        return None
+    if conn.info.transaction_status != extensions.TRANSACTION_STATUS_INTRANS:
+        return None
+    if isinstance(query, bytes):
+        query = query.decode()
+    elif not isinstance(query, str):
+        query = query.as_string(conn)
+    if not _EXPLICAVEL.match(query):
+        return None
+    # Cursor comum, para o EXPLAIN não ser medido (nem registrado) de novo.
+    explain = conn.cursor(cursor_factory=extensions.cursor)
+    try:
+        explain.execute('SAVEPOINT casasbahia_explain;')
+        try:
+            explain.execute('EXPLAIN (ANALYZE, BUFFERS) ' + query, vars)
+            plano = '\n'.join(linha[0] for linha in explain.fetchall())
+        except Exception as e:
+            plano = None
+            print(f"Erro ao capturar o plano da consulta lenta: {e}")
+        explain.execute('ROLLBACK TO SAVEPOINT casasbahia_explain;')
+        explain.execute('RELEASE SAVEPOINT casasbahia_explain;')
+    except Exception as e:
+        print(f"Erro ao capturar o plano da consulta lenta: {e}")
+        return None
+    finally:
+        explain.close()
+    return _TEXTO.sub("'?'", plano) if plano is not None else None
+
+
+# --- Registro do processo ---
+
+_log = None
+_log_pid = None
+_log_lock = threading.Lock()
+
+
+def _apos_fork_no_filho():
+    global _log_lock
+    _log_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_apos_fork_no_filho)
+
+
+def get_log():
+    """O registro deste processo, criado a partir das variáveis de ambiente."""
+    global _log, _log_pid
+    log = _log
+    if log is not None and _log_pid == os.getpid():
+        return log
+    with _log_lock:
+        if _log is None or _log_pid != os.getpid():
+            _log = SlowQueryLog(**_config())
+            _log_pid = os.getpid()
+        return _log
+
+
+def stats():
+    return get_log().stats()
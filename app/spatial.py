@@ -0,0 +1,125 @@
+"""
+Índice espacial em grade para buscas por proximidade.
+
+Os pontos são agrupados em células de `SPATIAL_CELL_KM` km (padrão 2) e
+guardados ordenados pela chave da célula. Uma busca por raio só olha as
+células que cobrem o círculo (um intervalo contínuo de chaves por faixa de
+latitude, achado com `searchsorted`) e confirma a distância exata com
+haversine apenas nesses candidatos.
+
+O índice é montado a partir das coordenadas do cache de distâncias
+(`app.distances`), que já é atualizado pelos POST/PUT/DELETE de clientes e
+depósitos. Como reconstruir é barato (uma ordenação vetorizada), cada
+worker apenas refaz seu índice quando a versão do cache muda.
+"""
+import math
+import os
+import threading
+
+import numpy as np
+
+from .distances import CLIENTE, DEPOSITO, get_distance_cache, haversine_matrix
+
+KM_POR_GRAU = 111.32
+
+# Deslocamento para que colunas (longitude) negativas virem chaves positivas.
+_COLUNAS = 1 << 32
+
+
+class GridIndex:
+    """Índice em grade, imutável, sobre arrays `(ids, lat, lon)`."""
+
+    def __init__(self, ids, lat, lon, celula_km=2.0):
+        validos = ~(np.isnan(lat) | np.isnan(lon))
+        self.celula_graus = celula_km / KM_POR_GRAU
+        ids, lat, lon = ids[validos], lat[validos], lon[validos]
+        chaves = self._chaves(lat, lon)
+        ordem = np.argsort(chaves, kind='stable')
+        self.chaves = chaves[ordem]
+        self.ids = ids[ordem]
+        self.lat = lat[ordem]
+        self.lon = lon[ordem]
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _linha_coluna(self, lat, lon):
+        linha = np.floor(np.asarray(lat) / self.celula_graus).astype(np.int64)
+        coluna = np.floor(np.asarray(lon) / self.celula_graus).astype(np.int64)
+        return linha, coluna
+
+    def _chaves(self, lat, lon):
+        linha, coluna = self._linha_coluna(lat, lon)
+        return linha * _COLUNAS + (coluna + _COLUNAS // 2)
+
+    def _candidatos(self, lat, lon, raio_km):
+        """Índices dos pontos nas células que cobrem o círculo de `raio_km`."""
+        delta_lat = raio_km / KM_POR_GRAU
+        lat_extrema = min(89.9, abs(lat) + delta_lat)
+        delta_lon = min(180.0, raio_km / (KM_POR_GRAU * math.cos(math.radians(lat_extrema))))
+        linha_min, coluna_min = self._linha_coluna(lat - delta_lat, lon - delta_lon)
+        linha_max, coluna_max = self._linha_coluna(lat + delta_lat, lon + delta_lon)
+
+        linhas = np.arange(int(linha_min), int(linha_max) + 1, dtype=np.int64)
+        inicio = np.searchsorted(self.chaves, linhas * _COLUNAS + (int(coluna_min) + _COLUNAS // 2), 'left')
+        fim = np.searchsorted(self.chaves, linhas * _COLUNAS + (int(coluna_max) + _COLUNAS // 2), 'right')
+        if not len(linhas) or not (fim - inicio).any():
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate([np.arange(a, b) for a, b in zip(inicio.tolist(), fim.tolist()) if b > a])
+
+    def within(self, lat, lon, raio_km):
+        """`(ids, distancias_km)` dos pontos a até `raio_km`, do mais perto ao mais longe."""
+        candidatos = self._candidatos(lat, lon, raio_km)
+        if not len(candidatos):
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        distancias = haversine_matrix([lat], [lon], self.lat[candidatos], self.lon[candidatos])[0]
+        dentro = distancias <= raio_km
+        candidatos, distancias = candidatos[dentro], distancias[dentro]
+        ordem = np.argsort(distancias, kind='stable')
+        return self.ids[candidatos[ordem]], distancias[ordem]
+
+    def nearest(self, lat, lon):
+        """
+        `(id, distancia_km)` do ponto mais próximo, ou `(None, None)` se o
+        índice estiver vazio. Procura em raios que dobram a cada tentativa;
+        um resultado dentro do raio buscado é garantidamente o mais próximo.
+        """
+        if not len(self):
+            return None, None
+        raio = self.celula_graus * KM_POR_GRAU
+        while raio < 2 * 20037.5:
+            ids, distancias = self.within(lat, lon, raio)
+            if len(ids):
+                return int(ids[0]), float(distancias[0])
+            raio *= 2
+        distancias = haversine_matrix([lat], [lon], self.lat, self.lon)[0]
+        menor = int(np.argmin(distancias))
+        return int(self.ids[menor]), float(distancias[menor])
+
+
+# --- Índices do processo ---
+
+_indices = {}
+_lock = threading.Lock()
+
+
+def get_index(tipo):
+    """Índice de `tipo` (CLIENTE ou DEPOSITO), refeito se o cache mudou."""
+    cache = get_distance_cache()
+    versao = cache.version()
+    with _lock:
+        atual = _indices.get(tipo)
+        if atual is None or atual[0] != versao:
+            ids, lat, lon = cache.coordinates(tipo)
+            celula_km = float(os.getenv('SPATIAL_CELL_KM', '2'))
+            atual = (versao, GridIndex(ids, lat, lon, celula_km))
+            _indices[tipo] = atual
+        return atual[1]
+
+
+def nearest_deposito(lat, lon):
+    return get_index(DEPOSITO).nearest(lat, lon)
+
+
+def clientes_within(lat, lon, raio_km):
+    return get_index(CLIENTE).within(lat, lon, raio_km)
@@ -0,0 +1,96 @@
+import json
+import os
+import time
+from contextlib import ExitStack
+
+from flask import Response, request
+
+from . import metrics
+from .db import db_connection
+from .serialization import RowSerializer
+
+NDJSON = 'application/x-ndjson'
+
+
+def _itersize():
+    return int(os.getenv('API_STREAM_ITERSIZE', '2000'))
+
+
+def wants_stream():
+    """
+    Indica se o cliente pediu a listagem em modo streaming, seja por
+    `Accept: application/x-ndjson` ou por `?stream=1`.
+    """
+    if request.args.get('stream', '').lower() in ('1', 'true', 'sim'):
+        return True
+    return request.accept_mimetypes.best == NDJSON
+
+
+def _linhas_json(serializer, linhas):
+    row = serializer.row
+    for linha in linhas:
+        # Mesmas opções do `jsonify`, para que o corpo seja idêntico ao da
+        # listagem não-streaming.
+        yield json.dumps(row(linha), separators=(',', ':'), sort_keys=True)
+
+
+def stream_query(sql, params):
+    """
+    Executa `sql` num cursor nomeado (server-side) e devolve uma resposta
+    Flask que envia as linhas em lotes de `API_STREAM_ITERSIZE`, sem nunca
+    carregar o resultado inteiro na memória do worker.
+
+    Com `Accept: application/x-ndjson` cada linha vira um objeto JSON por
+    linha; caso contrário o corpo é a mesma lista JSON das listagens
+    normais, só que enviada em pedaços (chunked).
+    """
+    ndjson = request.accept_mimetypes.best == NDJSON
+    itersize = _itersize()
+
+    # A conexão é emprestada já aqui, para que uma falha no pool ainda vire
+    # um erro 500 normal, e devolvida quando a resposta terminar (ou quando
+    # o cliente desconectar antes de o gerador começar).
+    pilha = ExitStack()
+    conn = pilha.enter_context(db_connection())
+    # O corpo é gerado depois do handler; os lotes somam na mesma medição
+    # (`metrics.py`), que só termina quando a resposta é fechada.
+    medicao = metrics.current()
+
+    def buscar(cur):
+        inicio = time.perf_counter()
+        lote = cur.fetchmany(itersize)
+        if medicao is not None:
+            medicao.consulta += time.perf_counter() - inicio
+            medicao.linhas += len(lote)
+        return lote
+
+    def gerar():
+        with pilha:
+            cur = conn.cursor(name='casasbahia_stream')
+            cur.itersize = itersize
+            cur.execute(sql, params)
+
+            lote = buscar(cur)
+            serializer = RowSerializer.from_cursor(cur)
+            primeiro = True
+            if not ndjson:
+                yield '['
+            while lote:
+                inicio = time.perf_counter()
+                if ndjson:
+                    pedaco = ''.join(linha + '\n' for linha in _linhas_json(serializer, lote))
+                else:
+                    pedaco = ','.join(_linhas_json(serializer, lote))
+                    pedaco = pedaco if primeiro else ',' + pedaco
+                if medicao is not None:
+                    medicao.serializacao += time.perf_counter() - inicio
+                yield pedaco
+                primeiro = False
+                lote = buscar(cur)
+            if not ndjson:
+                yield ']'
+            cur.close()
+
+    resposta = Response(gerar(), mimetype=NDJSON if ndjson else 'application/json')
+    resposta.call_on_close(pilha.close)
+    return resposta
@@ -0,0 +1,244 @@
+"""
+Sincronização incremental (`?desde=`) de clientes, rotas e entregas.
+
+Cada linha dessas tabelas tem `versao` e `atualizado_em`, mantidas por
+gatilhos em qualquer INSERT/UPDATE (da API ou não), e cada DELETE deixa uma
+lápide em `cadeiraextensao.exclusoes`. O DDL está em `SQL_SYNC` (migração 4
+de `app.migrations`).
+
+A `versao` é o id da transação que gravou a linha
+(`pg_current_xact_id()`), não um contador: uma transação que começou antes
+pode terminar depois de outra, e um contador sequencial deixaria linhas para
+trás. O token devolvido ao cliente é o `xmin` do snapshot da consulta (a
+transação mais antiga ainda em andamento), então toda linha que ainda não
+estava visível tem `versao` maior ou igual ao token e aparece na próxima
+sincronização. Em troca, uma mesma linha pode vir repetida; o cliente deve
+tratar `alteradas` como upsert.
+"""
+import os
+from datetime import datetime, timedelta, timezone
+
+from .pagination import InvalidQueryParameter
+from .serialization import fetch_all
+
+# Tabela -> chave primária das tabelas com controle de alterações.
+TABELAS = {
+    'clientes': 'cliente_id',
+    'rotas': 'rota_id',
+    'entregas': 'entrega_id',
+}
+
+SQL_SYNC = """
+CREATE TABLE IF NOT EXISTS cadeiraextensao.exclusoes (
+    tabela text NOT NULL,
+    registro_id integer NOT NULL,
+    rota_id integer,
+    operacao text NOT NULL,
+    versao bigint NOT NULL,
+    excluido_em timestamptz NOT NULL DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS exclusoes_tabela_versao_idx
+    ON cadeiraextensao.exclusoes (tabela, versao);
+CREATE INDEX IF NOT EXISTS exclusoes_tabela_excluido_em_idx
+    ON cadeiraextensao.exclusoes (tabela, excluido_em);
+
+CREATE OR REPLACE FUNCTION cadeiraextensao.marcar_alteracao() RETURNS trigger AS $$
+BEGIN
+    NEW.versao := pg_current_xact_id()::text::bigint;
+    NEW.atualizado_em := now();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+-- DELETE deixa uma lápide. Uma entrega que troca de rota também deixa uma
+-- ('SAIDA'), para quem sincroniza só as entregas da rota antiga.
+CREATE OR REPLACE FUNCTION cadeiraextensao.registrar_exclusao() RETURNS trigger AS $$
+DECLARE
+    antiga jsonb := to_jsonb(OLD);
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        INSERT INTO cadeiraextensao.exclusoes (tabela, registro_id, rota_id, operacao, versao)
+        VALUES (TG_TABLE_NAME, (antiga->>TG_ARGV[0])::integer, (antiga->>'rota_id')::integer,
+                'DELETE', pg_current_xact_id()::text::bigint);
+    ELSIF OLD.rota_id IS NOT NULL AND OLD.rota_id IS DISTINCT FROM NEW.rota_id THEN
+        INSERT INTO cadeiraextensao.exclusoes (tabela, registro_id, rota_id, operacao, versao)
+        VALUES (TG_TABLE_NAME, (antiga->>TG_ARGV[0])::integer, OLD.rota_id,
+                'SAIDA', pg_current_xact_id()::text::bigint);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+_SQL_TABELA = """
+ALTER TABLE cadeiraextensao.{tabela}
+    ADD COLUMN IF NOT EXISTS versao bigint,
+    ADD COLUMN IF NOT EXISTS atualizado_em timestamptz;
+UPDATE cadeiraextensao.{tabela} SET versao = 0, atualizado_em = now() WHERE versao IS NULL;
+CREATE INDEX IF NOT EXISTS {tabela}_versao_idx ON cadeiraextensao.{tabela} (versao, {chave});
+CREATE INDEX IF NOT EXISTS {tabela}_atualizado_em_idx ON cadeiraextensao.{tabela} (atualizado_em);
+DROP TRIGGER IF EXISTS {tabela}_marcar_alteracao ON cadeiraextensao.{tabela};
+CREATE TRIGGER {tabela}_marcar_alteracao
+    BEFORE INSERT OR UPDATE ON cadeiraextensao.{tabela}
+    FOR EACH ROW EXECUTE FUNCTION cadeiraextensao.marcar_alteracao();
+DROP TRIGGER IF EXISTS {tabela}_registrar_exclusao ON cadeiraextensao.{tabela};
+CREATE TRIGGER {tabela}_registrar_exclusao
+    AFTER {eventos} ON cadeiraextensao.{tabela}
+    FOR EACH ROW EXECUTE FUNCTION cadeiraextensao.registrar_exclusao('{chave}');
+"""
+
+for _tabela, _chave in TABELAS.items():
+    SQL_SYNC += _SQL_TABELA.format(
+        tabela=_tabela, chave=_chave,
+        eventos='DELETE OR UPDATE OF rota_id' if _tabela == 'entregas' else 'DELETE',
+    )
+
+
+_EPOCA = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def _limites():
+    return (
+        int(os.getenv('API_SYNC_LIMIT', '1000')),
+        int(os.getenv('API_SYNC_MAX_LIMIT', '5000')),
+    )
+
+
+class SyncQuery:
+    """
+    Uma página de sincronização de `tabela`.
+
+    `desde` é o token da sincronização anterior (`0` para a primeira) ou um
+    instante ISO 8601 (`atualizado_em` a partir dele). Quando as alterações
+    não cabem em `limit`, o token devolvido é de continuação (`mais: true`)
+    e o cliente repete a chamada com ele até receber `mais: false`; só então
+    o token é o de uma sincronização completa.
+
+    Em `entregas`, `?rota_id=` restringe a sincronização a uma rota; as
+    entregas que saem dela vêm em `excluidas`.
+    """
+
+    def __init__(self, tabela, args, colunas='*'):
+        self.tabela = tabela
+        # Precisa ter `versao` e a chave, que formam o token.
+        self.colunas = colunas
+        self.chave = TABELAS[tabela]
+        self.desde, self.instante, self.xmin, self.cursor = self._token(args.get('desde', ''))
+
+        limite_padrao, limite_maximo = _limites()
+        limite = args.get('limit')
+        try:
+            self.limit = int(limite) if limite else limite_padrao
+        except ValueError:
+            raise InvalidQueryParameter("O parâmetro 'limit' deve ser um número inteiro")
+        if self.limit < 1:
+            raise InvalidQueryParameter("O parâmetro 'limit' deve ser maior que zero")
+        self.limit = min(self.limit, limite_maximo)
+
+        self.rota_id = None
+        if tabela == 'entregas' and args.get('rota_id'):
+            try:
+                self.rota_id = int(args['rota_id'])
+            except ValueError:
+                raise InvalidQueryParameter(f"Valor inválido para o filtro 'rota_id': {args['rota_id']}")
+
+    @staticmethod
+    def _token(texto):
+        """`(desde, instante, xmin, cursor)` a partir do parâmetro `desde`."""
+        partes = texto.split('.')
+        # Continuação de uma sincronização por instante: `t<microssegundos desde 1970>`.
+        if len(partes) == 4 and partes[0].startswith('t') and all(
+                parte.isdigit() for parte in (partes[0][1:], *partes[1:])):
+            instante = _EPOCA + timedelta(microseconds=int(partes[0][1:]))
+            return 0, instante, int(partes[1]), (int(partes[2]), int(partes[3]))
+        if all(parte.isdigit() for parte in partes) and len(partes) in (1, 4):
+            numeros = [int(parte) for parte in partes]
+            if len(numeros) == 1:
+                return numeros[0], None, None, None
+            return numeros[0], None, numeros[1], (numeros[2], numeros[3])
+        try:
+            return 0, datetime.fromisoformat(texto), None, None
+        except ValueError:
+            raise InvalidQueryParameter(
+                "O parâmetro 'desde' deve ser um token de sincronização ou uma data/hora ISO 8601"
+            )
+
+    @property
+    def sql_alteradas(self):
+        """`(sql, params)` das linhas alteradas da página."""
+        # Por instante, o filtro vai pelo índice de `atualizado_em`.
+        if self.instante is None:
+            condicoes, params = ['versao >= %s'], [self.desde]
+        else:
+            condicoes, params = ['atualizado_em >= %s'], [self.instante]
+        if self.cursor is not None:
+            condicoes.append(f'(versao, {self.chave}) > (%s, %s)')
+            params.extend(self.cursor)
+        if self.rota_id is not None:
+            condicoes.append('rota_id = %s')
+            params.append(self.rota_id)
+        return (
+            f'SELECT {self.colunas} FROM cadeiraextensao.{self.tabela} WHERE {" AND ".join(condicoes)} '
+            f'ORDER BY versao, {self.chave} LIMIT {self.limit + 1};',
+            params
+        )
+
+    @property
+    def sql_excluidas(self):
+        """`(sql, params)` das lápides desde o token."""
+        if self.instante is None:
+            condicoes, params = ['tabela = %s', 'versao >= %s'], [self.tabela, self.desde]
+        else:
+            condicoes, params = ['tabela = %s', 'excluido_em >= %s'], [self.tabela, self.instante]
+        if self.rota_id is None:
+            # Sem filtro de rota, trocar de rota não é exclusão.
+            condicoes.append("operacao = 'DELETE'")
+        else:
+            condicoes.append('rota_id = %s')
+            params.append(self.rota_id)
+        return (
+            f'SELECT DISTINCT registro_id FROM cadeiraextensao.exclusoes '
+            f'WHERE {" AND ".join(condicoes)} ORDER BY registro_id;',
+            params
+        )
+
+    def run(self, cur):
+        """
+        Executa a página no cursor `cur` e devolve o corpo da resposta:
+        `alteradas` (linhas completas), `excluidas` (ids), `token` e `mais`.
+
+        As lápides vêm todas na primeira página; o cliente deve aplicar
+        `excluidas` antes de `alteradas`.
+        """
+        # O xmin vem antes das consultas: o que elas enxergarem a mais só
+        # repete linhas na próxima vez, nunca as perde.
+        if self.xmin is None:
+            # O instante sem fuso é resolvido no fuso da sessão, como no filtro,
+            # para entrar no token de continuação sem mudar de sentido.
+            cur.execute(
+                'SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint, %s::timestamptz;',
+                (self.instante,)
+            )
+            self.xmin, instante = cur.fetchone()
+            if instante is not None:
+                self.instante = instante
+        cur.execute(*self.sql_alteradas)
+        alteradas = fetch_all(cur)
+        # Na primeira sincronização (desde=0) o cliente não tem o que excluir.
+        excluidas = []
+        if self.cursor is None and not (self.desde == 0 and self.instante is None):
+            cur.execute(*self.sql_excluidas)
+            excluidas = [linha[0] for linha in cur.fetchall()]
+
+        mais = len(alteradas) > self.limit
+        if mais:
+            alteradas = alteradas[:self.limit]
+            ultima = alteradas[-1]
+            if self.instante is None:
+                origem = self.desde
+            else:
+                origem = f't{(self.instante - _EPOCA) // timedelta(microseconds=1)}'
+            token = f'{origem}.{self.xmin}.{ultima["versao"]}.{ultima[self.chave]}'
+        else:
+            token = str(self.xmin)
+        return {"alteradas": alteradas, "excluidas": excluidas, "token": token, "mais": mais}
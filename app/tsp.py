@@ -0,0 +1,206 @@
+"""
+Sequenciamento de paradas de uma rota (Problema do Caixeiro Viajante).
+
+O problema resolvido aqui é o de caminho com extremos fixos: sair do
+depósito de partida, visitar todas as paradas e terminar no depósito de
+chegada (que pode ou não ser o mesmo). Quando um dos depósitos não tem
+coordenadas, o extremo correspondente fica livre.
+
+A solução é heurística: vizinho mais próximo para construir um caminho
+inicial, seguido de busca local 2-opt e Or-opt até não haver melhora ou até
+o tempo limite acabar. Para rotas de algumas centenas de paradas isso fica
+tipicamente a poucos por cento do ótimo, em bem menos de um segundo.
+"""
+import math
+import time
+
+RAIO_TERRA_KM = 6371.0088
+
+# Melhoras menores que isso são ignoradas, para não ficar trocando arestas
+# por ruído de ponto flutuante.
+_EPSILON = 1e-9
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Distância em km pela superfície da Terra entre dois pontos GPS."""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * RAIO_TERRA_KM * math.asin(math.sqrt(a))
+
+
+def distance_matrix(pontos):
+    """Matriz (lista de listas) de distâncias haversine entre `(lat, lon)`."""
+    rad = [(math.radians(lat), math.radians(lon)) for lat, lon in pontos]
+    cos_lat = [math.cos(lat) for lat, _ in rad]
+    n = len(rad)
+    matriz = [[0.0] * n for _ in range(n)]
+    for i in range(n):
+        lat_i, lon_i = rad[i]
+        linha = matriz[i]
+        for j in range(i + 1, n):
+            lat_j, lon_j = rad[j]
+            a = (math.sin((lat_j - lat_i) / 2) ** 2
+                 + cos_lat[i] * cos_lat[j] * math.sin((lon_j - lon_i) / 2) ** 2)
+            d = 2 * RAIO_TERRA_KM * math.asin(min(1.0, math.sqrt(a)))
+            linha[j] = d
+            matriz[j][i] = d
+    return matriz
+
+
+def path_length(dist, caminho):
+    """Comprimento total de um caminho (lista de índices da matriz)."""
+    return sum(dist[a][b] for a, b in zip(caminho, caminho[1:]))
+
+
+def _vizinho_mais_proximo(dist, inicio, fim, paradas):
+    caminho = [inicio]
+    restantes = set(paradas)
+    atual = inicio
+    while restantes:
+        linha = dist[atual]
+        atual = min(restantes, key=linha.__getitem__)
+        restantes.remove(atual)
+        caminho.append(atual)
+    caminho.append(fim)
+    return caminho
+
+
+def _two_opt(dist, caminho, prazo):
+    """Inverte trechos enquanto houver cruzamentos que encurtem o caminho."""
+    n = len(caminho)
+    melhorou = False
+    houve_troca = True
+    while houve_troca:
+        houve_troca = False
+        for i in range(n - 3):
+            if time.monotonic() > prazo:
+                return melhorou
+            a, b = caminho[i], caminho[i + 1]
+            da, db = dist[a], dist[b]
+            d_ab = da[b]
+            for j in range(i + 2, n - 1):
+                c, e = caminho[j], caminho[j + 1]
+                delta = da[c] + db[e] - d_ab - dist[c][e]
+                if delta < -_EPSILON:
+                    caminho[i + 1:j + 1] = caminho[j:i:-1]
+                    b = caminho[i + 1]
+                    db = dist[b]
+                    d_ab = da[b]
+                    houve_troca = melhorou = True
+    return melhorou
+
+
+def _or_opt(dist, caminho, prazo):
+    """Move trechos de 1 a 3 paradas para a posição mais barata do caminho."""
+    melhorou = False
+    houve_troca = True
+    while houve_troca:
+        houve_troca = False
+        for tamanho in (1, 2, 3):
+            i = 1
+            while i + tamanho < len(caminho):
+                if time.monotonic() > prazo:
+                    return melhorou
+                n = len(caminho)
+                anterior, proximo = caminho[i - 1], caminho[i + tamanho]
+                primeiro, ultimo = caminho[i], caminho[i + tamanho - 1]
+                ganho = (dist[anterior][primeiro] + dist[ultimo][proximo]
+                         - dist[anterior][proximo])
+                if ganho <= _EPSILON:
+                    i += 1
+                    continue
+
+                melhor, destino, invertido = ganho, None, False
+                d_primeiro, d_ultimo = dist[primeiro], dist[ultimo]
+                for k in range(n - 1):
+                    if i - 1 <= k < i + tamanho:
+                        continue
+                    p, q = caminho[k], caminho[k + 1]
+                    d_pq = dist[p][q]
+                    custo = d_primeiro[p] + d_ultimo[q] - d_pq
+                    if custo < melhor - _EPSILON:
+                        melhor, destino, invertido = custo, k, False
+                    custo = d_ultimo[p] + d_primeiro[q] - d_pq
+                    if custo < melhor - _EPSILON:
+                        melhor, destino, invertido = custo, k, True
+
+                if destino is None:
+                    i += 1
+                    continue
+                trecho = caminho[i:i + tamanho]
+                if invertido:
+                    trecho.reverse()
+                del caminho[i:i + tamanho]
+                if destino > i:
+                    destino -= tamanho
+                caminho[destino + 1:destino + 1] = trecho
+                houve_troca = melhorou = True
+    return melhorou
+
+
+def solve_path(dist, inicio, fim, paradas, tempo_limite=0.5):
+    """
+    Ordena `paradas` (índices de `dist`) minimizando a distância do caminho
+    `inicio -> paradas -> fim`. `inicio` e `fim` são índices fixos de `dist`
+    e podem ser o mesmo nó (rota circular).
+
+    Retorna a lista de paradas na ordem de visita.
+    """
+    if len(paradas) <= 1:
+        return list(paradas)
+    prazo = time.monotonic() + tempo_limite
+    caminho = _vizinho_mais_proximo(dist, inicio, fim, paradas)
+    while time.monotonic() < prazo:
+        melhorou = _two_opt(dist, caminho, prazo)
+        melhorou = _or_opt(dist, caminho, prazo) or melhorou
+        if not melhorou:
+            break
+    return caminho[1:-1]
+
+
+def sequence_stops(paradas, partida=None, chegada=None, tempo_limite=0.5):
+    """
+    Ordena paradas dadas como `(lat, lon)`, saindo de `partida` e terminando
+    em `chegada` (também `(lat, lon)`, ou None para extremo livre).
+
+    Retorna `(ordem, distancia_km)`, onde `ordem` são os índices de
+    `paradas` na sequência de visita e `distancia_km` inclui os trechos de
+    ida e volta aos depósitos.
+    """
+    n = len(paradas)
+    pontos = list(paradas)
+    inicio = fim = None
+    if partida is not None:
+        inicio = len(pontos)
+        pontos.append(partida)
+    if chegada is not None:
+        fim = len(pontos)
+        pontos.append(chegada)
+    dist = distance_matrix(pontos)
+
+    # Extremos livres viram um nó fictício a distância zero de todos.
+    for _ in range(2):
+        livre = inicio is None or fim is None
+        if not livre:
+            break
+        for linha in dist:
+            linha.append(0.0)
+        dist.append([0.0] * (len(dist) + 1))
+        if inicio is None:
+            inicio = len(dist) - 1
+        else:
+            fim = len(dist) - 1
+
+    ordem = solve_path(dist, inicio, fim, list(range(n)), tempo_limite)
+    return ordem, path_length(dist, [inicio] + ordem + [fim])
+
+
+def sequence_length(paradas, ordem, partida=None, chegada=None):
+    """Distância em km percorrendo `paradas` na `ordem` dada, com os depósitos."""
+    pontos = [paradas[i] for i in ordem]
+    if partida is not None:
+        pontos.insert(0, partida)
+    if chegada is not None:
+        pontos.append(chegada)
+    return sum(haversine_km(*a, *b) for a, b in zip(pontos, pontos[1:]))
@@ -0,0 +1,157 @@
+"""
+Contador de versão por tabela, compartilhado entre os workers.
+
+Cada handler de escrita chama `bump(tabela, ...)` depois do commit; os GETs
+usam `snapshot(...)` para montar o ETag e o Last-Modified sem consultar o
+banco. Os contadores ficam em `versoes.npy` (int64, mapeado com
+`numpy.memmap` como o cache de distâncias), no diretório
+`TABLE_VERSIONS_DIR`:
+
+    [época, versão_clientes, modificação_clientes, versão_depositos, ...]
+
+A época é aleatória e criada junto com o arquivo: se ele for apagado (ou a
+máquina reiniciar e limpar o /tmp), os contadores recomeçam do zero mas
+nenhum ETag antigo volta a valer.
+
+A "modificação" é um instante em segundos inteiros, estritamente crescente
+a cada escrita (no mínimo o segundo seguinte ao anterior). Como o
+`Last-Modified` do HTTP só tem resolução de segundos, isso garante que duas
+versões diferentes nunca tenham o mesmo `Last-Modified`.
+
+Escritas feitas direto no banco, fora da API, não são percebidas.
+"""
+import fcntl
+import math
+import os
+import secrets
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+TABELAS = ('clientes', 'depositos', 'veiculos', 'motoristas', 'rotas', 'entregas')
+_POSICAO = {tabela: 1 + 2 * i for i, tabela in enumerate(TABELAS)}
+_EPOCA = 0
+
+
+class TableVersions:
+    """Acesso aos contadores guardados em `diretorio`."""
+
+    def __init__(self, diretorio):
+        self.diretorio = diretorio
+        self._lock = threading.Lock()
+        self._inode = None
+        self._dados = None
+
+    def _caminho(self, nome):
+        return os.path.join(self.diretorio, nome)
+
+    def _exclusivo(self):
+        os.makedirs(self.diretorio, exist_ok=True)
+        arquivo = open(self._caminho('.lock'), 'a+')
+        fcntl.flock(arquivo, fcntl.LOCK_EX)
+        return arquivo
+
+    def _criar(self):
+        """Cria o arquivo (sob o lock), com todas as tabelas modificadas 'agora'."""
+        dados = np.zeros(1 + 2 * len(TABELAS), dtype=np.int64)
+        dados[_EPOCA] = secrets.randbits(62)
+        dados[2::2] = math.ceil(time.time())
+        fd, temporario = tempfile.mkstemp(dir=self.diretorio, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as arquivo:
+            np.save(arquivo, dados)
+        os.replace(temporario, self._caminho('versoes.npy'))
+
+    def _mapa(self, travado=False):
+        """
+        O array mapeado, reaberto se o arquivo foi recriado por outro worker.
+        `travado` indica que quem chama já tem o flock: pegar de novo, por
+        outro descritor, travaria o próprio processo.
+        """
+        try:
+            inode = os.stat(self._caminho('versoes.npy')).st_ino
+        except FileNotFoundError:
+            arquivo = None if travado else self._exclusivo()
+            try:
+                if not os.path.exists(self._caminho('versoes.npy')):
+                    self._criar()
+            finally:
+                if arquivo is not None:
+                    arquivo.close()
+            inode = os.stat(self._caminho('versoes.npy')).st_ino
+        if inode != self._inode:
+            self._dados = np.load(self._caminho('versoes.npy'), mmap_mode='r+')
+            self._inode = inode
+        return self._dados
+
+    def bump(self, *tabelas):
+        """Registra uma escrita em cada uma de `tabelas`."""
+        with self._lock:
+            arquivo = self._exclusivo()
+            try:
+                dados = self._mapa(travado=True)
+                agora = math.ceil(time.time())
+                for tabela in tabelas:
+                    posicao = _POSICAO[tabela]
+                    dados[posicao] += 1
+                    dados[posicao + 1] = max(agora, int(dados[posicao + 1]) + 1)
+            finally:
+                arquivo.close()
+
+    def snapshot(self, tabelas):
+        """
+        `(chave, modificacao)`: `chave` é uma tupla que muda sempre que
+        alguma das `tabelas` muda, e `modificacao` o instante (segundos
+        desde a época Unix) da última escrita entre elas.
+        """
+        with self._lock:
+            dados = self._mapa()
+            posicoes = [_POSICAO[tabela] for tabela in tabelas]
+            chave = (int(dados[_EPOCA]),) + tuple(int(dados[p]) for p in posicoes)
+            modificacao = max(int(dados[p + 1]) for p in posicoes)
+        return chave, modificacao
+
+
+_versoes = None
+_versoes_lock = threading.Lock()
+
+
+def _apos_fork_no_filho():
+    global _versoes_lock
+    _versoes_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_apos_fork_no_filho)
+
+
+def get_versions():
+    global _versoes
+    with _versoes_lock:
+        if _versoes is None:
+            _versoes = TableVersions(os.getenv(
+                'TABLE_VERSIONS_DIR', os.path.join(tempfile.gettempdir(), 'casasbahia_versoes')
+            ))
+        return _versoes
+
+
+def bump(*tabelas):
+    """
+    Registra escritas. Falhas aqui nunca derrubam a requisição; o arquivo é
+    apagado para que a próxima leitura crie outra época e nenhum ETag
+    antigo seja confirmado por engano.
+    """
+    versoes = get_versions()
+    try:
+        versoes.bump(*tabelas)
+    except OSError as e:
+        print(f"Erro ao atualizar as versões das tabelas: {e}")
+        try:
+            os.remove(versoes._caminho('versoes.npy'))
+        except OSError:
+            pass
+
+
+def snapshot(tabelas):
+    return get_versions().snapshot(tabelas)
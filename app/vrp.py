@@ -0,0 +1,221 @@
+"""
+Planejamento de rotas com vários veículos (VRP) a partir das entregas
+pendentes.
+
+Cada entrega é atribuída ao depósito mais próximo entre os que têm
+veículos disponíveis, e cada depósito vira um subproblema independente:
+dividir suas entregas entre os veículos de base nele, com no máximo
+`max_entregas` paradas por veículo, minimizando a distância total de rotas
+que saem e voltam ao depósito.
+
+O subproblema é resolvido pelo método de varredura (sweep): as paradas são
+ordenadas pelo ângulo em torno do depósito e fatiadas em grupos
+consecutivos, testando vários ângulos de início; o melhor corte é então
+sequenciado com a busca local de `app.tsp`. Os depósitos são resolvidos em
+paralelo num pool de processos, que também sequencia as rotas otimizadas
+uma a uma (`sequence_route`).
+"""
+import math
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FuturesTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+
+import numpy as np
+
+from .distances import haversine_matrix
+from .tsp import path_length, sequence_stops, solve_path
+
+# Fração do tempo usada para escolher o ângulo de início da varredura; o
+# restante vai para a busca local de cada rota.
+_FRACAO_VARREDURA = 0.3
+
+
+def _comprimento_nn(dist):
+    """Custo da rota pelo vizinho mais próximo (estimativa rápida)."""
+    n = len(dist)
+    if n <= 1:
+        return 0.0
+    restantes = set(range(1, n))
+    atual, total = 0, 0.0
+    while restantes:
+        linha = dist[atual]
+        proximo = min(restantes, key=linha.__getitem__)
+        total += linha[proximo]
+        restantes.remove(proximo)
+        atual = proximo
+    return total + dist[atual][0]
+
+
+def _matriz(base, pontos):
+    todos = np.vstack([base, pontos]) if len(pontos) else np.array([base])
+    return haversine_matrix(todos[:, 0], todos[:, 1], todos[:, 0], todos[:, 1]).tolist()
+
+
+def _grupos(ordem, n_grupos, max_por_grupo):
+    """Fatia `ordem` em até `n_grupos` grupos consecutivos de tamanho equilibrado."""
+    n = len(ordem)
+    n_grupos = min(n_grupos, max(1, math.ceil(n / max_por_grupo)))
+    tamanho, sobra = divmod(n, n_grupos)
+    grupos, inicio = [], 0
+    for g in range(n_grupos):
+        fim = inicio + tamanho + (1 if g < sobra else 0)
+        grupos.append(ordem[inicio:fim])
+        inicio = fim
+    return [g for g in grupos if g]
+
+
+def solve_depot(base, pontos, n_veiculos, max_por_veiculo, tempo_limite):
+    """
+    Resolve um depósito. `base` é `(lat, lon)` do depósito e `pontos` a
+    lista de `(lat, lon)` das entregas.
+
+    Retorna a lista de rotas, cada uma `(indices_em_pontos, distancia_km)`,
+    e a lista de índices que não couberam (quando `n_veiculos *
+    max_por_veiculo` é menor que o número de entregas).
+    """
+    prazo = time.monotonic() + tempo_limite
+    pontos = np.asarray(pontos, dtype=np.float64).reshape(-1, 2)
+    capacidade = n_veiculos * max_por_veiculo
+    if not len(pontos) or n_veiculos < 1:
+        return [], list(range(len(pontos)))
+
+    # Ângulo de cada parada em torno do depósito (longitude escalada pelo
+    # cosseno da latitude para não distorcer as direções).
+    escala = math.cos(math.radians(base[0]))
+    angulos = np.arctan2(pontos[:, 0] - base[0], (pontos[:, 1] - base[1]) * escala)
+
+    # Se não cabe tudo, ficam de fora as paradas mais distantes do depósito.
+    sobra = []
+    if len(pontos) > capacidade:
+        distancia_base = haversine_matrix([base[0]], [base[1]], pontos[:, 0], pontos[:, 1])[0]
+        por_distancia = np.argsort(distancia_base, kind='stable')
+        sobra = sorted(por_distancia[capacidade:].tolist())
+        atendidas = np.sort(por_distancia[:capacidade])
+    else:
+        atendidas = np.arange(len(pontos))
+
+    ordem_angular = atendidas[np.argsort(angulos[atendidas], kind='stable')].tolist()
+    n = len(ordem_angular)
+
+    # Testa vários pontos de corte da varredura e fica com o de menor custo
+    # estimado pelo vizinho mais próximo.
+    prazo_varredura = time.monotonic() + tempo_limite * _FRACAO_VARREDURA
+    melhor_custo, melhores_grupos = None, None
+    tentativas = min(n, 36)
+    for t in range(tentativas):
+        deslocamento = (t * n) // tentativas
+        ordem = ordem_angular[deslocamento:] + ordem_angular[:deslocamento]
+        grupos = _grupos(ordem, n_veiculos, max_por_veiculo)
+        custo = sum(_comprimento_nn(_matriz(base, pontos[g])) for g in grupos)
+        if melhor_custo is None or custo < melhor_custo:
+            melhor_custo, melhores_grupos = custo, grupos
+        if time.monotonic() > prazo_varredura:
+            break
+
+    rotas = []
+    for k, grupo in enumerate(melhores_grupos):
+        restante = max(0.0, prazo - time.monotonic())
+        dist = _matriz(base, pontos[grupo])
+        ordem = solve_path(dist, 0, 0, list(range(1, len(grupo) + 1)),
+                           restante / (len(melhores_grupos) - k))
+        rotas.append(([grupo[i - 1] for i in ordem], path_length(dist, [0] + ordem + [0])))
+    return rotas, sobra
+
+
+class PlanningTimeout(Exception):
+    """Levantada quando o pool de processos não devolve a solução a tempo (ou falha)."""
+
+
+# --- Pool de processos (um por worker, criado sob demanda) ---
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def _processos():
+    """Tamanho do pool (`VRP_PROCESSES`, padrão: número de CPUs, mínimo 1)."""
+    return max(1, int(os.getenv('VRP_PROCESSES', str(os.cpu_count() or 1))))
+
+
+def _get_executor():
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            # 'spawn' em vez de 'fork': o worker do gunicorn pode ter threads
+            # e conexões abertas que não devem ser duplicadas.
+            _executor = ProcessPoolExecutor(
+                max_workers=_processos(),
+                mp_context=get_context('spawn'),
+            )
+            _executor_pid = os.getpid()
+        return _executor
+
+
+def _descartar_executor(executor):
+    """Tira `executor` de uso; o próximo planejamento cria outro pool."""
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _no_pool(funcao, chamadas, tempo_limite, tentativas=2):
+    """
+    `funcao(*argumentos)` para cada item de `chamadas`, no pool, com os
+    resultados na mesma ordem.
+
+    Mesmo uma chamada só vai para o pool: no worker gevent, calcular aqui
+    seguraria todas as greenlets (SSE e o aviso de vida ao gunicorn
+    incluídos) pelo tempo limite inteiro, enquanto esperar o resultado cede
+    a vez.
+    """
+    executor = _get_executor()
+    futuros = []
+    try:
+        futuros = [executor.submit(funcao, *argumentos, tempo_limite) for argumentos in chamadas]
+        # Um prazo só para todas as chamadas, com margem para iniciar os
+        # processos na primeira vez.
+        prazo = time.monotonic() + tempo_limite + 30
+        return [f.result(timeout=max(0.0, prazo - time.monotonic())) for f in futuros]
+    except BrokenProcessPool:
+        # Um processo do pool morreu (ex: OOM): descarta o pool e tenta num
+        # novo, sem calcular no próprio worker.
+        _descartar_executor(executor)
+        if tentativas > 1:
+            return _no_pool(funcao, chamadas, tempo_limite, tentativas - 1)
+        raise PlanningTimeout("O pool de processos do planejamento falhou")
+    except FuturesTimeoutError:
+        # O pool está travado ou sobrecarregado: cancela o que ainda não
+        # começou, troca o pool e deixa o cliente tentar de novo.
+        for futuro in futuros:
+            futuro.cancel()
+        _descartar_executor(executor)
+        raise PlanningTimeout("Tempo esgotado aguardando o planejamento das rotas")
+
+
+def solve_depots(subproblemas, tempo_limite):
+    """
+    Resolve vários depósitos em paralelo no pool. Cada item de
+    `subproblemas` é `(base, pontos, n_veiculos, max_por_veiculo)`; o
+    resultado segue a mesma ordem.
+    """
+    return _no_pool(solve_depot, subproblemas, tempo_limite)
+
+
+def sequence_route(paradas, partida, chegada, tempo_limite):
+    """`tsp.sequence_stops` de uma rota, calculado no pool."""
+    [resultado] = _no_pool(sequence_stops, [(paradas, partida, chegada)], tempo_limite)
+    return resultado
+
+
+def assign_to_depots(pontos, bases):
+    """Índice da base mais próxima de cada ponto (arrays `(lat, lon)`)."""
+    pontos = np.asarray(pontos, dtype=np.float64).reshape(-1, 2)
+    bases = np.asarray(bases, dtype=np.float64).reshape(-1, 2)
+    dist = haversine_matrix(pontos[:, 0], pontos[:, 1], bases[:, 0], bases[:, 1])
+    return np.argmin(dist, axis=1)
@@ -0,0 +1,252 @@
+"""
+Fila de escrita adiada (write-behind) para os `PUT /entregas/<id>`.
+
+Com `ENTREGA_WRITE_BEHIND=1` o PUT de entrega não grava no banco na hora:
+a alteração entra numa fila limitada do processo, agrupada por
+`entrega_id` (a última escrita vence, mas o horário do primeiro 'Entregue'
+é preservado), e uma thread em segundo plano grava os lotes a cada
+`WRITE_QUEUE_FLUSH_MS` ms ou quando acumulam `WRITE_QUEUE_BATCH` entregas,
+cada lote numa única transação. Com a fila cheia o PUT recebe 429, e no
+desligamento do worker o que estiver pendente é gravado antes de sair.
+"""
+import atexit
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from psycopg2.extras import execute_values
+
+from . import versions
+from .db import db_connection
+
+ENTREGUE = 'Entregue'
+
+
+def enabled():
+    return os.getenv('ENTREGA_WRITE_BEHIND', '').lower() in ('1', 'true', 'sim')
+
+
+class _Pendente:
+    """Estado agrupado das escritas ainda não gravadas de uma entrega."""
+
+    __slots__ = ('status_entrega', 'sequencia_na_rota', 'observacoes', 'entregue_em')
+
+    def __init__(self, status_entrega, sequencia_na_rota, observacoes, entregue_em):
+        self.status_entrega = status_entrega
+        self.sequencia_na_rota = sequencia_na_rota
+        self.observacoes = observacoes
+        self.entregue_em = entregue_em
+
+    def combinar(self, mais_recente):
+        """Aplica por cima uma escrita mais recente, mantendo o primeiro 'Entregue'."""
+        primeiro = min(
+            (t for t in (self.entregue_em, mais_recente.entregue_em) if t is not None),
+            default=None
+        )
+        self.status_entrega = mais_recente.status_entrega
+        self.sequencia_na_rota = mais_recente.sequencia_na_rota
+        self.observacoes = mais_recente.observacoes
+        self.entregue_em = primeiro
+
+
+class WriteQueue:
+    """
+    Fila limitada de alterações de entregas, gravada em lotes por uma thread
+    própria. `limite` é o número máximo de entregas distintas pendentes.
+    """
+
+    def __init__(self, limite=10000, lote=500, intervalo=0.2, gravar=None):
+        self.limite = limite
+        self.lote = lote
+        self.intervalo = intervalo
+        self._gravar = gravar or _gravar_lote
+        self._pendentes = OrderedDict()
+        self._cond = threading.Condition()
+        self._parar = False
+        self._thread = None
+        self._contadores = dict.fromkeys(
+            ('aceitas', 'agrupadas', 'recusadas', 'gravadas', 'lotes', 'falhas'), 0
+        )
+
+    def submit(self, entrega_id, status_entrega, sequencia_na_rota, observacoes):
+        """
+        Enfileira uma alteração. Retorna False (sem enfileirar) se a fila
+        está cheia e a entrega ainda não tinha nada pendente.
+        """
+        entregue_em = datetime.now(timezone.utc) if status_entrega == ENTREGUE else None
+        nova = _Pendente(status_entrega, sequencia_na_rota, observacoes, entregue_em)
+        with self._cond:
+            atual = self._pendentes.get(entrega_id)
+            if atual is not None:
+                atual.combinar(nova)
+                self._contadores['agrupadas'] += 1
+            elif len(self._pendentes) >= self.limite:
+                self._contadores['recusadas'] += 1
+                return False
+            else:
+                self._pendentes[entrega_id] = nova
+            self._contadores['aceitas'] += 1
+            if self._thread is None:
+                self._iniciar()
+            if len(self._pendentes) >= self.lote:
+                self._cond.notify()
+        return True
+
+    def _iniciar(self):
+        self._thread = threading.Thread(target=self._executar, name='entregas-write-behind', daemon=True)
+        self._thread.start()
+
+    def _retirar_lote(self):
+        itens = []
+        while self._pendentes and len(itens) < self.lote:
+            itens.append(self._pendentes.popitem(last=False))
+        return itens
+
+    def _devolver(self, itens):
+        """Recoloca um lote que falhou, por baixo das escritas mais novas."""
+        for entrega_id, antigo in reversed(itens):
+            mais_novo = self._pendentes.get(entrega_id)
+            if mais_novo is not None:
+                antigo.combinar(mais_novo)
+            self._pendentes[entrega_id] = antigo
+            self._pendentes.move_to_end(entrega_id, last=False)
+
+    def _executar(self):
+        while True:
+            with self._cond:
+                if not self._parar and len(self._pendentes) < self.lote:
+                    self._cond.wait(self.intervalo)
+                if self._parar:
+                    return
+                itens = self._retirar_lote()
+            if itens and not self._gravar_com_contagem(itens):
+                # Espera um intervalo antes de tentar de novo, para não
+                # martelar um banco fora do ar.
+                time.sleep(self.intervalo)
+
+    def _gravar_com_contagem(self, itens):
+        try:
+            self._gravar(itens)
+        except Exception as e:
+            print(f"Erro ao gravar lote de entregas: {e}")
+            with self._cond:
+                self._devolver(itens)
+                self._contadores['falhas'] += 1
+            return False
+        with self._cond:
+            self._contadores['gravadas'] += len(itens)
+            self._contadores['lotes'] += 1
+        return True
+
+    def drain(self, timeout=10.0):
+        """
+        Para a thread e grava tudo o que estiver pendente (usado no
+        desligamento). Desiste depois de `timeout` segundos de falhas.
+        """
+        with self._cond:
+            self._parar = True
+            self._cond.notify()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+        prazo = time.monotonic() + timeout
+        while time.monotonic() < prazo:
+            with self._cond:
+                itens = self._retirar_lote()
+            if not itens:
+                return True
+            self._gravar_com_contagem(itens)
+        return not self._pendentes
+
+    def stats(self):
+        with self._cond:
+            return dict(self._contadores, pendentes=len(self._pendentes), limite=self.limite)
+
+
+SQL_GRAVAR_LOTE = """
+UPDATE cadeiraextensao.entregas AS e
+SET status_entrega = v.status_entrega,
+    sequencia_na_rota = v.sequencia_na_rota,
+    observacoes = v.observacoes,
+    data_hora_real_entrega = CASE
+        WHEN v.entregue_em IS NULL THEN e.data_hora_real_entrega
+        -- Repetição de 'Entregue' gravada num lote anterior: fica o primeiro horário.
+        WHEN e.status_entrega = 'Entregue' AND e.data_hora_real_entrega IS NOT NULL
+            THEN LEAST(e.data_hora_real_entrega, v.entregue_em)
+        ELSE v.entregue_em
+    END
+FROM (VALUES %s) AS v(entrega_id, status_entrega, sequencia_na_rota, observacoes, entregue_em)
+WHERE e.entrega_id = v.entrega_id;
+"""
+TEMPLATE_LOTE = '(%s::int, %s::text, %s::int, %s::text, %s::timestamptz)'
+
+
+def _gravar_lote(itens):
+    """Grava um lote `[(entrega_id, _Pendente)]` num único UPDATE ... FROM (VALUES ...)."""
+    with db_connection() as conn:
+        cur = conn.cursor()
+        execute_values(
+            cur, SQL_GRAVAR_LOTE,
+            [(entrega_id, p.status_entrega, p.sequencia_na_rota, p.observacoes, p.entregue_em)
+             for entrega_id, p in itens],
+            template=TEMPLATE_LOTE,
+            page_size=len(itens)
+        )
+        conn.commit()
+        cur.close()
+    versions.bump('entregas')
+
+
+# --- Fila do processo ---
+
+_fila = None
+_fila_pid = None
+_fila_lock = threading.Lock()
+
+
+def get_queue():
+    """A fila deste processo, criada sob demanda a partir das variáveis de ambiente."""
+    global _fila, _fila_pid
+    with _fila_lock:
+        if _fila is None or _fila_pid != os.getpid():
+            _fila = WriteQueue(
+                limite=int(os.getenv('WRITE_QUEUE_MAX', '10000')),
+                lote=int(os.getenv('WRITE_QUEUE_BATCH', '500')),
+                intervalo=int(os.getenv('WRITE_QUEUE_FLUSH_MS', '200')) / 1000,
+            )
+            _fila_pid = os.getpid()
+        return _fila
+
+
+def _apos_fork_no_filho():
+    global _fila, _fila_pid, _fila_lock
+    # O filho não herda a thread, e o que estava pendente é do pai.
+    _fila_lock = threading.Lock()
+    _fila = None
+    _fila_pid = None
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_apos_fork_no_filho)
+
+
+def drain():
+    """Grava o que estiver pendente na fila deste processo."""
+    with _fila_lock:
+        fila = _fila if _fila_pid == os.getpid() else None
+    if fila is not None:
+        fila.drain(float(os.getenv('WRITE_QUEUE_DRAIN_S', '10')))
+
+
+def stats():
+    """Contadores da fila deste processo, ou None se ela ainda não foi criada."""
+    with _fila_lock:
+        fila = _fila if _fila_pid == os.getpid() else None
+    return None if fila is None else fila.stats()
+
+
+# Registrado depois do `close_pool` de db.py (importado acima), então roda
+# antes dele: o pool ainda está aberto para a última gravação.
+atexit.register(drain)
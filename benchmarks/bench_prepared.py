@@ -0,0 +1,121 @@
+"""
+Quanto os prepared statements de `app/prepared.py` economizam por endpoint.
+
+Para cada consulta quente, executa o mesmo comando `N` vezes numa única
+conexão, primeiro como SQL comum (`cur.execute`, interpretado e planejado a
+cada chamada) e depois com `PREPARE`/`EXECUTE`, e compara a latência
+mediana e o p95. Os comandos de escrita rodam dentro de uma transação
+desfeita logo em seguida, então o banco não é alterado.
+
+Os números só fazem sentido num banco migrado e populado com
+`benchmarks.seed`.
+
+Uso:
+    python -m benchmarks.bench_prepared [repeticoes]
+"""
+import statistics
+import sys
+import time
+
+from app import prepared, resources
+from app.db import get_db_connection
+
+
+def _amostra(cur):
+    """Uma linha típica de cada tabela, para montar os parâmetros."""
+    linhas = {}
+    for recurso in resources.RECURSOS.values():
+        tabela, chave = recurso.nome, recurso.chave
+        # Uma entrega com rota, para os parâmetros do UPDATE serem realistas.
+        filtro = ' WHERE rota_id IS NOT NULL' if tabela == 'entregas' else ''
+        cur.execute(
+            f'SELECT {recurso.select} FROM {recurso.tabela}{filtro} ORDER BY {chave} '
+            f'LIMIT 1 OFFSET (SELECT count(*) / 2 FROM {recurso.tabela});'
+        )
+        colunas = [d[0] for d in cur.description]
+        linhas[tabela] = dict(zip(colunas, cur.fetchone()))
+    return linhas
+
+
+def _atualizacao(recurso, linha):
+    """Parâmetros do UPDATE gerado de `recurso` que regravam `linha` como está."""
+    return tuple(linha[c.nome] for c in recurso.atualizaveis) + (linha[recurso.chave],)
+
+
+def _casos(a):
+    """(endpoint, statement, parâmetros) de cada consulta medida."""
+    r, e = a['rotas'], a['entregas']
+    casos = []
+    for recurso in resources.RECURSOS.values():
+        linha = a[recurso.nome]
+        casos.append((f'GET /{recurso.nome}/<id>', recurso.por_id, (linha[recurso.chave],)))
+    casos += [
+        ('GET /rotas/<id> (entregas)', resources.ENTREGAS_DA_ROTA, (r['rota_id'],)),
+        ('PATCH /rotas/<id>/entregas (rota existe)', prepared.ROTA_EXISTE, (r['rota_id'],)),
+    ]
+    for recurso in resources.RECURSOS.values():
+        if recurso.atualizar is not None:
+            casos.append((f'PUT /{recurso.nome}/<id>', recurso.atualizar,
+                          _atualizacao(recurso, a[recurso.nome])))
+    casos += [
+        ('PUT /entregas/<id>', prepared.ATUALIZAR_ENTREGA,
+         (e['status_entrega'], e['sequencia_na_rota'], e['observacoes'], e['status_entrega'], e['entrega_id'])),
+        ('DELETE /entregas/<id>', resources.ENTREGAS.excluir, (e['entrega_id'],)),
+    ]
+    return casos
+
+
+def _medir(conn, executar, repeticoes):
+    """Latências (ms) de `repeticoes` chamadas, cada uma na sua transação."""
+    cur = conn.cursor()
+    # Aquecimento: prepara o statement e carrega o catálogo na sessão.
+    for _ in range(5):
+        executar(cur)
+        if cur.description:
+            cur.fetchall()
+        conn.rollback()
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        executar(cur)
+        if cur.description:
+            cur.fetchall()
+        tempos.append((time.perf_counter() - inicio) * 1000)
+        conn.rollback()
+    cur.close()
+    return tempos
+
+
+def _p95(tempos):
+    return statistics.quantiles(tempos, n=20)[-1]
+
+
+def bench(conn, repeticoes=500):
+    """Mede cada caso e devolve `[(endpoint, ms_comum, ms_preparado, p95_comum, p95_preparado)]`."""
+    cur = conn.cursor()
+    casos = _casos(_amostra(cur))
+    conn.rollback()
+    cur.close()
+    resultados = []
+    for endpoint, statement, params in casos:
+        comum = _medir(conn, lambda c: c.execute(statement.sql, params), repeticoes)
+        preparado = _medir(conn, lambda c: statement.execute(c, params), repeticoes)
+        resultados.append((endpoint, statistics.median(comum), statistics.median(preparado),
+                           _p95(comum), _p95(preparado)))
+    return resultados
+
+
+if __name__ == '__main__':
+    repeticoes = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    conexao = get_db_connection()
+    if conexao is None:
+        sys.exit(1)
+    try:
+        resultados = bench(conexao, repeticoes)
+    finally:
+        conexao.close()
+    print(f"{'endpoint':<42} {'comum':>8} {'prep.':>8} {'ganho':>7} {'p95 comum':>10} {'p95 prep.':>10}")
+    for endpoint, comum, preparado, p95_comum, p95_preparado in resultados:
+        ganho = (1 - preparado / comum) * 100 if comum else 0.0
+        print(f'{endpoint:<42} {comum:>6.3f}ms {preparado:>6.3f}ms {ganho:>6.1f}% '
+              f'{p95_comum:>8.3f}ms {p95_preparado:>8.3f}ms')
@@ -0,0 +1,82 @@
+"""
+Micro-benchmark da conversão de linhas do banco em dicionários JSON.
+
+Compara o laço antigo dos handlers (`dict(zip(...))` seguido de
+`isinstance` em cada valor) com o `RowSerializer`, que decide a conversão
+de cada coluna uma única vez a partir dos OIDs de `cur.description`.
+Não precisa de banco: usa linhas sintéticas no formato de
+`cadeiraextensao.entregas` e `cadeiraextensao.clientes`.
+
+Uso:
+    python -m benchmarks.bench_serialization [linhas] [repeticoes]
+"""
+import sys
+import timeit
+from collections import namedtuple
+from datetime import date, time, datetime
+from decimal import Decimal
+
+from app.serialization import (
+    RowSerializer, NUMERIC, TIMESTAMP,
+)
+
+# OIDs de tipos que passam direto para o JSON.
+INTEGER = 23
+VARCHAR = 1043
+
+Coluna = namedtuple('Coluna', 'name type_code')
+
+CLIENTES = (
+    [Coluna('cliente_id', INTEGER), Coluna('nome_cliente', VARCHAR),
+     Coluna('endereco_cliente', VARCHAR), Coluna('gps_latitude_cliente', NUMERIC),
+     Coluna('gps_longitude_cliente', NUMERIC), Coluna('telefone_cliente', VARCHAR),
+     Coluna('email_cliente', VARCHAR)],
+    (1, 'Maria Souza', 'Rua das Flores, 100', Decimal('-23.550520'), Decimal('-46.633308'),
+     '11999990000', 'maria@example.com'),
+)
+
+ENTREGAS = (
+    [Coluna('entrega_id', INTEGER), Coluna('rota_id', INTEGER),
+     Coluna('cliente_id', INTEGER), Coluna('sequencia_na_rota', INTEGER),
+     Coluna('status_entrega', VARCHAR), Coluna('data_hora_prevista_entrega', TIMESTAMP),
+     Coluna('data_hora_real_entrega', TIMESTAMP), Coluna('observacoes', VARCHAR)],
+    (1, 10, 100, 3, 'Pendente', datetime(2024, 5, 2, 14, 30), None, 'Portão azul'),
+)
+
+
+def antes(description, linhas):
+    """Reprodução da conversão feita pelos handlers antes do RowSerializer."""
+    colunas = [desc[0] for desc in description]
+    com_objetos = [dict(zip(colunas, row)) for row in linhas]
+    serializaveis = []
+    for item in com_objetos:
+        for key, value in item.items():
+            if isinstance(value, Decimal):
+                item[key] = float(value)
+            elif isinstance(value, (date, time, datetime)):
+                item[key] = value.isoformat()
+        serializaveis.append(item)
+    return serializaveis
+
+
+def depois(description, linhas):
+    return RowSerializer(description).rows(linhas)
+
+
+def medir(nome, description, linha, n_linhas, repeticoes):
+    linhas = [linha] * n_linhas
+    assert antes(description, linhas) == depois(description, linhas)
+    resultados = {}
+    for funcao in (antes, depois):
+        melhor = min(timeit.repeat(lambda: funcao(description, linhas), number=1, repeat=repeticoes))
+        resultados[funcao.__name__] = n_linhas / melhor
+    print(f"{nome:<10} antes: {resultados['antes']:>12,.0f} linhas/s   "
+          f"depois: {resultados['depois']:>12,.0f} linhas/s   "
+          f"({resultados['depois'] / resultados['antes']:.2f}x)")
+
+
+if __name__ == '__main__':
+    n_linhas = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    repeticoes = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    medir('clientes', *CLIENTES, n_linhas, repeticoes)
+    medir('entregas', *ENTREGAS, n_linhas, repeticoes)
@@ -0,0 +1,546 @@
+"""
+Teste de carga dos endpoints da API, com comparação contra uma linha de base.
+
+Cada cenário (um endpoint com parâmetros típicos) recebe `--requisicoes`
+requisições de `--clientes` threads simultâneas, depois de um aquecimento.
+Para cada um são medidos p50/p95/p99 da latência, vazão (requisições por
+segundo) e o pico de memória residente (RSS) do servidor durante o cenário.
+
+Dois modos:
+
+* `app` (padrão): as requisições vão direto para o app Flask
+  (`test_client`), no mesmo processo; mede o custo do código da API.
+* `gunicorn`: sobe `gunicorn run:app` com `--workers` workers numa porta
+  local e usa HTTP de verdade; o RSS é a soma do master e dos workers.
+
+O banco é o configurado no .env, ou, com `--banco-local [dir]`, um
+PostgreSQL descartável criado com `initdb`/`pg_ctl` (do PATH ou de
+`PG_BIN`), migrado e populado com `benchmarks.seed` na escala pedida. Os
+cenários de escrita regravam os mesmos valores, e as entregas criadas pelo
+`POST` são apagadas pelo cenário de `DELETE`, mas use sempre um banco de
+teste.
+
+Ficam de fora os eventos SSE (conexões longas), `POST /rotas/planejar` e as
+cargas em lote, que criariam dados a cada requisição, e os `DELETE` de
+recursos com dependentes.
+
+Uso:
+    python -m benchmarks.load [--modo app|gunicorn] [--clientes 8] [--requisicoes 200]
+                              [--workers 4] [--banco-local [dir]] [--escala 1]
+                              [--volume tabela=quantidade ...] [--filtro texto]
+                              [--salvar base.json] [--base base.json] [--tolerancia 0.25]
+
+Com `--base`, sai com código 1 se algum endpoint ficou mais lento (p95) ou
+com menos vazão do que a base além da `--tolerancia` (fração; diferenças de
+p95 menores que `--folga-ms` são ignoradas, por serem ruído).
+"""
+import argparse
+import http.client
+import json
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from app.db import get_db_connection
+from app.migrations import migrate
+
+from .seed import parse_ajustes, seed
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+AMOSTRAS = 100
+
+
+# --- Banco descartável ---
+
+class BancoLocal:
+    """
+    PostgreSQL temporário, acessível só por socket Unix em `diretorio`. Ao
+    entrar, aponta as variáveis `DB_*` para ele; ao sair, para o servidor
+    (e apaga o diretório, se ele foi criado aqui).
+    """
+
+    def __init__(self, diretorio=None):
+        self.temporario = diretorio is None
+        self.diretorio = diretorio or tempfile.mkdtemp(prefix='casasbahia_pg_')
+        self.dados = os.path.join(self.diretorio, 'dados')
+
+    @staticmethod
+    def _binario(nome):
+        pasta = os.getenv('PG_BIN')
+        caminho = os.path.join(pasta, nome) if pasta else shutil.which(nome)
+        if not caminho or not os.path.exists(caminho):
+            raise RuntimeError(f"'{nome}' não encontrado: instale o PostgreSQL ou defina PG_BIN")
+        return caminho
+
+    def __enter__(self):
+        if not os.path.exists(os.path.join(self.dados, 'PG_VERSION')):
+            subprocess.run(
+                [self._binario('initdb'), '-D', self.dados, '-U', 'postgres', '-A', 'trust', '-E', 'UTF8'],
+                check=True, stdout=subprocess.DEVNULL
+            )
+        subprocess.run(
+            [self._binario('pg_ctl'), '-D', self.dados, '-w', '-l', os.path.join(self.diretorio, 'log'),
+             '-o', f"-k {self.diretorio} -c listen_addresses='' -c fsync=off", 'start'],
+            check=True, stdout=subprocess.DEVNULL
+        )
+        os.environ.update(DB_HOST=self.diretorio, DB_PORT='5432', DB_USER='postgres',
+                          DB_NAME='postgres', DB_PASSWORD='')
+        return self
+
+    def __exit__(self, *_):
+        subprocess.run([self._binario('pg_ctl'), '-D', self.dados, '-m', 'fast', 'stop'],
+                       stdout=subprocess.DEVNULL)
+        if self.temporario:
+            shutil.rmtree(self.diretorio, ignore_errors=True)
+
+
+def preparar_banco(escala, ajustes, semear):
+    """Migra o banco e, se pedido, popula (só se estiver vazio)."""
+    conexao = get_db_connection()
+    if conexao is None:
+        raise RuntimeError("Não foi possível conectar ao banco")
+    try:
+        migrate(conexao)
+        if semear:
+            cur = conexao.cursor()
+            cur.execute('SELECT EXISTS (SELECT 1 FROM cadeiraextensao.entregas);')
+            vazio = not cur.fetchone()[0]
+            cur.close()
+            if vazio:
+                print('Populando o banco...', flush=True)
+                seed(conexao, escala, ajustes)
+    finally:
+        conexao.close()
+
+
+# --- Clientes HTTP ---
+
+class ClienteApp:
+    """Requisições direto no app Flask, sem rede."""
+
+    def __init__(self, app):
+        self.app = app
+        self._local = threading.local()
+
+    def requisitar(self, metodo, caminho, corpo=None):
+        cliente = getattr(self._local, 'cliente', None)
+        if cliente is None:
+            cliente = self._local.cliente = self.app.test_client()
+        resposta = cliente.open(caminho, method=metodo, json=corpo)
+        return resposta.status_code, resposta.get_data()
+
+
+class ClienteHttp:
+    """Requisições HTTP para um servidor em `host:porta`."""
+
+    def __init__(self, host, porta):
+        self.host = host
+        self.porta = porta
+
+    def requisitar(self, metodo, caminho, corpo=None):
+        conexao = http.client.HTTPConnection(self.host, self.porta, timeout=60)
+        try:
+            cabecalhos = {}
+            dados = None
+            if corpo is not None:
+                dados = json.dumps(corpo).encode()
+                cabecalhos['Content-Type'] = 'application/json'
+            conexao.request(metodo, caminho, body=dados, headers=cabecalhos)
+            resposta = conexao.getresponse()
+            return resposta.status, resposta.read()
+        finally:
+            conexao.close()
+
+
+class Gunicorn:
+    """`gunicorn run:app` numa porta livre, enquanto durar o bloco `with`."""
+
+    def __init__(self, workers):
+        self.workers = workers
+        self.processo = None
+        with socket.socket() as s:
+            s.bind(('127.0.0.1', 0))
+            self.porta = s.getsockname()[1]
+
+    def __enter__(self):
+        self.processo = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '-w', str(self.workers), '-b', f'127.0.0.1:{self.porta}',
+             '--log-level', 'warning', 'run:app'],
+            cwd=RAIZ, env=dict(os.environ)
+        )
+        cliente = ClienteHttp('127.0.0.1', self.porta)
+        prazo = time.monotonic() + 60
+        while time.monotonic() < prazo:
+            if self.processo.poll() is not None:
+                raise RuntimeError("O gunicorn terminou durante a inicialização")
+            try:
+                if cliente.requisitar('GET', '/api/')[0] == 200:
+                    return self
+            except OSError:
+                time.sleep(0.2)
+        raise RuntimeError("O gunicorn não respondeu em 60 s")
+
+    def __exit__(self, *_):
+        self.processo.terminate()
+        try:
+            self.processo.wait(30)
+        except subprocess.TimeoutExpired:
+            self.processo.kill()
+
+
+# --- Memória ---
+
+def _filhos(pid):
+    filhos = []
+    for nome in os.listdir('/proc'):
+        if not nome.isdigit():
+            continue
+        try:
+            with open(f'/proc/{nome}/stat') as arquivo:
+                # O nome do processo (entre parênteses) pode ter espaços.
+                campos = arquivo.read().rsplit(')', 1)[1].split()
+        except OSError:
+            continue
+        if int(campos[1]) == pid:
+            filhos.append(int(nome))
+    return filhos
+
+
+def rss_mb(pids):
+    """RSS somado dos `pids` e dos filhos deles, em MB (None fora do Linux)."""
+    if not os.path.exists('/proc/self/statm'):
+        return None
+    pagina = os.sysconf('SC_PAGE_SIZE')
+    total = 0
+    for pid in pids + [filho for pid in pids for filho in _filhos(pid)]:
+        try:
+            with open(f'/proc/{pid}/statm') as arquivo:
+                total += int(arquivo.read().split()[1]) * pagina
+        except OSError:
+            pass
+    return total / 2 ** 20
+
+
+class AmostradorRSS:
+    """Guarda o maior RSS visto, lido a cada `intervalo` segundos numa thread."""
+
+    def __init__(self, pids, intervalo=0.05):
+        self.pids = pids
+        self.intervalo = intervalo
+        self.pico = None
+        self._parar = threading.Event()
+        self._thread = threading.Thread(target=self._amostrar, daemon=True)
+
+    def _amostrar(self):
+        while True:
+            valor = rss_mb(self.pids)
+            if valor is not None and (self.pico is None or valor > self.pico):
+                self.pico = valor
+            if self._parar.wait(self.intervalo):
+                return
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *_):
+        self._parar.set()
+        self._thread.join()
+
+
+# --- Cenários ---
+
+class Cenario:
+    """
+    Um endpoint com parâmetros típicos. `caminho` e `corpo` recebem os alvos
+    (ids e objetos reais do banco) e o número da requisição; `apos` recebe o
+    JSON de cada resposta bem-sucedida.
+    """
+
+    def __init__(self, nome, metodo, caminho, corpo=None, apos=None):
+        self.nome = nome
+        self.metodo = metodo
+        self.caminho = caminho
+        self.corpo = corpo
+        self.apos = apos
+
+
+def _ciclo(lista, i):
+    return lista[i % len(lista)]
+
+
+def _guardar_id(alvos):
+    def apos(resposta):
+        alvos['entregas_criadas'].append(resposta['id'])
+    return apos
+
+
+def _proxima_criada(alvos, _i):
+    # Sem entregas criadas (ex: o POST foi filtrado), apaga um id inexistente.
+    criadas = alvos['entregas_criadas']
+    return f'/api/entregas/{criadas.pop() if criadas else 0}'
+
+
+def cenarios(alvos):
+    """Os cenários medidos, na ordem (o `DELETE` consome as entregas do `POST`)."""
+    return [
+        Cenario('GET /', 'GET', lambda a, i: '/api/'),
+        Cenario('GET /clientes?limit=100', 'GET', lambda a, i: f"/api/clientes?limit=100&after={_ciclo(a['clientes'], i)}"),
+        Cenario('GET /clientes?fields=', 'GET',
+                lambda a, i: f"/api/clientes?limit=100&fields=nome_cliente&after={_ciclo(a['clientes'], i)}"),
+        Cenario('GET /clientes/<id>', 'GET', lambda a, i: f"/api/clientes/{_ciclo(a['clientes'], i)}"),
+        Cenario('GET /depositos', 'GET', lambda a, i: '/api/depositos'),
+        Cenario('GET /depositos/<id>', 'GET', lambda a, i: f"/api/depositos/{_ciclo(a['depositos'], i)}"),
+        Cenario('GET /depositos/mais-proximo', 'GET',
+                lambda a, i: f"/api/depositos/mais-proximo?lat={-23.5 + (i % 50) / 100}&lon={-46.6 + (i % 30) / 100}"),
+        Cenario('GET /depositos/<id>/clientes', 'GET',
+                lambda a, i: f"/api/depositos/{_ciclo(a['depositos'], i)}/clientes?raio_km=2"),
+        Cenario('GET /veiculos?limit=100', 'GET', lambda a, i: '/api/veiculos?limit=100'),
+        Cenario('GET /veiculos/<id>', 'GET', lambda a, i: f"/api/veiculos/{_ciclo(a['veiculos'], i)}"),
+        Cenario('GET /motoristas?limit=100', 'GET', lambda a, i: '/api/motoristas?limit=100'),
+        Cenario('GET /motoristas/<id>', 'GET', lambda a, i: f"/api/motoristas/{_ciclo(a['motoristas'], i)}"),
+        Cenario('GET /rotas?data_rota=', 'GET', lambda a, i: f"/api/rotas?data_rota={a['data']}"),
+        Cenario('GET /rotas/<id>', 'GET', lambda a, i: f"/api/rotas/{_ciclo(a['rotas'], i)}"),
+        Cenario('GET /rotas/<id>?include=', 'GET',
+                lambda a, i: f"/api/rotas/{_ciclo(a['rotas'], i)}?include=clientes,veiculo,motorista,depositos"),
+        Cenario('GET /entregas?limit=100', 'GET', lambda a, i: f"/api/entregas?limit=100&after={_ciclo(a['entregas'], i)}"),
+        Cenario('GET /entregas?rota_id=', 'GET', lambda a, i: f"/api/entregas?rota_id={_ciclo(a['rotas'], i)}"),
+        Cenario('GET /entregas/<id>', 'GET', lambda a, i: f"/api/entregas/{_ciclo(a['entregas'], i)}"),
+        Cenario('GET /entregas?desde=', 'GET', lambda a, i: f"/api/entregas?desde={a['token']}"),
+        Cenario('GET /estatisticas', 'GET', lambda a, i: f"/api/estatisticas?data={a['data']}"),
+        Cenario('GET /distancias', 'GET',
+                lambda a, i: f"/api/distancias?origem=cliente:{_ciclo(a['clientes'], i)}&destinos=depositos"),
+        Cenario('GET /cache/stats', 'GET', lambda a, i: '/api/cache/stats'),
+        Cenario('GET /metrics', 'GET', lambda a, i: '/api/metrics'),
+        Cenario('PUT /clientes/<id>', 'PUT', lambda a, i: f"/api/clientes/{a['cliente']['cliente_id']}",
+                lambda a, i: a['cliente']),
+        Cenario('PUT /depositos/<id>', 'PUT', lambda a, i: f"/api/depositos/{a['deposito']['deposito_id']}",
+                lambda a, i: a['deposito']),
+        Cenario('PUT /veiculos/<id>', 'PUT', lambda a, i: f"/api/veiculos/{a['veiculo']['veiculo_id']}",
+                lambda a, i: a['veiculo']),
+        Cenario('PUT /motoristas/<id>', 'PUT', lambda a, i: f"/api/motoristas/{a['motorista']['motorista_id']}",
+                lambda a, i: a['motorista']),
+        Cenario('PUT /rotas/<id>', 'PUT', lambda a, i: f"/api/rotas/{a['rota']['rota_id']}",
+                lambda a, i: a['rota']),
+        Cenario('PUT /entregas/<id>', 'PUT', lambda a, i: f"/api/entregas/{a['entrega']['entrega_id']}",
+                lambda a, i: a['entrega']),
+        Cenario('PATCH /rotas/<id>/entregas', 'PATCH', lambda a, i: f"/api/rotas/{a['rota']['rota_id']}/entregas",
+                lambda a, i: a['alteracoes']),
+        Cenario('POST /rotas/<id>/otimizar', 'POST', lambda a, i: f"/api/rotas/{a['rota']['rota_id']}/otimizar"),
+        Cenario('POST /entregas', 'POST', lambda a, i: '/api/entregas', lambda a, i: a['nova_entrega'], _guardar_id(alvos)),
+        Cenario('DELETE /entregas/<id>', 'DELETE', _proxima_criada),
+    ]
+
+
+def carregar_alvos(cliente):
+    """Ids de amostra (do meio de cada tabela) e objetos reais para as escritas."""
+    conexao = get_db_connection()
+    if conexao is None:
+        raise RuntimeError("Não foi possível conectar ao banco")
+    cur = conexao.cursor()
+    alvos = {'entregas_criadas': []}
+    for tabela, chave in (('clientes', 'cliente_id'), ('depositos', 'deposito_id'), ('veiculos', 'veiculo_id'),
+                          ('motoristas', 'motorista_id'), ('rotas', 'rota_id'), ('entregas', 'entrega_id')):
+        cur.execute(
+            f'SELECT {chave} FROM cadeiraextensao.{tabela} ORDER BY {chave} '
+            f'OFFSET (SELECT count(*) / 2 FROM cadeiraextensao.{tabela}) LIMIT %s;',
+            (AMOSTRAS,)
+        )
+        alvos[tabela] = [linha[0] for linha in cur.fetchall()]
+        if not alvos[tabela]:
+            raise RuntimeError(f"A tabela {tabela} está vazia: popule o banco (--semear)")
+    cur.execute(
+        'SELECT r.rota_id, r.data_rota FROM cadeiraextensao.rotas r '
+        'WHERE EXISTS (SELECT 1 FROM cadeiraextensao.entregas e WHERE e.rota_id = r.rota_id) '
+        'ORDER BY r.rota_id OFFSET (SELECT count(*) / 2 FROM cadeiraextensao.rotas) LIMIT 1;'
+    )
+    rota_id, data = cur.fetchone()
+    cur.execute('SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint;')
+    alvos['token'] = cur.fetchone()[0]
+    conexao.rollback()
+    conexao.close()
+
+    def obter(caminho):
+        status, corpo = cliente.requisitar('GET', caminho)
+        if status != 200:
+            raise RuntimeError(f"GET {caminho} respondeu {status}")
+        return json.loads(corpo)
+
+    alvos['data'] = data.isoformat()
+    alvos['cliente'] = obter(f"/api/clientes/{alvos['clientes'][0]}")
+    alvos['deposito'] = obter(f"/api/depositos/{alvos['depositos'][0]}")
+    alvos['veiculo'] = obter(f"/api/veiculos/{alvos['veiculos'][0]}")
+    alvos['motorista'] = obter(f"/api/motoristas/{alvos['motoristas'][0]}")
+    alvos['rota'] = obter(f'/api/rotas/{rota_id}')
+    entregas = alvos['rota'].pop('entregas')
+    alvos['entrega'] = entregas[0]
+    alvos['alteracoes'] = [{'entrega_id': e['entrega_id'], 'observacoes': e['observacoes']} for e in entregas]
+    alvos['nova_entrega'] = {'rota_id': rota_id, 'cliente_id': alvos['clientes'][0],
+                             'observacoes': 'teste de carga'}
+    return alvos
+
+
+# --- Medição ---
+
+def _percentil(ordenados, p):
+    return ordenados[min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))]
+
+
+def medir(cenario, cliente, alvos, clientes, requisicoes, pids):
+    """Roda o cenário e devolve o resumo das medições."""
+    def uma(i):
+        corpo = cenario.corpo(alvos, i) if cenario.corpo else None
+        inicio = time.perf_counter()
+        status, dados = cliente.requisitar(cenario.metodo, cenario.caminho(alvos, i), corpo)
+        duracao = time.perf_counter() - inicio
+        if cenario.apos and 200 <= status < 300:
+            cenario.apos(json.loads(dados))
+        return duracao, status
+
+    aquecimento = max(5, requisicoes // 20)
+    for i in range(aquecimento):
+        uma(i)
+
+    latencias, erros = [], []
+    contador = iter(range(aquecimento, aquecimento + requisicoes))
+    contador_lock = threading.Lock()
+
+    def trabalhar():
+        while True:
+            with contador_lock:
+                i = next(contador, None)
+            if i is None:
+                return
+            duracao, status = uma(i)
+            latencias.append(duracao)
+            if status >= 400 and not (cenario.metodo == 'DELETE' and status == 404):
+                erros.append(status)
+
+    threads = [threading.Thread(target=trabalhar) for _ in range(clientes)]
+    with AmostradorRSS(pids) as amostrador:
+        inicio = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        total = time.perf_counter() - inicio
+
+    ordenados = sorted(latencias)
+    return {
+        'requisicoes': len(latencias),
+        'erros': len(erros),
+        'p50_ms': _percentil(ordenados, 50) * 1000,
+        'p95_ms': _percentil(ordenados, 95) * 1000,
+        'p99_ms': _percentil(ordenados, 99) * 1000,
+        'media_ms': statistics.fmean(ordenados) * 1000,
+        'req_s': len(latencias) / total if total else 0.0,
+        'rss_pico_mb': amostrador.pico,
+    }
+
+
+def comparar(resultados, base, tolerancia, folga_ms):
+    """Lista de regressões `(endpoint, descrição)` em relação à `base`."""
+    regressoes = []
+    for nome, atual in resultados.items():
+        anterior = base.get(nome)
+        if anterior is None:
+            continue
+        limite_p95 = anterior['p95_ms'] * (1 + tolerancia)
+        if atual['p95_ms'] > limite_p95 and atual['p95_ms'] - anterior['p95_ms'] > folga_ms:
+            regressoes.append((nome, f"p95 {atual['p95_ms']:.2f}ms > base {anterior['p95_ms']:.2f}ms"))
+        if atual['req_s'] < anterior['req_s'] * (1 - tolerancia):
+            regressoes.append((nome, f"vazão {atual['req_s']:.0f}/s < base {anterior['req_s']:.0f}/s"))
+        if atual['erros'] > anterior['erros']:
+            regressoes.append((nome, f"{atual['erros']} erros (base: {anterior['erros']})"))
+    return regressoes
+
+
+def _imprimir(resultados):
+    print(f"{'endpoint':<34} {'n':>5} {'erros':>5} {'p50':>8} {'p95':>8} {'p99':>8} {'req/s':>8} {'RSS MB':>7}")
+    for nome, r in resultados.items():
+        rss = f"{r['rss_pico_mb']:7.1f}" if r['rss_pico_mb'] is not None else f"{'-':>7}"
+        print(f"{nome:<34} {r['requisicoes']:>5} {r['erros']:>5} {r['p50_ms']:>6.2f}ms {r['p95_ms']:>6.2f}ms "
+              f"{r['p99_ms']:>6.2f}ms {r['req_s']:>8.0f} {rss}")
+
+
+def executar(args):
+    if args.modo == 'gunicorn':
+        servidor = Gunicorn(args.workers)
+    else:
+        servidor = None
+
+    def rodar(cliente, pids):
+        alvos = carregar_alvos(cliente)
+        resultados = {}
+        for cenario in cenarios(alvos):
+            if args.filtro and args.filtro not in cenario.nome:
+                continue
+            resultados[cenario.nome] = medir(cenario, cliente, alvos, args.clientes, args.requisicoes, pids)
+            print('.', end='', flush=True)
+        print()
+        return resultados
+
+    if servidor is None:
+        from app import create_app
+        return rodar(ClienteApp(create_app()), [os.getpid()])
+    with servidor:
+        return rodar(ClienteHttp('127.0.0.1', servidor.porta), [servidor.processo.pid])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.load', description=__doc__.split('\n\n')[0])
+    parser.add_argument('--modo', choices=('app', 'gunicorn'), default='app')
+    parser.add_argument('--clientes', type=int, default=8, help='requisições simultâneas')
+    parser.add_argument('--requisicoes', type=int, default=200, help='requisições medidas por endpoint')
+    parser.add_argument('--workers', type=int, default=4, help='workers do gunicorn')
+    parser.add_argument('--banco-local', nargs='?', const='', default=None, metavar='DIR',
+                        help='usa um PostgreSQL descartável (em DIR, ou num diretório temporário)')
+    parser.add_argument('--semear', action='store_true', help='popula o banco se ele estiver vazio')
+    parser.add_argument('--escala', type=float, default=1.0)
+    parser.add_argument('--volume', nargs='*', default=[], metavar='TABELA=N')
+    parser.add_argument('--filtro', help='só os endpoints cujo nome contém este texto')
+    parser.add_argument('--salvar', metavar='ARQUIVO', help='grava os resultados como nova base')
+    parser.add_argument('--base', metavar='ARQUIVO', help='compara com uma base gravada')
+    parser.add_argument('--tolerancia', type=float, default=0.25)
+    parser.add_argument('--folga-ms', type=float, default=1.0)
+    args = parser.parse_args(argv)
+
+    try:
+        ajustes = parse_ajustes(args.volume)
+    except ValueError as e:
+        parser.error(f'--volume inválido: {e}')
+
+    if args.banco_local is not None:
+        with BancoLocal(args.banco_local or None):
+            preparar_banco(args.escala, ajustes, semear=True)
+            resultados = executar(args)
+    else:
+        if args.semear:
+            preparar_banco(args.escala, ajustes, semear=True)
+        resultados = executar(args)
+
+    _imprimir(resultados)
+    if args.salvar:
+        with open(args.salvar, 'w') as arquivo:
+            json.dump({'modo': args.modo, 'clientes': args.clientes, 'resultados': resultados},
+                      arquivo, indent=2, sort_keys=True)
+    if args.base:
+        with open(args.base) as arquivo:
+            base = json.load(arquivo)
+        if (base.get('modo'), base.get('clientes')) != (args.modo, args.clientes):
+            print(f"Aviso: a base foi medida com modo={base.get('modo')} e clientes={base.get('clientes')}")
+        regressoes = comparar(resultados, base['resultados'], args.tolerancia, args.folga_ms)
+        for nome, descricao in regressoes:
+            print(f'REGRESSÃO {nome}: {descricao}')
+        return 1 if regressoes else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
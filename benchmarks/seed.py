@@ -0,0 +1,161 @@
+"""
+Gerador de dados sintéticos para o schema `cadeiraextensao`, com volumes
+parecidos com os de produção (escala 1):
+
+    20 depósitos, 400 veículos, 400 motoristas, 100 mil clientes,
+    40 mil rotas em 180 dias e 600 mil entregas (1% pendentes sem rota,
+    1% excluídas).
+
+Tudo é gerado no próprio PostgreSQL com `generate_series`, de forma
+determinística (`setseed`). Só roda em tabelas vazias, para não misturar
+dados falsos com um banco de verdade.
+
+Uso (no banco configurado no .env, já migrado):
+    python -m benchmarks.seed [escala] [tabela=quantidade ...]
+
+ex: `python -m benchmarks.seed 1 clientes=50000 entregas=1000000`.
+"""
+import sys
+
+from app.db import get_db_connection
+from app.migrations import migrate
+
+VOLUMES = {
+    'depositos': 20,
+    'veiculos': 400,
+    'motoristas': 400,
+    'clientes': 100_000,
+    'rotas': 40_000,
+    'entregas': 600_000,
+}
+DIAS = 180
+
+SQL_SEED = """
+SELECT setseed(0.42);
+
+INSERT INTO cadeiraextensao.depositos
+    (nome_deposito, endereco_deposito, gps_latitude_deposito, gps_longitude_deposito)
+SELECT 'Depósito ' || i, 'Avenida ' || i || ', 1000', -23.9 + random() * 0.8, -46.9 + random() * 0.8
+FROM generate_series(1, %(depositos)s) AS i;
+
+INSERT INTO cadeiraextensao.clientes
+    (nome_cliente, endereco_cliente, gps_latitude_cliente, gps_longitude_cliente,
+     telefone_cliente, email_cliente)
+SELECT 'Cliente ' || i, 'Rua ' || i, -23.9 + random() * 0.8, -46.9 + random() * 0.8,
+       '11' || lpad(i::text, 9, '0'), 'cliente' || i || '@example.com'
+FROM generate_series(1, %(clientes)s) AS i;
+
+INSERT INTO cadeiraextensao.veiculos
+    (placa_veiculo, modelo_veiculo, ano_fabricacao, status_veiculo, deposito_id_base)
+SELECT 'SIM' || lpad(i::text, 7, '0'), 'Modelo ' || (i %% 5), 2015 + i %% 10,
+       CASE WHEN i %% 10 = 0 THEN 'Manutenção' ELSE 'Disponível' END,
+       d.ids[1 + i %% array_length(d.ids, 1)]
+FROM generate_series(1, %(veiculos)s) AS i,
+     (SELECT array_agg(deposito_id ORDER BY deposito_id) AS ids FROM cadeiraextensao.depositos) AS d;
+
+INSERT INTO cadeiraextensao.motoristas (nome_motorista, cpf_motorista, cnh_motorista, telefone_motorista)
+SELECT 'Motorista ' || i, lpad(i::text, 11, '0'), 'SIM' || lpad(i::text, 9, '0'),
+       '11' || lpad(i::text, 9, '0')
+FROM generate_series(1, %(motoristas)s) AS i;
+
+-- As rotas do mesmo dia (mesmo i %% dias) usam veículos e motoristas diferentes.
+INSERT INTO cadeiraextensao.rotas
+    (veiculo_id, motorista_id, deposito_partida_id, deposito_chegada_id, data_rota,
+     horario_saida_previsto, horario_chegada_previsto, status_rota)
+SELECT v.ids[1 + (i / %(dias)s) %% array_length(v.ids, 1)],
+       m.ids[1 + (i / %(dias)s) %% array_length(m.ids, 1)],
+       d.ids[1 + i %% array_length(d.ids, 1)], d.ids[1 + i %% array_length(d.ids, 1)],
+       current_date - (i %% %(dias)s), time '07:00', time '18:00',
+       CASE WHEN i %% %(dias)s = 0 THEN 'Planejada' ELSE 'Concluída' END
+FROM generate_series(1, %(rotas)s) AS i,
+     (SELECT array_agg(veiculo_id ORDER BY veiculo_id) AS ids FROM cadeiraextensao.veiculos) AS v,
+     (SELECT array_agg(motorista_id ORDER BY motorista_id) AS ids FROM cadeiraextensao.motoristas) AS m,
+     (SELECT array_agg(deposito_id ORDER BY deposito_id) AS ids FROM cadeiraextensao.depositos) AS d;
+
+-- A k-ésima rota (em ordem de id) tem data current_date - (k %% dias).
+INSERT INTO cadeiraextensao.entregas
+    (rota_id, cliente_id, sequencia_na_rota, status_entrega,
+     data_hora_prevista_entrega, data_hora_real_entrega, observacoes)
+SELECT CASE WHEN i %% 100 = 0 THEN NULL ELSE r.ids[k] END,
+       c.ids[1 + floor(random() * array_length(c.ids, 1))::int],
+       CASE WHEN i %% 100 = 0 THEN NULL ELSE (i - 1) / array_length(r.ids, 1) + 1 END,
+       CASE WHEN i %% 100 = 0 OR k %% %(dias)s = 0 THEN 'Pendente' ELSE 'Entregue' END,
+       prevista,
+       CASE WHEN i %% 100 = 0 OR k %% %(dias)s = 0 THEN NULL
+            ELSE prevista + (random() * 120 - 90) * interval '1 minute' END,
+       CASE WHEN i %% 7 = 0 THEN 'Deixar na portaria' END
+FROM generate_series(1, %(entregas)s) AS i,
+     (SELECT array_agg(rota_id ORDER BY rota_id) AS ids FROM cadeiraextensao.rotas) AS r,
+     (SELECT array_agg(cliente_id ORDER BY cliente_id) AS ids FROM cadeiraextensao.clientes) AS c,
+     LATERAL (SELECT 1 + (i - 1) %% array_length(r.ids, 1) AS k) AS pos,
+     LATERAL (SELECT (current_date - (k %% %(dias)s)) + time '08:00'
+                     + (random() * 600) * interval '1 minute' AS prevista) AS hora;
+
+-- Algumas exclusões, para a tabela de lápides da sincronização ter volume.
+DELETE FROM cadeiraextensao.entregas WHERE entrega_id %% 97 = 0;
+"""
+
+
+def volumes(escala=1.0, ajustes=None):
+    """
+    Quantidade de linhas de cada tabela na `escala` pedida; `ajustes`
+    (`{tabela: quantidade}`) fixa o volume de tabelas específicas.
+    """
+    gerados = {tabela: max(1, int(n * escala)) for tabela, n in VOLUMES.items()}
+    for tabela, quantidade in (ajustes or {}).items():
+        if tabela not in VOLUMES:
+            raise ValueError(f"Tabela desconhecida: {tabela}")
+        gerados[tabela] = max(1, int(quantidade))
+    return gerados
+
+
+def parse_ajustes(argumentos):
+    """Converte argumentos `tabela=quantidade` no dicionário de `ajustes`."""
+    ajustes = {}
+    for argumento in argumentos:
+        tabela, _, quantidade = argumento.partition('=')
+        ajustes[tabela] = int(quantidade)
+    return ajustes
+
+
+def seed(conn, escala=1.0, ajustes=None):
+    """
+    Popula as tabelas (que precisam estar vazias) e roda `ANALYZE`.
+    Devolve os volumes gerados.
+    """
+    cur = conn.cursor()
+    for tabela in VOLUMES:
+        cur.execute(f'SELECT EXISTS (SELECT 1 FROM cadeiraextensao.{tabela});')
+        if cur.fetchone()[0]:
+            cur.close()
+            raise RuntimeError(f"A tabela {tabela} já tem dados; use um banco vazio para os dados sintéticos")
+    gerados = volumes(escala, ajustes)
+    cur.execute(SQL_SEED, dict(gerados, dias=DIAS))
+    conn.commit()
+    conn.autocommit = True
+    cur.execute('ANALYZE;')
+    conn.autocommit = False
+    cur.close()
+    return gerados
+
+
+if __name__ == '__main__':
+    escala = float(sys.argv[1]) if len(sys.argv) > 1 else 1.0
+    try:
+        ajustes = parse_ajustes(sys.argv[2:])
+        volumes(escala, ajustes)
+    except ValueError as e:
+        print(f"Argumento inválido: {e}")
+        sys.exit(2)
+    conexao = get_db_connection()
+    if conexao is None:
+        sys.exit(1)
+    try:
+        migrate(conexao)
+        for tabela, quantidade in seed(conexao, escala, ajustes).items():
+            print(f'{tabela:<12} {quantidade:>9}')
+    except RuntimeError as e:
+        print(e)
+        sys.exit(1)
+    finally:
+        conexao.close()
@@ -0,0 +1,32 @@
+"""
+Configuração do gunicorn, lida automaticamente por `gunicorn run:app`
+quando ele é iniciado na raiz do projeto.
+
+Os workers são gevent: cada requisição roda numa greenlet, então uma
+conexão SSE aberta (`/api/rotas/<id>/eventos`, `/api/entregas/eventos`)
+custa uma greenlet parada esperando evento, não uma thread nem um worker
+inteiro. O `psycogreen` faz as consultas do psycopg2 cederem a vez às outras
+greenlets enquanto esperam o banco.
+
+Variáveis de ambiente:
+
+* `GUNICORN_WORKER_CLASS` (padrão `gevent`): `sync` volta ao worker de uma
+  requisição por vez, sem SSE de longa duração;
+* `GUNICORN_WORKER_CONNECTIONS` (padrão 5000): conexões simultâneas por
+  worker gevent, contando as SSE;
+* `GUNICORN_TIMEOUT` (padrão 30): segundos sem sinal de vida até o worker
+  ser reiniciado (no gevent, só trava de verdade o derruba).
+"""
+import os
+
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gevent')
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', '5000'))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '30'))
+
+
+def post_worker_init(worker):
+    # Depois do monkey patching do worker gevent (vale também para `-k gevent`
+    # na linha de comando, que tem precedência sobre este arquivo).
+    if type(worker).__module__ == 'gunicorn.workers.ggevent':
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
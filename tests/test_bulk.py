@@ -0,0 +1,43 @@
+from app.bulk import CAMPOS_CLIENTES, CAMPOS_ENTREGAS, check_references, validate_rows
+from app.resources import CLIENTES, ENTREGAS
+
+
+class FakeCursor:
+    """Cursor que responde às conferências de referência com os ids em `existentes`."""
+
+    def __init__(self, existentes):
+        self.existentes = existentes
+        self._resultado = []
+
+    def execute(self, sql, params):
+        tabela = sql.split('cadeiraextensao.')[1].split()[0]
+        self._resultado = [(i,) for i in params[0] if i in self.existentes[tabela]]
+
+    def fetchall(self):
+        return self._resultado
+
+
+def test_entrega_sem_rota_e_aceita():
+    linhas = [{'cliente_id': 1}, {'cliente_id': 2, 'rota_id': None}, {'cliente_id': 3, 'rota_id': 7}]
+    valores, erros = validate_rows(linhas, CAMPOS_ENTREGAS)
+    assert erros == {}
+    assert [v[:2] for v in valores] == [(None, 1), (None, 2), (7, 3)]
+    assert all(v[3] == 'Pendente' for v in valores)
+
+    check_references(FakeCursor({'rotas': {7}, 'clientes': {1, 2, 3}}), CAMPOS_ENTREGAS, valores, erros)
+    assert erros == {} and None not in valores
+
+
+def test_rota_inexistente_continua_sendo_erro():
+    valores, erros = validate_rows([{'cliente_id': 1, 'rota_id': 99}, {'rota_id': 7}], CAMPOS_ENTREGAS)
+    assert erros == {1: ['cliente_id: obrigatório']}
+    check_references(FakeCursor({'rotas': {7}, 'clientes': {1}}), CAMPOS_ENTREGAS, valores, erros)
+    assert erros == {0: ['rota_id: 99 não existe'], 1: ['cliente_id: obrigatório']}
+    assert valores == [None, None]
+
+
+def test_campos_vem_das_colunas_dos_recursos():
+    for recurso, campos in ((CLIENTES, CAMPOS_CLIENTES), (ENTREGAS, CAMPOS_ENTREGAS)):
+        assert [(c.nome, c.obrigatorio, c.padrao, c.referencia) for c in campos] == [
+            (c.nome, c.obrigatoria, c.padrao, c.referencia) for c in recurso.gravaveis
+        ]
@@ -0,0 +1,90 @@
+import pytest
+
+from app import cache, versions
+from app.cache import EntityCache, LRUCache
+
+
+@pytest.fixture
+def versoes(tmp_path, monkeypatch):
+    """Contadores de versão num diretório só do teste, como os de todos os workers."""
+    compartilhadas = versions.TableVersions(str(tmp_path / 'versoes'))
+    monkeypatch.setattr(versions, '_versoes', compartilhadas)
+    return compartilhadas
+
+
+def _worker():
+    """O cache de um worker: LRU próprio, geração compartilhada."""
+    return EntityCache(LRUCache(ttl=3600), geracao=cache._geracao_compartilhada)
+
+
+def test_escrita_em_um_worker_invalida_o_cache_do_outro(versoes):
+    banco = {'nome': 'Depósito Centro'}
+    a, b = _worker(), _worker()
+
+    assert a.read_through('depositos', 1, lambda: dict(banco)) == {'nome': 'Depósito Centro'}
+    assert b.read_through('depositos', 1, lambda: dict(banco)) == {'nome': 'Depósito Centro'}
+
+    # O worker B atende a escrita: grava no banco e registra a escrita.
+    banco['nome'] = 'Depósito Norte'
+    b.invalidate('depositos')
+    versions.bump('depositos')
+
+    assert a.read_through('depositos', 1, lambda: dict(banco)) == {'nome': 'Depósito Norte'}
+    assert a.stats()['misses'] == 2
+
+
+def test_escrita_em_outra_tabela_nao_invalida(versoes):
+    a = _worker()
+    carregamentos = []
+
+    def carregar():
+        carregamentos.append(1)
+        return {'id': 1}
+
+    a.read_through('depositos', 1, carregar)
+    versions.bump('veiculos')
+    a.read_through('depositos', 1, carregar)
+    assert len(carregamentos) == 1
+    assert a.stats()['hits'] == 1
+
+
+def test_leitura_durante_a_escrita_grava_na_geracao_antiga(versoes):
+    a = _worker()
+
+    def carregar_e_escrever():
+        # A escrita termina enquanto a leitura ainda carregava o valor antigo.
+        versions.bump('depositos')
+        return {'nome': 'antigo'}
+
+    assert a.read_through('depositos', 1, carregar_e_escrever) == {'nome': 'antigo'}
+    assert a.read_through('depositos', 1, lambda: {'nome': 'novo'}) == {'nome': 'novo'}
+
+
+def test_geracao_do_backend_sem_versoes():
+    local = EntityCache(LRUCache(ttl=3600))
+    local.read_through('motoristas', 1, lambda: {'id': 1})
+    local.invalidate('motoristas')
+    assert local.read_through('motoristas', 1, lambda: {'id': 2}) == {'id': 2}
+
+
+def test_falha_nas_versoes_vai_direto_ao_banco(versoes, monkeypatch):
+    def falhar(tabelas):
+        raise OSError('disco cheio')
+
+    monkeypatch.setattr(versions, 'snapshot', falhar)
+    a = _worker()
+    assert a.read_through('depositos', 1, lambda: {'id': 1}) == {'id': 1}
+    assert a.stats()['errors'] == 1
+
+
+def test_lru_limite_e_ttl():
+    lru = LRUCache(maxsize=2, ttl=3600)
+    lru.set('a', 1)
+    lru.set('b', 2)
+    lru.get('a')
+    lru.set('c', 3)
+    assert (lru.get('a'), lru.get('b'), lru.get('c')) == (1, None, 3)
+    assert lru.evictions == 1
+    lru.set('d', 4, ttl=-1)
+    assert lru.get('d') is None
+    assert lru.expirations == 1
@@ -0,0 +1,38 @@
+import pytest
+
+from app import create_app, versions
+from app.pagination import FILTROS_ENTREGAS, tables_for_filters
+
+
+@pytest.fixture
+def cliente(tmp_path, monkeypatch):
+    monkeypatch.setattr(versions, '_versoes', versions.TableVersions(str(tmp_path / 'versoes')))
+    return create_app().test_client()
+
+
+def _etag(cliente, caminho):
+    # `If-None-Match: *` responde 304 sem ir ao banco, já com o ETag atual.
+    resposta = cliente.get(caminho, headers={'If-None-Match': '*'})
+    assert resposta.status_code == 304
+    return resposta.headers['ETag']
+
+
+def test_tabelas_dos_filtros_presentes():
+    assert tables_for_filters(FILTROS_ENTREGAS, {'status_entrega': 'Pendente'}) == []
+    assert tables_for_filters(FILTROS_ENTREGAS, {'data_rota': '2024-05-20', 'data_rota_ate': ''}) == ['rotas']
+
+
+@pytest.mark.parametrize('filtro', ['data_rota=2024-05-20', 'data_rota_de=2024-05-01', 'data_rota_ate=2024-05-31'])
+def test_entregas_por_data_mudam_com_as_rotas(cliente, filtro):
+    caminho = f'/api/entregas?{filtro}'
+    antes = _etag(cliente, caminho)
+    versions.bump('rotas')
+    assert _etag(cliente, caminho) != antes
+
+
+def test_entregas_sem_filtro_de_data_ignoram_as_rotas(cliente):
+    antes = _etag(cliente, '/api/entregas?status_entrega=Pendente')
+    versions.bump('rotas')
+    assert _etag(cliente, '/api/entregas?status_entrega=Pendente') == antes
+    versions.bump('entregas')
+    assert _etag(cliente, '/api/entregas?status_entrega=Pendente') != antes
@@ -0,0 +1,207 @@
+import threading
+import time
+
+import psycopg2
+import pytest
+from psycopg2 import extensions
+
+from app.db import ConnectionPool, DatabaseConnectionError
+
+
+class _Info:
+    transaction_status = extensions.TRANSACTION_STATUS_IDLE
+
+
+class _Cursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *erro):
+        return False
+
+    def execute(self, sql, vars=None):
+        if self.conn.morta:
+            raise psycopg2.OperationalError('conexão perdida')
+
+
+class FakeConnection:
+    """Conexão falsa: só o que o pool usa."""
+
+    def __init__(self, numero):
+        self.numero = numero
+        self.closed = 0
+        self.morta = False
+        self.rollbacks = 0
+        self.info = _Info()
+
+    def cursor(self):
+        return _Cursor(self)
+
+    def rollback(self):
+        self.rollbacks += 1
+        self.info.transaction_status = extensions.TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = 1
+
+
+class FakeConnect:
+    def __init__(self, falhar=False):
+        self.abertas = []
+        self.falhar = falhar
+
+    def __call__(self):
+        if self.falhar:
+            return None
+        conn = FakeConnection(len(self.abertas))
+        self.abertas.append(conn)
+        return conn
+
+
+def test_abre_minconn_na_criacao():
+    connect = FakeConnect()
+    pool = ConnectionPool(2, 4, connect=connect)
+    assert len(connect.abertas) == 2
+    assert pool.stats()['idle'] == 2
+
+
+def test_tamanhos_invalidos():
+    with pytest.raises(ValueError):
+        ConnectionPool(3, 2, connect=FakeConnect())
+    with pytest.raises(ValueError):
+        ConnectionPool(0, 0, connect=FakeConnect())
+
+
+def test_checkout_reusa_a_conexao_devolvida():
+    connect = FakeConnect()
+    pool = ConnectionPool(0, 2, connect=connect)
+    conn = pool.getconn()
+    pool.putconn(conn)
+    assert pool.getconn() is conn
+    assert len(connect.abertas) == 1
+    assert pool.stats()['checkouts'] == 2
+
+
+def test_abre_sob_demanda_ate_maxconn_e_depois_esgota():
+    connect = FakeConnect()
+    pool = ConnectionPool(0, 2, timeout=0.05, connect=connect)
+    a, b = pool.getconn(), pool.getconn()
+    assert a is not b
+    with pytest.raises(DatabaseConnectionError):
+        pool.getconn()
+    stats = pool.stats()
+    assert stats['in_use'] == 2
+    assert stats['timeouts'] == 1
+
+
+def test_espera_ate_uma_conexao_ser_devolvida():
+    pool = ConnectionPool(0, 1, timeout=5, connect=FakeConnect())
+    conn = pool.getconn()
+    recebida = []
+
+    def esperar():
+        recebida.append(pool.getconn())
+
+    thread = threading.Thread(target=esperar)
+    thread.start()
+    while pool.stats()['waiting'] == 0:
+        time.sleep(0.001)
+    pool.putconn(conn)
+    thread.join(5)
+    assert recebida == [conn]
+    assert pool.stats()['wait_time_max_s'] > 0
+
+
+def test_devolucao_desfaz_transacao_pendente():
+    pool = ConnectionPool(0, 1, connect=FakeConnect())
+    conn = pool.getconn()
+    conn.info.transaction_status = extensions.TRANSACTION_STATUS_INTRANS
+    pool.putconn(conn)
+    assert conn.rollbacks == 1
+    assert pool.getconn() is conn
+
+
+def test_close_descarta_a_conexao():
+    connect = FakeConnect()
+    pool = ConnectionPool(0, 1, connect=connect)
+    conn = pool.getconn()
+    pool.putconn(conn, close=True)
+    assert conn.closed
+    assert pool.stats()['discarded'] == 1
+    nova = pool.getconn()
+    assert nova is not conn
+    assert len(connect.abertas) == 2
+
+
+def test_conexao_fechada_no_pool_e_trocada():
+    connect = FakeConnect()
+    pool = ConnectionPool(1, 1, connect=connect)
+    connect.abertas[0].closed = 1
+    conn = pool.getconn()
+    assert conn is connect.abertas[1]
+    assert pool.stats()['in_use'] == 1
+
+
+def test_conexao_ociosa_morta_e_trocada():
+    connect = FakeConnect()
+    pool = ConnectionPool(1, 1, max_idle=0, connect=connect)
+    connect.abertas[0].morta = True
+    time.sleep(0.001)
+    conn = pool.getconn()
+    assert conn is connect.abertas[1]
+    assert connect.abertas[0].closed
+    assert pool.stats()['discarded'] == 1
+
+
+def test_conexao_ociosa_saudavel_e_mantida():
+    connect = FakeConnect()
+    pool = ConnectionPool(1, 1, max_idle=0, connect=connect)
+    time.sleep(0.001)
+    assert pool.getconn() is connect.abertas[0]
+
+
+def test_falha_ao_conectar_libera_a_vaga():
+    connect = FakeConnect(falhar=True)
+    pool = ConnectionPool(0, 1, timeout=0.05, connect=connect)
+    with pytest.raises(DatabaseConnectionError):
+        pool.getconn()
+    connect.falhar = False
+    assert pool.getconn() is connect.abertas[0]
+
+
+def test_pool_fechado_recusa_checkout():
+    connect = FakeConnect()
+    pool = ConnectionPool(1, 2, connect=connect)
+    conn = pool.getconn()
+    pool.closeall()
+    with pytest.raises(DatabaseConnectionError):
+        pool.getconn()
+    pool.putconn(conn)
+    assert conn.closed
+    assert pool.stats()['idle'] == 0
+
+
+def test_nunca_passa_de_maxconn_com_concorrencia():
+    connect = FakeConnect()
+    pool = ConnectionPool(0, 3, timeout=5, connect=connect)
+    maximo = []
+    lock = threading.Lock()
+
+    def trabalhar():
+        for _ in range(50):
+            conn = pool.getconn()
+            with lock:
+                maximo.append(pool.stats()['in_use'])
+            pool.putconn(conn)
+
+    threads = [threading.Thread(target=trabalhar) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert max(maximo) <= 3
+    assert len(connect.abertas) <= 3
+    assert pool.stats()['in_use'] == 0
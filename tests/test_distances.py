@@ -0,0 +1,91 @@
+import os
+
+import numpy as np
+import pytest
+
+from app.distances import CLIENTE, DEPOSITO, DistanceCache, haversine_matrix
+
+CLIENTES = [(1, -23.55, -46.63), (2, -23.60, -46.70), (3, -22.90, -47.06)]
+DEPOSITOS = [(10, -23.50, -46.60), (20, -23.00, -47.00)]
+
+
+@pytest.fixture
+def diretorio(tmp_path):
+    return str(tmp_path / 'distancias')
+
+
+def _construido(diretorio, **kwargs):
+    cache = DistanceCache(diretorio, **kwargs)
+    cache.build(CLIENTES, DEPOSITOS)
+    return cache
+
+
+def _esperado(cliente, deposito):
+    return haversine_matrix([cliente[1]], [cliente[2]], [deposito[1]], [deposito[2]])[0, 0]
+
+
+def test_distancias_da_matriz(diretorio):
+    cache = _construido(diretorio)
+    distancias = cache.distances((CLIENTE, 2), [(DEPOSITO, 10), (DEPOSITO, 20), (DEPOSITO, 99)])
+    assert distancias[:2] == pytest.approx([_esperado(CLIENTES[1], d) for d in DEPOSITOS], rel=1e-6)
+    assert np.isnan(distancias[2])
+
+
+def test_escrita_de_um_worker_aparece_no_outro(diretorio):
+    escritor = _construido(diretorio)
+    leitor = DistanceCache(diretorio)
+    assert np.isnan(leitor.distances((CLIENTE, 4), [(DEPOSITO, 10)])[0])
+
+    novo = (4, -23.70, -46.50)
+    escritor.upsert_clientes([novo])
+    escritor.upsert_deposito(30, -23.65, -46.55)
+    ids, _, _ = leitor.coordinates(CLIENTE)
+    assert sorted(ids.tolist()) == [1, 2, 3, 4]
+    assert leitor.distances((CLIENTE, 4), [(DEPOSITO, 10)])[0] == pytest.approx(_esperado(novo, DEPOSITOS[0]), rel=1e-6)
+    assert leitor.distances((DEPOSITO, 30), [(CLIENTE, 4)])[0] == pytest.approx(
+        _esperado(novo, (30, -23.65, -46.55)), rel=1e-6)
+
+    escritor.remove_cliente(4)
+    assert np.isnan(leitor.distances((CLIENTE, 4), [(DEPOSITO, 10)])[0])
+
+
+def test_crescer_troca_os_arquivos_para_os_outros_workers(diretorio):
+    escritor = _construido(diretorio)
+    leitor = DistanceCache(diretorio)
+    versao = leitor.version()
+    muitos = [(100 + i, -23.5 + i * 1e-4, -46.6) for i in range(3000)]
+    escritor.upsert_clientes(muitos)
+    assert leitor.version() != versao
+    ids, _, _ = leitor.coordinates(CLIENTE)
+    assert len(ids) == len(CLIENTES) + len(muitos)
+
+
+def test_arquivos_sumidos_sao_reconstruidos_na_leitura(diretorio):
+    chamadas = []
+
+    def carregar(cache):
+        chamadas.append(cache)
+        cache.build(CLIENTES, DEPOSITOS)
+
+    _construido(diretorio)
+    leitor = DistanceCache(diretorio, carregar=carregar)
+    leitor.version()
+    os.remove(os.path.join(diretorio, 'meta.npy'))
+    ids, _, _ = leitor.coordinates(CLIENTE)
+    assert sorted(ids.tolist()) == [1, 2, 3]
+    assert chamadas == [leitor]
+
+
+def test_arquivos_sumidos_sao_reconstruidos_na_escrita(diretorio):
+    cache = _construido(diretorio, carregar=lambda c: c.build(CLIENTES, DEPOSITOS))
+    os.remove(os.path.join(diretorio, 'meta.npy'))
+    cache.upsert_cliente(5, -23.0, -46.0)
+    ids, _, _ = cache.coordinates(CLIENTE)
+    assert sorted(ids.tolist()) == [1, 2, 3, 5]
+
+
+def test_sem_carregar_a_falta_dos_arquivos_aparece(diretorio):
+    cache = _construido(diretorio)
+    os.remove(os.path.join(diretorio, 'meta.npy'))
+    with pytest.raises(FileNotFoundError):
+        cache.version()
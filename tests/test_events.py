@@ -0,0 +1,49 @@
+import os
+
+import pytest
+
+from app import create_app, events
+
+
+@pytest.fixture
+def broadcaster(monkeypatch):
+    ouvinte = events.Broadcaster(limite=2, connect=None)
+    ouvinte._thread = object()  # sem a thread do LISTEN: não há banco
+    monkeypatch.setattr(events, '_broadcaster', ouvinte)
+    monkeypatch.setattr(events, '_broadcaster_pid', os.getpid())
+    return ouvinte
+
+
+@pytest.fixture
+def cliente():
+    return create_app().test_client()
+
+
+def test_unsubscribe_e_idempotente(broadcaster):
+    assinatura = broadcaster.subscribe(7)
+    broadcaster.unsubscribe(assinatura)
+    broadcaster.unsubscribe(assinatura)
+    assert broadcaster.stats()['assinaturas'] == 0
+
+
+def test_head_nao_deixa_assinatura_presa(broadcaster, cliente):
+    for _ in range(broadcaster.limite + 1):
+        with cliente.head('/api/entregas/eventos') as resposta:
+            assert resposta.status_code == 200
+        assert broadcaster.stats()['assinaturas'] == 0
+
+
+def test_cliente_que_cai_antes_do_primeiro_pedaco(broadcaster, cliente):
+    resposta = cliente.get('/api/entregas/eventos', buffered=False)
+    assert broadcaster.stats()['assinaturas'] == 1
+    resposta.close()
+    assert broadcaster.stats()['assinaturas'] == 0
+
+
+def test_stream_lido_e_fechado_cancela_uma_vez_so(broadcaster, cliente):
+    outra = broadcaster.subscribe()
+    resposta = cliente.get('/api/entregas/eventos', buffered=False)
+    assert next(resposta.response) == b'retry: 3000\n\n'
+    resposta.close()
+    assert broadcaster.stats()['assinaturas'] == 1
+    broadcaster.unsubscribe(outra)
@@ -0,0 +1,77 @@
+import time
+
+import pytest
+from flask import Flask, Response, jsonify
+
+from app import metrics
+
+
+@pytest.fixture
+def cliente(monkeypatch):
+    monkeypatch.setattr(metrics, '_talvez_gravar_retrato', lambda: None)
+    app = Flask(__name__)
+    metrics.init_app(app)
+
+    @app.route('/lista')
+    def lista():
+        return jsonify([1, 2, 3])
+
+    @app.route('/exportacao')
+    def exportacao():
+        def gerar():
+            for pedaco in ('[', '1', ']'):
+                # Como o stream_query: o lote lido do banco soma na medição.
+                time.sleep(0.02)
+                metrics.current().consulta += 0.02
+                metrics.current().linhas += 1
+                yield pedaco
+        return Response(gerar(), mimetype='application/json')
+
+    @app.route('/falha')
+    def falha():
+        raise RuntimeError('erro no handler')
+
+    return app.test_client()
+
+
+def _medidas(endpoint):
+    histogramas, requisicoes = metrics._somar_threads()
+    series = {nome: serie for (nome, ponto), serie in histogramas.items() if ponto == endpoint}
+    contagens = {status: n for (ponto, status), n in requisicoes.items() if ponto == endpoint}
+    return series, contagens
+
+
+def test_resposta_comum_mede_no_after_request(cliente):
+    antes, _ = _medidas('lista')
+    assert cliente.get('/lista').status_code == 200
+    depois, contagens = _medidas('lista')
+    total = depois['http_request_duration_seconds']
+    assert sum(total[:-1]) - sum(antes.get('http_request_duration_seconds', [0, 0])[:-1]) == 1
+    assert contagens[200] >= 1
+
+
+def test_streaming_mede_ate_o_fechamento(cliente):
+    antes, _ = _medidas('exportacao')
+    resposta = cliente.get('/exportacao', buffered=False)
+    # Cabeçalhos enviados, corpo ainda não gerado: nada registrado.
+    assert _medidas('exportacao')[0] == antes
+    assert resposta.get_data(as_text=True) == '[1]'
+    resposta.close()
+    series, contagens = _medidas('exportacao')
+    duracao = series['http_request_duration_seconds'][-1] - antes.get('http_request_duration_seconds', [0.0])[-1]
+    consulta = series['db_query_seconds'][-1] - antes.get('db_query_seconds', [0.0])[-1]
+    linhas = series['db_rows'][-1] - antes.get('db_rows', [0.0])[-1]
+    assert duracao >= 0.06
+    assert consulta == pytest.approx(0.06)
+    assert linhas == 3
+    assert contagens[200] >= 1
+    assert metrics.current() is None
+
+
+def test_excecao_no_handler_conta_500(cliente):
+    _, antes = _medidas('falha')
+    with cliente.get('/falha') as resposta:
+        assert resposta.status_code == 500
+    _, depois = _medidas('falha')
+    assert depois[500] - antes.get(500, 0) == 1
+    assert metrics.current() is None
@@ -0,0 +1,223 @@
+"""
+Planos de execução das consultas quentes da API.
+
+Roda `EXPLAIN` (sem executar) de cada consulta, montada pelos mesmos objetos
+que os handlers usam (`ListQuery`, `Recurso`, os prepared statements,
+`SyncQuery`, as constantes de SQL dos módulos), e falha se o plano tiver um
+`Seq Scan` numa tabela que aquela consulta precisa ler por índice. Pega um
+índice esquecido, ou uma consulta nova que não usa nenhum, antes do deploy.
+
+Os planos só fazem sentido com volumes realistas: use um banco de teste
+migrado e populado com `python -m benchmarks.seed`, configurado pelas
+variáveis `DB_*`. Sem `DB_NAME`, sem conexão ou com um banco vazio, os
+testes são pulados.
+"""
+import json
+import os
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from psycopg2 import sql
+from psycopg2.extras import execute_values
+
+from app import dashboard, includes, prepared, routes, write_queue
+from app.db import get_db_connection
+from app.migrations import migrate
+from app.resources import CLIENTES, ENTREGAS, ENTREGAS_DA_ROTA, ROTAS, _select_por_id
+from app.sync import SyncQuery
+
+MINIMO_DE_ENTREGAS = 10_000
+
+
+@pytest.fixture(scope='module')
+def conexao():
+    if not os.getenv('DB_NAME'):
+        pytest.skip('sem banco configurado (DB_NAME)')
+    conn = get_db_connection()
+    if conn is None:
+        pytest.skip('sem conexão com o banco')
+    try:
+        migrate(conn)
+        cur = conn.cursor()
+        cur.execute('SELECT count(*) FROM cadeiraextensao.entregas;')
+        if cur.fetchone()[0] < MINIMO_DE_ENTREGAS:
+            pytest.skip('banco sem volume; popule com `python -m benchmarks.seed`')
+        cur.close()
+        yield conn
+    finally:
+        conn.close()
+
+
+@pytest.fixture(scope='module')
+def p(conexao):
+    """Valores típicos (do meio das tabelas) para os parâmetros das consultas."""
+    cur = conexao.cursor()
+    cur.execute(
+        'SELECT rota_id, veiculo_id, motorista_id, data_rota FROM cadeiraextensao.rotas '
+        'ORDER BY rota_id OFFSET (SELECT count(*) / 2 FROM cadeiraextensao.rotas) LIMIT 1;'
+    )
+    rota_id, veiculo_id, motorista_id, data = cur.fetchone()
+    cur.execute(
+        'SELECT entrega_id, cliente_id FROM cadeiraextensao.entregas '
+        'ORDER BY entrega_id OFFSET (SELECT count(*) / 2 FROM cadeiraextensao.entregas) LIMIT 1;'
+    )
+    entrega_id, cliente_id = cur.fetchone()
+    cur.execute('SELECT entrega_id FROM cadeiraextensao.entregas WHERE rota_id = %s LIMIT 3;', (rota_id,))
+    entregas_da_rota = [linha[0] for linha in cur.fetchall()]
+    # Um token de sincronização recente: quase nada mudou desde ele.
+    cur.execute('SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint;')
+    versao = cur.fetchone()[0]
+    conexao.rollback()
+    cur.close()
+    return {
+        'rota_id': rota_id, 'veiculo_id': veiculo_id, 'motorista_id': motorista_id, 'data': data,
+        'rotas': list(range(rota_id, rota_id + 100)),
+        'entrega_id': entrega_id, 'cliente_id': cliente_id, 'entregas_da_rota': entregas_da_rota,
+        'versao': versao, 'agora': datetime.now(timezone.utc) - timedelta(minutes=5),
+    }
+
+
+def seq_scans(plano):
+    """Tabelas lidas por `Seq Scan` num plano `EXPLAIN (FORMAT JSON)`."""
+    tabelas = []
+    pendentes = [plano]
+    while pendentes:
+        no = pendentes.pop()
+        if no.get('Node Type') == 'Seq Scan':
+            tabelas.append(no.get('Relation Name'))
+        pendentes.extend(no.get('Plans', []))
+    return tabelas
+
+
+def _plano(resultado):
+    return (json.loads(resultado) if isinstance(resultado, str) else resultado)[0]['Plan']
+
+
+def _conferir(plano, proibidas):
+    ruins = sorted(set(seq_scans(plano)) & set(proibidas))
+    assert not ruins, f'Seq Scan em {", ".join(ruins)}:\n{json.dumps(plano, indent=2)}'
+
+
+def _lista(recurso, **args):
+    """`(sql, params)` da listagem paginada com os filtros `args`."""
+    consulta = recurso.list_query({'limit': '100', **{nome: str(valor) for nome, valor in args.items()}})
+    return consulta.sql, consulta.params
+
+
+def _sync(tabela, p, **args):
+    return SyncQuery(tabela, {'desde': str(p['versao']), **{nome: str(valor) for nome, valor in args.items()}})
+
+
+# (nome, função que recebe `p` e devolve `(sql, params)`, tabelas sem Seq Scan).
+CONSULTAS = [
+    ('GET /entregas?rota_id=', lambda p: _lista(ENTREGAS, rota_id=p['rota_id']), ('entregas',)),
+    ('GET /entregas?cliente_id=', lambda p: _lista(ENTREGAS, cliente_id=p['cliente_id']), ('entregas',)),
+    ('GET /entregas?after=', lambda p: _lista(ENTREGAS, after=p['entrega_id']), ('entregas',)),
+    ('GET /entregas?data_rota=', lambda p: _lista(ENTREGAS, data_rota=p['data']), ('entregas', 'rotas')),
+    ('GET /entregas?data_rota_de=&data_rota_ate=', lambda p: _lista(
+        ENTREGAS, data_rota_de=p['data'], data_rota_ate=p['data'] + timedelta(days=1)), ('entregas', 'rotas')),
+    ('GET /entregas?data_rota_de=', lambda p: _lista(
+        ENTREGAS, data_rota_de=p['data'] + timedelta(days=365)), ('entregas', 'rotas')),
+    ('GET /rotas?data_rota=', lambda p: _lista(ROTAS, data_rota=p['data']), ('rotas',)),
+    ('GET /rotas?data_rota_de=&data_rota_ate=', lambda p: _lista(
+        ROTAS, data_rota_de=p['data'], data_rota_ate=p['data'] + timedelta(days=1)), ('rotas',)),
+    ('GET /rotas?veiculo_id=', lambda p: _lista(ROTAS, veiculo_id=p['veiculo_id']), ('rotas',)),
+    ('GET /rotas?motorista_id=', lambda p: _lista(ROTAS, motorista_id=p['motorista_id']), ('rotas',)),
+    ('GET /clientes/<id>?fields=', lambda p: (
+        _select_por_id(CLIENTES.tabela, CLIENTES.chave, CLIENTES.fields({'fields': 'nome_cliente'})),
+        [p['cliente_id']]), ('clientes',)),
+    ('GET /entregas/<id>?fields=', lambda p: (
+        _select_por_id(ENTREGAS.tabela, ENTREGAS.chave, ENTREGAS.fields({'fields': 'rota_id'})),
+        [p['entrega_id']]), ('entregas',)),
+    ('GET /rotas?include=entregas', lambda p: (includes.SQL_ENTREGAS_DAS_ROTAS, [p['rotas']]), ('entregas',)),
+    ('GET /rotas?include=clientes', lambda p: (
+        includes.select_by_ids('clientes', 'cliente_id'),
+        [list(range(p['cliente_id'], p['cliente_id'] + 500))]), ('clientes',)),
+    ('GET /entregas?desde=', lambda p: _sync('entregas', p).sql_alteradas, ('entregas',)),
+    ('GET /entregas?desde=&rota_id=', lambda p: _sync('entregas', p, rota_id=p['rota_id']).sql_alteradas,
+     ('entregas',)),
+    ('GET /entregas?desde=&rota_id= (exclusões)',
+     lambda p: _sync('entregas', p, rota_id=p['rota_id']).sql_excluidas, ('exclusoes',)),
+    ('GET /entregas?desde=<instante>',
+     lambda p: SyncQuery('entregas', {'desde': p['agora'].isoformat()}).sql_alteradas, ('entregas',)),
+    ('GET /clientes?desde=', lambda p: _sync('clientes', p).sql_alteradas, ('clientes',)),
+    ('GET /rotas?desde=', lambda p: _sync('rotas', p).sql_alteradas, ('rotas',)),
+    ('GET /estatisticas', lambda p: (dashboard.SQL_ENTREGAS_DO_DIA, [p['data']]), ('estatisticas_entregas',)),
+    ('POST /rotas/<id>/otimizar', lambda p: (routes.SQL_PARADAS_DA_ROTA, [p['rota_id']]), ('entregas',)),
+    ('POST /rotas/planejar: entregas pendentes', lambda p: (routes.SQL_ENTREGAS_PENDENTES, None), ('entregas',)),
+    ('POST /rotas/planejar: veículos livres', lambda p: (routes.SQL_VEICULOS_LIVRES, [p['data']]), ('rotas',)),
+]
+
+# (nome, statement, parâmetros, tabelas sem Seq Scan). O plano conferido é o
+# genérico, o que o servidor passa a usar depois de algumas execuções.
+PREPARADOS = [
+    *[(f'{recurso.nome}: {statement.nome}', statement, lambda p, chave=recurso.chave: [p[chave]], (recurso.nome,))
+      for recurso in (CLIENTES, ROTAS, ENTREGAS)
+      for statement in (recurso.por_id, recurso.excluir)],
+    ('clientes: atualizar_cliente', CLIENTES.atualizar,
+     lambda p: [None] * (len(CLIENTES.atualizar.tipos) - 1) + [p['cliente_id']], ('clientes',)),
+    ('rotas: atualizar_rota', ROTAS.atualizar,
+     lambda p: [None] * (len(ROTAS.atualizar.tipos) - 1) + [p['rota_id']], ('rotas',)),
+    ('GET /rotas/<id>: entregas da rota', ENTREGAS_DA_ROTA, lambda p: [p['rota_id']], ('entregas',)),
+    ('rota_existe', prepared.ROTA_EXISTE, lambda p: [p['rota_id']], ('rotas',)),
+    ('PUT /entregas/<id>', prepared.ATUALIZAR_ENTREGA,
+     lambda p: ['Em Rota', 1, None, 'Em Rota', p['entrega_id']], ('entregas',)),
+    ('DELETE /rotas/<id>: entregas da rota', prepared.EXCLUIR_ENTREGAS_DA_ROTA, lambda p: [p['rota_id']], ('entregas',)),
+    ('DELETE /clientes/<id>: entregas do cliente', prepared.EXCLUIR_ENTREGAS_DO_CLIENTE,
+     lambda p: [p['cliente_id']], ('entregas',)),
+]
+
+# (nome, função que recebe `p` e devolve `(sql, linhas, template)` do execute_values).
+EM_LOTE = [
+    ('PATCH /rotas/<id>/entregas', lambda p: (
+        routes.SQL_PATCH_ENTREGAS.format(sql.Literal(p['rota_id'])),
+        [(i, 'Entregue', True, None, False, None, False) for i in p['entregas_da_rota']],
+        routes.TEMPLATE_PATCH_ENTREGA)),
+    ('escrita adiada de PUT /entregas/<id>', lambda p: (
+        write_queue.SQL_GRAVAR_LOTE,
+        [(i, 'Em Rota', 1, None, None) for i in p['entregas_da_rota']],
+        write_queue.TEMPLATE_LOTE)),
+]
+
+
+@pytest.mark.parametrize('nome, montar, proibidas', CONSULTAS, ids=[c[0] for c in CONSULTAS])
+def test_consulta_usa_indice(conexao, p, nome, montar, proibidas):
+    texto, params = montar(p)
+    cur = conexao.cursor()
+    try:
+        cur.execute('EXPLAIN (FORMAT JSON) ' + texto, params)
+        _conferir(_plano(cur.fetchone()[0]), proibidas)
+    finally:
+        conexao.rollback()
+        cur.close()
+
+
+@pytest.mark.parametrize('nome, statement, params, proibidas', PREPARADOS, ids=[c[0] for c in PREPARADOS])
+def test_prepared_statement_usa_indice(conexao, p, nome, statement, params, proibidas):
+    cur = conexao.cursor()
+    try:
+        cur.execute(statement._prepare)
+        cur.execute('SET LOCAL plan_cache_mode = force_generic_plan;')
+        cur.execute('EXPLAIN (FORMAT JSON) ' + statement._execute, params(p))
+        _conferir(_plano(cur.fetchone()[0]), proibidas)
+    finally:
+        conexao.rollback()
+        cur.execute('DEALLOCATE ALL;')
+        conexao.rollback()
+        cur.close()
+
+
+@pytest.mark.parametrize('nome, montar', EM_LOTE, ids=[c[0] for c in EM_LOTE])
+def test_update_em_lote_usa_indice(conexao, p, nome, montar):
+    texto, linhas, template = montar(p)
+    if isinstance(texto, str):
+        texto = sql.SQL(texto)
+    cur = conexao.cursor()
+    try:
+        [(resultado,)] = execute_values(
+            cur, sql.SQL('EXPLAIN (FORMAT JSON) ') + texto, linhas, template=template, fetch=True
+        )
+        _conferir(_plano(resultado), ('entregas',))
+    finally:
+        conexao.rollback()
+        cur.close()
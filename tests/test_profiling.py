@@ -0,0 +1,66 @@
+import os
+import subprocess
+import sys
+import textwrap
+import time
+
+from app import profiling
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _ocupar(segundos):
+    fim = time.perf_counter() + segundos
+    while time.perf_counter() < fim:
+        pass
+
+
+def test_amostra_as_pilhas_da_thread_da_requisicao():
+    amostrador = profiling._Amostrador(0.001)
+    amostrador.start()
+    _ocupar(0.1)
+    amostrador.parar()
+    assert amostrador.pilhas
+    assert all('test_profiling.py:_ocupar' in pilha for pilha in amostrador.pilhas)
+
+
+def test_amostra_a_greenlet_da_requisicao_com_monkey_patching():
+    # Em outro processo: o monkey patching não se desfaz.
+    script = textwrap.dedent('''
+        from gevent import monkey
+        monkey.patch_all()
+
+        import gevent, time
+        from app import profiling
+
+        def ocupar(segundos):
+            fim = time.perf_counter() + segundos
+            while time.perf_counter() < fim:
+                pass
+
+        def vizinha():
+            for _ in range(50):
+                ocupar(0.002)
+                gevent.sleep(0)
+
+        def requisicao():
+            amostrador = profiling._Amostrador(0.001)
+            amostrador.start()
+            ocupar(0.1)         # CPU, sem ceder a vez
+            gevent.sleep(0.05)  # parada, enquanto a vizinha roda
+            amostrador.parar()
+            return amostrador.pilhas
+
+        vizinha = gevent.spawn(vizinha)
+        pilhas = gevent.spawn(requisicao).get()
+        vizinha.join()
+        ocupada = sum(n for pilha, n in pilhas.items() if pilha.endswith('requisicao;<string>:ocupar'))
+        parada = sum(n for pilha, n in pilhas.items() if 'requisicao;' in pilha and 'sleep' in pilha)
+        outras = [pilha for pilha in pilhas if 'requisicao' not in pilha]
+        print(ocupada, parada, len(outras))
+    ''')
+    saida = subprocess.run([sys.executable, '-c', script], cwd=RAIZ, capture_output=True, text=True, timeout=60)
+    assert saida.returncode == 0, saida.stderr
+    ocupada, parada, outras = map(int, saida.stdout.split())
+    assert ocupada >= 5 and parada >= 5
+    assert outras == 0
@@ -0,0 +1,48 @@
+import pytest
+
+from app.errors import InvalidRequestBody
+from app.resources import ROTAS, VEICULOS
+
+
+def test_post_aplica_os_padroes():
+    valores = VEICULOS.values({'placa_veiculo': 'ABC1D23', 'modelo_veiculo': 'Baú', 'ano_fabricacao': 2020},
+                              VEICULOS.gravaveis)
+    assert valores == {
+        'placa_veiculo': 'ABC1D23', 'modelo_veiculo': 'Baú', 'ano_fabricacao': 2020,
+        'status_veiculo': 'Disponível', 'deposito_id_base': None,
+    }
+
+
+def test_put_deixa_as_opcionais_omitidas_de_fora():
+    valores = VEICULOS.values({'placa_veiculo': 'ABC1D23', 'modelo_veiculo': 'Baú', 'ano_fabricacao': 2020,
+                               'deposito_id_base': None}, VEICULOS.atualizaveis, padroes=False)
+    assert 'status_veiculo' not in valores
+    # Obrigatórias direto; cada opcional com o indicador de "enviada".
+    assert VEICULOS.update_params(valores) == ['ABC1D23', 'Baú', 2020, False, None, True, None]
+
+
+def test_sql_do_put_so_troca_as_opcionais_enviadas():
+    assert VEICULOS.atualizar.sql == (
+        'UPDATE cadeiraextensao.veiculos SET placa_veiculo = %s, modelo_veiculo = %s, ano_fabricacao = %s, '
+        'status_veiculo = CASE WHEN %s THEN %s ELSE status_veiculo END, '
+        'deposito_id_base = CASE WHEN %s THEN %s ELSE deposito_id_base END WHERE veiculo_id = %s;'
+    )
+    assert VEICULOS.atualizar.tipos == ('varchar', 'varchar', 'integer', 'boolean', 'varchar', 'boolean', 'integer',
+                                        'integer')
+
+
+def test_put_nao_altera_colunas_so_de_criacao():
+    nomes = [coluna.nome for coluna in ROTAS.atualizaveis]
+    assert 'deposito_partida_id' not in nomes and 'versao' not in nomes
+    assert ROTAS.atualizar.sql.count('%s') == len(ROTAS.atualizar.tipos)
+
+
+@pytest.mark.parametrize('padroes', [True, False])
+def test_obrigatoria_ausente_e_400(padroes):
+    with pytest.raises(InvalidRequestBody, match='modelo_veiculo'):
+        VEICULOS.values({'placa_veiculo': 'ABC1D23', 'ano_fabricacao': 2020}, VEICULOS.atualizaveis, padroes)
+
+
+def test_corpo_que_nao_e_objeto():
+    with pytest.raises(InvalidRequestBody):
+        VEICULOS.values([1, 2], VEICULOS.gravaveis)
@@ -0,0 +1,94 @@
+from collections import namedtuple
+from datetime import date, datetime, time, timezone
+from decimal import Decimal
+
+from app.serialization import (
+    DATE, NUMERIC, TIME, TIMESTAMP, TIMESTAMPTZ, TIMETZ,
+    RowSerializer, fetch_all, fetch_one,
+)
+
+# OIDs de tipos que passam direto para o JSON.
+INTEGER = 23
+VARCHAR = 1043
+
+Coluna = namedtuple('Coluna', 'name type_code')
+
+DESCRIPTION = [
+    Coluna('id', INTEGER),
+    Coluna('nome', VARCHAR),
+    Coluna('latitude', NUMERIC),
+    Coluna('dia', DATE),
+    Coluna('hora', TIME),
+    Coluna('hora_tz', TIMETZ),
+    Coluna('previsto', TIMESTAMP),
+    Coluna('atualizado_em', TIMESTAMPTZ),
+]
+
+LINHAS = [
+    (1, 'Maria', Decimal('-23.550520'), date(2024, 5, 2), time(14, 30), time(8, 0, tzinfo=timezone.utc),
+     datetime(2024, 5, 2, 14, 30), datetime(2024, 5, 2, 17, 30, tzinfo=timezone.utc)),
+    (2, None, None, None, None, None, None, None),
+    (3, 'João', Decimal('0'), date(1999, 12, 31), time(0, 0), time(23, 59, tzinfo=timezone.utc),
+     datetime(2000, 1, 1), datetime(2000, 1, 1, tzinfo=timezone.utc)),
+]
+
+
+def ingenua(description, linha):
+    """A conversão óbvia, valor a valor."""
+    def converter(valor):
+        if isinstance(valor, Decimal):
+            return float(valor)
+        if isinstance(valor, (date, time, datetime)):
+            return valor.isoformat()
+        return valor
+    return {desc.name: converter(valor) for desc, valor in zip(description, linha)}
+
+
+class FakeCursor:
+    def __init__(self, description, linhas):
+        self.description = description
+        self._linhas = list(linhas)
+
+    def fetchall(self):
+        linhas, self._linhas = self._linhas, []
+        return linhas
+
+    def fetchone(self):
+        return self._linhas.pop(0) if self._linhas else None
+
+
+def test_rows_igual_a_conversao_ingenua():
+    esperado = [ingenua(DESCRIPTION, linha) for linha in LINHAS]
+    assert RowSerializer(DESCRIPTION).rows(LINHAS) == esperado
+
+
+def test_tipos_convertidos():
+    dados = RowSerializer(DESCRIPTION).row(LINHAS[0])
+    assert dados['latitude'] == -23.55052 and isinstance(dados['latitude'], float)
+    assert dados['dia'] == '2024-05-02'
+    assert dados['previsto'] == '2024-05-02T14:30:00'
+    assert dados['atualizado_em'] == '2024-05-02T17:30:00+00:00'
+
+
+def test_nulos_continuam_nulos():
+    dados = RowSerializer(DESCRIPTION).row(LINHAS[1])
+    assert dados == {desc.name: (2 if desc.name == 'id' else None) for desc in DESCRIPTION}
+
+
+def test_ordem_das_colunas_preservada():
+    assert list(RowSerializer(DESCRIPTION).row(LINHAS[0])) == [desc.name for desc in DESCRIPTION]
+
+
+def test_sem_colunas_convertidas():
+    description = [Coluna('id', INTEGER), Coluna('nome', VARCHAR)]
+    assert RowSerializer(description).rows([(1, 'a'), (2, None)]) == [
+        {'id': 1, 'nome': 'a'}, {'id': 2, 'nome': None},
+    ]
+
+
+def test_fetch_all_e_fetch_one():
+    cur = FakeCursor(DESCRIPTION, LINHAS)
+    assert fetch_one(cur) == ingenua(DESCRIPTION, LINHAS[0])
+    assert fetch_all(cur) == [ingenua(DESCRIPTION, linha) for linha in LINHAS[1:]]
+    assert fetch_one(cur) is None
+    assert fetch_all(cur) == []
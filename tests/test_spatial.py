@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+from app.spatial import GridIndex
+from app.tsp import haversine_km
+
+
+def _pontos(seed, n, centro=(-23.55, -46.63), espalhamento=0.5):
+    r = np.random.default_rng(seed)
+    lat = centro[0] + r.uniform(-espalhamento, espalhamento, n)
+    lon = centro[1] + r.uniform(-espalhamento, espalhamento, n)
+    return np.arange(1, n + 1, dtype=np.int64), lat, lon
+
+
+def _varredura(ids, lat, lon, alvo_lat, alvo_lon):
+    """Distância de cada ponto válido, pela força bruta."""
+    return {
+        int(i): haversine_km(alvo_lat, alvo_lon, float(a), float(b))
+        for i, a, b in zip(ids, lat, lon) if not (np.isnan(a) or np.isnan(b))
+    }
+
+
+@pytest.mark.parametrize('celula_km', [0.5, 2.0, 25.0])
+@pytest.mark.parametrize('raio_km', [0.0, 1.0, 5.0, 30.0, 500.0])
+def test_within_igual_a_varredura(celula_km, raio_km):
+    ids, lat, lon = _pontos(1, 2000)
+    indice = GridIndex(ids, lat, lon, celula_km)
+    for alvo_lat, alvo_lon in [(-23.55, -46.63), (-23.1, -46.2), (-24.5, -47.5), (float(lat[10]), float(lon[10]))]:
+        encontrados, distancias = indice.within(alvo_lat, alvo_lon, raio_km)
+        esperado = {i: d for i, d in _varredura(ids, lat, lon, alvo_lat, alvo_lon).items() if d <= raio_km}
+        assert set(encontrados.tolist()) == set(esperado)
+        assert np.all(np.diff(distancias) >= 0)
+        for i, d in zip(encontrados.tolist(), distancias.tolist()):
+            assert d == pytest.approx(esperado[i], abs=1e-6)
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_nearest_igual_a_varredura(seed):
+    ids, lat, lon = _pontos(seed, 50, espalhamento=2.0)
+    indice = GridIndex(ids, lat, lon, 2.0)
+    r = np.random.default_rng(100 + seed)
+    for alvo_lat, alvo_lon in zip(r.uniform(-30, -18, 20), r.uniform(-52, -40, 20)):
+        distancias = _varredura(ids, lat, lon, alvo_lat, alvo_lon)
+        menor = min(distancias.values())
+        encontrado, distancia = indice.nearest(alvo_lat, alvo_lon)
+        assert distancia == pytest.approx(menor, abs=1e-6)
+        assert distancias[encontrado] == pytest.approx(menor, abs=1e-6)
+
+
+def test_nearest_longe_de_todos():
+    ids, lat, lon = _pontos(3, 5)
+    indice = GridIndex(ids, lat, lon, 1.0)
+    distancias = _varredura(ids, lat, lon, 40.7, -74.0)  # do outro hemisfério
+    encontrado, distancia = indice.nearest(40.7, -74.0)
+    assert distancia == pytest.approx(min(distancias.values()), rel=1e-9)
+    assert distancias[encontrado] == pytest.approx(distancia)
+
+
+def test_pontos_sem_coordenadas_sao_ignorados():
+    ids, lat, lon = _pontos(4, 100)
+    lat[::3] = np.nan
+    lon[1::5] = np.nan
+    indice = GridIndex(ids, lat, lon, 2.0)
+    validos = _varredura(ids, lat, lon, -23.55, -46.63)
+    assert len(indice) == len(validos)
+    encontrados, _ = indice.within(-23.55, -46.63, 1000)
+    assert set(encontrados.tolist()) == set(validos)
+
+
+def test_indice_vazio():
+    vazio = np.empty(0)
+    indice = GridIndex(np.empty(0, dtype=np.int64), vazio, vazio)
+    assert len(indice) == 0
+    assert indice.nearest(-23.55, -46.63) == (None, None)
+    encontrados, distancias = indice.within(-23.55, -46.63, 10)
+    assert len(encontrados) == 0 and len(distancias) == 0
+
+
+def test_celulas_de_longitude_negativa_e_positiva():
+    # Pontos dos dois lados do meridiano de Greenwich e do equador.
+    lat = np.array([-0.001, 0.001, -0.001, 0.001])
+    lon = np.array([-0.001, -0.001, 0.001, 0.001])
+    ids = np.array([1, 2, 3, 4], dtype=np.int64)
+    indice = GridIndex(ids, lat, lon, 0.1)
+    encontrados, _ = indice.within(0.0, 0.0, 1.0)
+    assert sorted(encontrados.tolist()) == [1, 2, 3, 4]
@@ -0,0 +1,80 @@
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.pagination import InvalidQueryParameter
+from app.sync import SyncQuery
+
+INTEGER = 23  # OID do tipo integer no PostgreSQL
+SAO_PAULO = timezone(timedelta(hours=-3))
+Coluna = namedtuple('Coluna', 'name type_code')
+
+
+class FakeCursor:
+    """Cursor que guarda as consultas e responde xmin, o instante e as linhas."""
+
+    def __init__(self, linhas, xmin=900, fuso=SAO_PAULO):
+        self.linhas = linhas
+        self.xmin = xmin
+        self.fuso = fuso
+        self.consultas = []
+        self._resultado = None
+
+    def execute(self, sql, params=()):
+        self.consultas.append((sql, list(params)))
+        if 'pg_snapshot_xmin' in sql:
+            instante = params[0]
+            if instante is not None and instante.tzinfo is None:
+                instante = instante.replace(tzinfo=self.fuso)
+            self._resultado = [(self.xmin, instante)]
+        elif 'exclusoes' in sql:
+            self._resultado = []
+        else:
+            limite = int(sql.rsplit('LIMIT', 1)[1].strip(' ;'))
+            self._resultado = self.linhas[:limite]
+            self.description = [Coluna('versao', INTEGER), Coluna('entrega_id', INTEGER)]
+
+    def fetchone(self):
+        return self._resultado[0]
+
+    def fetchall(self):
+        return self._resultado
+
+
+def _pagina(desde, linhas, limit=2):
+    consulta = SyncQuery('entregas', {'desde': desde, 'limit': str(limit)}, 'versao, entrega_id')
+    cur = FakeCursor(linhas)
+    return consulta, cur, consulta.run(cur)
+
+
+def test_token_numerico_continua_pela_versao():
+    _, _, corpo = _pagina('100', [(150, 1), (160, 2), (170, 3)])
+    assert corpo['mais'] and corpo['token'] == '100.900.160.2'
+    consulta, cur, corpo = _pagina(corpo['token'], [(170, 3)])
+    assert (consulta.desde, consulta.instante, consulta.cursor) == (100, None, (160, 2))
+    sql, params = cur.consultas[0]
+    assert 'versao >= %s' in sql and params[:1] == [100]
+    assert corpo == {'alteradas': [{'versao': 170, 'entrega_id': 3}], 'excluidas': [], 'token': '900', 'mais': False}
+
+
+@pytest.mark.parametrize('desde', ['2024-05-02T10:00:00.250000-03:00', '2024-05-02T10:00:00.250000'])
+def test_continuacao_por_instante_mantem_o_instante(desde):
+    _, cur, corpo = _pagina(desde, [(150, 1), (160, 2), (170, 3)])
+    esperado = datetime(2024, 5, 2, 13, 0, 0, 250000, tzinfo=timezone.utc)
+    assert cur.consultas[1][1][0] == esperado
+    assert corpo['mais'] and corpo['token'].startswith('t') and corpo['token'].endswith('.900.160.2')
+
+    consulta, cur, _ = _pagina(corpo['token'], [(170, 3)])
+    assert consulta.instante == esperado
+    assert (consulta.desde, consulta.xmin, consulta.cursor) == (0, 900, (160, 2))
+    # Nada de xmin novo nem de `versao >= 0`: o filtro segue pelo instante.
+    [(sql, params)] = cur.consultas
+    assert 'atualizado_em >= %s' in sql and 'versao >= %s' not in sql
+    assert params == [esperado, 160, 2]
+
+
+@pytest.mark.parametrize('desde', ['abc', '1.2.3', 't1.2.3', 'tx.1.2.3', '1.2.3.4.5'])
+def test_token_invalido(desde):
+    with pytest.raises(InvalidQueryParameter):
+        SyncQuery('entregas', {'desde': desde})
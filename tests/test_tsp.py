@@ -0,0 +1,101 @@
+import itertools
+import random
+import time
+
+import pytest
+
+from app import tsp
+
+
+def _pontos(seed, n):
+    r = random.Random(seed)
+    return [(r.uniform(-23.7, -23.4), r.uniform(-46.8, -46.4)) for _ in range(n)]
+
+
+def _caso(seed):
+    """Matriz, extremos e paradas de um caso aleatório pequeno."""
+    n = random.Random(seed).randint(2, 7)
+    dist = tsp.distance_matrix(_pontos(seed, n + 2))
+    inicio = n
+    fim = n + 1 if seed % 2 else n  # alterna entre rota aberta e circular
+    return dist, inicio, fim, list(range(n))
+
+
+def _otimo(dist, inicio, fim, paradas):
+    return min(tsp.path_length(dist, [inicio, *ordem, fim]) for ordem in itertools.permutations(paradas))
+
+
+def _sem_prazo():
+    return time.monotonic() + 60
+
+
+def test_distance_matrix_simetrica_e_igual_ao_haversine():
+    pontos = _pontos(1, 6)
+    dist = tsp.distance_matrix(pontos)
+    for i, a in enumerate(pontos):
+        assert dist[i][i] == 0.0
+        for j, b in enumerate(pontos):
+            assert dist[i][j] == dist[j][i]
+            assert dist[i][j] == pytest.approx(tsp.haversine_km(*a, *b))
+
+
+@pytest.mark.parametrize('busca', [tsp._two_opt, tsp._or_opt])
+@pytest.mark.parametrize('seed', range(50))
+def test_busca_local_nunca_aumenta_o_caminho(busca, seed):
+    dist, inicio, fim, paradas = _caso(seed)
+    random.Random(seed).shuffle(paradas)
+    caminho = [inicio, *paradas, fim]
+    antes = tsp.path_length(dist, caminho)
+    melhorou = busca(dist, caminho, _sem_prazo())
+    depois = tsp.path_length(dist, caminho)
+    assert depois <= antes + 1e-9
+    if not melhorou:
+        assert caminho == [inicio, *paradas, fim]
+    # Mesmas paradas, extremos no lugar.
+    assert caminho[0] == inicio and caminho[-1] == fim
+    assert sorted(caminho[1:-1]) == sorted(paradas)
+
+
+@pytest.mark.parametrize('seed', range(200))
+def test_solve_path_perto_da_forca_bruta(seed):
+    dist, inicio, fim, paradas = _caso(seed)
+    ordem = tsp.solve_path(dist, inicio, fim, paradas, tempo_limite=5)
+    assert sorted(ordem) == paradas
+    comprimento = tsp.path_length(dist, [inicio, *ordem, fim])
+    otimo = _otimo(dist, inicio, fim, paradas)
+    assert comprimento >= otimo - 1e-9
+    assert comprimento <= otimo * 1.05
+    if len(paradas) <= 3:
+        assert comprimento == pytest.approx(otimo)
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_solve_path_nao_piora_o_vizinho_mais_proximo(seed):
+    r = random.Random(seed)
+    n = r.randint(10, 40)
+    dist = tsp.distance_matrix(_pontos(seed, n + 1))
+    paradas = list(range(n))
+    inicial = tsp._vizinho_mais_proximo(dist, n, n, paradas)
+    ordem = tsp.solve_path(dist, n, n, paradas, tempo_limite=5)
+    assert sorted(ordem) == paradas
+    assert tsp.path_length(dist, [n, *ordem, n]) <= tsp.path_length(dist, inicial) + 1e-9
+
+
+def test_solve_path_triviais():
+    dist = tsp.distance_matrix(_pontos(0, 3))
+    assert tsp.solve_path(dist, 1, 2, []) == []
+    assert tsp.solve_path(dist, 1, 2, [0]) == [0]
+
+
+@pytest.mark.parametrize('extremos', [(True, True), (True, False), (False, True), (False, False)])
+def test_sequence_stops_com_extremos_livres(extremos):
+    pontos = _pontos(7, 8)
+    paradas, deposito = pontos[:6], pontos[6]
+    partida = deposito if extremos[0] else None
+    chegada = pontos[7] if extremos[1] else None
+    ordem, distancia = tsp.sequence_stops(paradas, partida, chegada, tempo_limite=5)
+    assert sorted(ordem) == list(range(6))
+    assert distancia == pytest.approx(tsp.sequence_length(paradas, ordem, partida, chegada))
+    otimo = min(tsp.sequence_length(paradas, p, partida, chegada) for p in itertools.permutations(range(6)))
+    # Heurística: ótimo local, não necessariamente global.
+    assert otimo - 1e-9 <= distancia <= otimo * 1.10
@@ -0,0 +1,48 @@
+import os
+
+import pytest
+
+from app.versions import TableVersions
+
+
+@pytest.fixture
+def versoes(tmp_path):
+    return TableVersions(str(tmp_path / 'versoes'))
+
+
+def test_primeira_escrita_cria_o_arquivo(versoes):
+    # Sem nenhuma leitura antes: o bump cria o arquivo sob o próprio lock.
+    versoes.bump('entregas')
+    chave, _ = versoes.snapshot(['entregas'])
+    assert chave[1] == 1
+
+
+def test_escrita_muda_so_as_tabelas_escritas(versoes):
+    antes_entregas, _ = versoes.snapshot(['entregas'])
+    antes_clientes, _ = versoes.snapshot(['clientes'])
+    versoes.bump('entregas', 'rotas')
+    assert versoes.snapshot(['entregas'])[0] != antes_entregas
+    assert versoes.snapshot(['clientes'])[0] == antes_clientes
+
+
+def test_modificacao_estritamente_crescente(versoes):
+    modificacoes = []
+    for _ in range(3):
+        versoes.bump('clientes')
+        modificacoes.append(versoes.snapshot(['clientes'])[1])
+    assert modificacoes == sorted(set(modificacoes))
+
+
+def test_outro_worker_ve_a_escrita(versoes):
+    outro = TableVersions(versoes.diretorio)
+    antes, _ = outro.snapshot(['depositos'])
+    versoes.bump('depositos')
+    assert outro.snapshot(['depositos'])[0] != antes
+
+
+def test_arquivo_apagado_muda_a_epoca(versoes):
+    versoes.bump('clientes')
+    antes, _ = versoes.snapshot(['clientes'])
+    os.remove(os.path.join(versoes.diretorio, 'versoes.npy'))
+    depois, _ = versoes.snapshot(['clientes'])
+    assert depois[0] != antes[0]
@@ -0,0 +1,58 @@
+import os
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+from app import create_app, tsp, vrp
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_sequence_route_no_pool_igual_ao_calculo_local(monkeypatch):
+    monkeypatch.setenv('VRP_PROCESSES', '1')
+    paradas = [(-23.55, -46.63), (-23.60, -46.70), (-23.50, -46.60), (-23.58, -46.65)]
+    partida = chegada = (-23.56, -46.64)
+    assert vrp.sequence_route(paradas, partida, chegada, 0.2) == tsp.sequence_stops(paradas, partida, chegada, 0.2)
+
+
+def test_uma_chamada_so_nao_trava_as_greenlets():
+    # Em outro processo: o monkey patching não se desfaz.
+    script = textwrap.dedent('''
+        from gevent import monkey
+        monkey.patch_all()
+
+        import os, time
+        import gevent
+        from app import vrp
+
+        os.environ['VRP_PROCESSES'] = '1'
+        vrp._no_pool(time.sleep, [()], 0)  # sobe o pool antes de medir
+
+        batidas = []
+        def vizinha():
+            while True:
+                batidas.append(time.monotonic())
+                gevent.sleep(0.05)
+
+        gevent.spawn(vizinha)
+        gevent.sleep(0)
+        inicio = time.monotonic()
+        vrp._no_pool(time.sleep, [()], 1.0)  # time.sleep(1.0) no processo do pool
+        duracao = time.monotonic() - inicio
+        maior_intervalo = max(b - a for a, b in zip(batidas, batidas[1:]))
+        print(round(duracao, 2), round(maior_intervalo, 2))
+    ''')
+    saida = subprocess.run([sys.executable, '-c', script], cwd=RAIZ, capture_output=True, text=True, timeout=60)
+    assert saida.returncode == 0, saida.stderr
+    duracao, maior_intervalo = map(float, saida.stdout.split())
+    assert duracao >= 1.0
+    assert maior_intervalo < 0.5
+
+
+@pytest.mark.parametrize('data_rota', ['2024-13-45', 'amanhã', 20240520])
+def test_planejar_recusa_data_invalida(data_rota):
+    resposta = create_app().test_client().post('/api/rotas/planejar', json={'data_rota': data_rota})
+    assert resposta.status_code == 400
+    assert 'data_rota' in resposta.get_json()['error']
@@ -0,0 +1,125 @@
+import threading
+import time
+
+from app.write_queue import ENTREGUE, WriteQueue
+
+
+class Gravador:
+    """`gravar` falso: guarda os lotes e pode falhar as primeiras vezes."""
+
+    def __init__(self, falhas=0):
+        self.lotes = []
+        self.falhas = falhas
+        self.gravou = threading.Event()
+
+    def __call__(self, itens):
+        if self.falhas:
+            self.falhas -= 1
+            raise RuntimeError('banco fora do ar')
+        self.lotes.append([(entrega_id, p.status_entrega, p.sequencia_na_rota, p.observacoes, p.entregue_em)
+                           for entrega_id, p in itens])
+        self.gravou.set()
+
+
+def _fila(gravador, **kwargs):
+    # Sem o drain, a thread só grava por tamanho de lote ou depois de 1 h.
+    kwargs.setdefault('intervalo', 3600)
+    kwargs.setdefault('lote', 1000)
+    return WriteQueue(gravar=gravador, **kwargs)
+
+
+def test_agrupa_por_entrega_e_a_ultima_escrita_vence():
+    gravador = Gravador()
+    fila = _fila(gravador)
+    fila.submit(1, 'Pendente', 1, 'a')
+    fila.submit(1, 'Em Rota', 2, 'b')
+    fila.submit(1, 'Atrasada', 3, None)
+    assert fila.stats()['pendentes'] == 1
+    assert fila.drain(5)
+    assert gravador.lotes == [[(1, 'Atrasada', 3, None, None)]]
+    stats = fila.stats()
+    assert (stats['aceitas'], stats['agrupadas'], stats['gravadas'], stats['lotes']) == (3, 2, 1, 1)
+
+
+def test_preserva_o_horario_do_primeiro_entregue():
+    gravador = Gravador()
+    fila = _fila(gravador)
+    fila.submit(1, ENTREGUE, 1, None)
+    primeiro = fila._pendentes[1].entregue_em
+    time.sleep(0.002)
+    fila.submit(1, ENTREGUE, 1, 'de novo')
+    fila.submit(1, 'Em Rota', 1, 'corrigido')
+    fila.drain(5)
+    [[(_, status, _, observacoes, entregue_em)]] = gravador.lotes
+    assert (status, observacoes, entregue_em) == ('Em Rota', 'corrigido', primeiro)
+
+
+def test_grava_na_ordem_da_primeira_escrita_em_lotes():
+    gravador = Gravador()
+    fila = _fila(gravador, lote=2)
+    fila._iniciar = lambda: None  # sem thread: só o drain grava
+    for entrega_id in (5, 3, 9, 3, 1):
+        fila.submit(entrega_id, 'Em Rota', entrega_id, None)
+    fila.drain(5)
+    assert [[item[0] for item in lote] for lote in gravador.lotes] == [[5, 3], [9, 1]]
+
+
+def test_lote_cheio_acorda_a_thread():
+    gravador = Gravador()
+    fila = _fila(gravador, lote=3)
+    for entrega_id in range(3):
+        fila.submit(entrega_id, 'Em Rota', 1, None)
+    assert gravador.gravou.wait(5)
+    assert [item[0] for item in gravador.lotes[0]] == [0, 1, 2]
+    fila.drain(5)
+
+
+def test_grava_a_cada_intervalo():
+    gravador = Gravador()
+    fila = _fila(gravador, intervalo=0.01)
+    fila.submit(7, 'Em Rota', 1, None)
+    assert gravador.gravou.wait(5)
+    assert gravador.lotes == [[(7, 'Em Rota', 1, None, None)]]
+    fila.drain(5)
+
+
+def test_fila_cheia_recusa_so_entregas_novas():
+    fila = _fila(Gravador(), limite=2)
+    fila._iniciar = lambda: None
+    assert fila.submit(1, 'Em Rota', 1, None)
+    assert fila.submit(2, 'Em Rota', 1, None)
+    assert not fila.submit(3, 'Em Rota', 1, None)
+    # Uma entrega que já está na fila continua aceitando escritas.
+    assert fila.submit(1, 'Atrasada', 1, None)
+    stats = fila.stats()
+    assert (stats['pendentes'], stats['recusadas']) == (2, 1)
+
+
+def test_lote_que_falhou_volta_por_baixo_das_escritas_novas():
+    gravador = Gravador(falhas=1)
+    fila = _fila(gravador)
+    fila._iniciar = lambda: None
+    fila.submit(1, ENTREGUE, 1, 'antiga')
+    fila.submit(2, 'Em Rota', 1, None)
+    entregue_em = fila._pendentes[1].entregue_em
+    with fila._cond:
+        itens = fila._retirar_lote()
+    # Chega uma escrita nova da entrega 1 enquanto o lote está sendo gravado.
+    fila.submit(1, 'Em Rota', 4, 'nova')
+    fila.submit(3, 'Em Rota', 1, None)
+    assert not fila._gravar_com_contagem(itens)
+    assert fila.stats()['falhas'] == 1
+    assert list(fila._pendentes) == [1, 2, 3]
+    pendente = fila._pendentes[1]
+    assert (pendente.status_entrega, pendente.observacoes, pendente.entregue_em) == ('Em Rota', 'nova', entregue_em)
+    assert fila.drain(5)
+    assert [item[0] for item in gravador.lotes[0]] == [1, 2, 3]
+
+
+def test_drain_desiste_depois_do_timeout():
+    gravador = Gravador(falhas=10 ** 6)
+    fila = _fila(gravador)
+    fila._iniciar = lambda: None
+    fila.submit(1, 'Em Rota', 1, None)
+    assert not fila.drain(0.05)
+    assert fila.stats()['pendentes'] == 1